@@ -1,27 +1,46 @@
 import os
 import json
-from flask import Flask, jsonify, request
+import time
+from contextlib import nullcontext
+from flask import Flask, jsonify, request, Response, stream_with_context
 from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_openai import OpenAIEmbeddings
-from langchain_elasticsearch import ElasticsearchStore
+from langchain_core.runnables import RunnableLambda
 from sqlalchemy import text
 from typing import TypedDict, Annotated, List, Any
 import operator
 from dotenv import load_dotenv
-from psycopg_pool import ConnectionPool
-from langgraph.checkpoint.postgres import PostgresSaver
 
 # Importar herramientas
 from tools.registrar_solicitud import create_tool_registrar_solicitud
 from tools.consultar_estado import create_tool_consultar_estado
-from tools.actualizar_solicitud import create_tool_actualizar_solicitud
-from tools.busqueda_documental import create_tool_busqueda_documental
+from tools.listar_solicitudes import create_tool_listar_solicitudes, create_tool_resumen_solicitudes
+from tools.actualizar_solicitud import create_tool_actualizar_solicitud, create_tool_actualizar_solicitudes_masivo, actualizar_solicitudes_masivo
+from tools.busqueda_documental import create_tool_busqueda_documental, busqueda_documental_logica, abusqueda_documental_logica
+from tools.repositorio import RepositorioReembolsos, LimiteActualizacionExcedido, crear_pool, crear_cache_solicitudes
+
+from servicios import arranque, metricas, permisos
+from servicios.arranque import Arranque
+from servicios.registro_grafos import RegistroGrafos
+from servicios.enrutador import EnrutadorEscalonado, DOCUMENTACION, USUARIO_EXTERNO, AGENTE_ACCION, decidir_por_reglas
+from servicios.cache_embeddings import EmbeddingsConCache
+from servicios.streaming_sse import TraductorEventos, MODOS_STREAM, CABECERAS_SSE
+from servicios.historial import PoliticaHistorial, dividir_en_turnos
+from servicios.recuperacion_especulativa import RecuperacionEspeculativa
+from servicios.api_solicitudes import crear_api_solicitudes
+from servicios.salida_herramientas import SALIDAS
+from servicios.control_turnos import ControlTurnos, ConversacionOcupada
+from servicios.planificador_llm import (
+    PlanificadorLLM, ChatPlanificado, LLMSaturado, prioridad_llm, plazo_solicitud, PRIORIDAD_SUPERVISOR, PRIORIDAD_RESUMEN,
+)
+from servicios.checkpointer_coalescente import CheckpointerCoalescente, turno_checkpointer
+from servicios.mantenimiento_checkpoints import iniciar_mantenimiento_periodico, opciones_desde_entorno
 
 # Cargar variables de entorno
 #load_dotenv() 
@@ -36,181 +55,544 @@ ELASTIC_URL = os.environ.get("ELASTIC_URL")
 ELASTIC_USER = os.environ.get("ELASTIC_USER")
 ELASTIC_PASSWORD = os.environ.get("ELASTIC_PASSWORD")
 ELASTIC_INDEX = os.environ.get("ELASTIC_INDEX")
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "elasticsearch").lower()
+INDICE_LOCAL_RUTA = os.environ.get("INDICE_LOCAL_RUTA", "indice_local")
 
-# Configuración: Langsmith
-os.environ["LANGSMITH_ENDPOINT"] = os.environ.get("LANGSMITH_ENDPOINT", "https://api.smith.langchain.com")
-os.environ["LANGCHAIN_API_KEY"] = os.environ.get("LANGCHAIN_API_KEY")
-os.environ["LANGCHAIN_TRACING_V2"] = os.environ.get("LANGCHAIN_TRACING_V2", "true")
-os.environ["LANGCHAIN_PROJECT"] = os.environ.get("LANGCHAIN_PROJECT", "S09-eiagurp")
+# Configuración: Langsmith (TRAZAS_LANGSMITH=false la apaga, p. ej. en producción; sin LANGCHAIN_API_KEY no se activa)
+TRAZAS_LANGSMITH = os.environ.get("TRAZAS_LANGSMITH", "true").lower() == "true" and bool(os.environ.get("LANGCHAIN_API_KEY"))
+if TRAZAS_LANGSMITH:
+    os.environ["LANGSMITH_ENDPOINT"] = os.environ.get("LANGSMITH_ENDPOINT", "https://api.smith.langchain.com")
+    os.environ["LANGCHAIN_TRACING_V2"] = os.environ.get("LANGCHAIN_TRACING_V2", "true")
+    os.environ["LANGCHAIN_PROJECT"] = os.environ.get("LANGCHAIN_PROJECT", "S09-eiagurp")
+else:
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    os.environ["LANGSMITH_TRACING"] = "false"
 
 # --- INICIALIZACIÓN DE COMPONENTES GLOBALES (Se ejecuta una sola vez al inicio del servidor) ---
+# PostgreSQL y el vector store se inicializan en paralelo, cada uno con su propio timeout
+# (ARRANQUE_TIMEOUT_POSTGRES_S / ARRANQUE_TIMEOUT_VECTOR_S). Un backend lento o caído no bloquea
+# el arranque: la instancia sirve sin las herramientas que dependen de él. Las fases y sus tiempos
+# se publican en /ready y /stats. Los componentes se pueden inyectar con servicios.arranque.inyectar().
+ARRANQUE = Arranque()
+TIMEOUTS_ARRANQUE = {
+    "postgres": float(os.environ.get("ARRANQUE_TIMEOUT_POSTGRES_S", "15")),
+    "vector_store": float(os.environ.get("ARRANQUE_TIMEOUT_VECTOR_S", "20")),
+}
 
-# 1. Conexión a Base de Datos SQL
-try:
-    DB_CONN = SQLDatabase.from_uri(POSTGRES_URI)
-    print("Conexión a PostgreSQL establecida.")
-except Exception as e:
-    print(f"ERROR: Fallo al conectar con la base de datos SQL. Herramientas SQL deshabilitadas. Detalle: {e}")
-    DB_CONN = None
-
-# 2. Configuración del LLM
-MODEL = ChatOpenAI(model="gpt-4o-mini", api_key=OPENAI_API_KEY)
-
-# 3. Configuración de Memoria Persistente (Checkpointer)
-try:
-    # Usamos ConnectionPool para gestionar las conexiones a la DB para el Checkpointer
-    CONN_POOL = ConnectionPool(
-        conninfo=POSTGRES_URI,
-        min_size=1,
-        max_size=20,
-        kwargs={"autocommit": True, "prepare_threshold": 0},
-    )
-    MEMORY_SAVER = PostgresSaver(CONN_POOL)
-    print("Checkpointer (PostgresSaver) inicializado.")
-except Exception as e:
-    print(f"ERROR: Fallo al inicializar PostgresSaver. La memoria no será persistente. Detalle: {e}")
-    # Fallback
-    from langgraph.checkpoint.memory import MemorySaver as FallbackMemorySaver
-    MEMORY_SAVER = FallbackMemorySaver()
+# 1. Pool de conexiones a PostgreSQL (compartido por el checkpointer y las herramientas SQL)
+def setup_postgres():
+    """Abre el pool y espera la primera conexión; None si no hay POSTGRES_URI."""
+    if not POSTGRES_URI:
+        print("ADVERTENCIA: No se configuró POSTGRES_URI.")
+        return None
+    # Tamaños configurables con DB_POOL_MIN / DB_POOL_MAX (ver tools/repositorio.py)
+    pool = crear_pool(POSTGRES_URI)
+    try:
+        pool.wait(timeout=TIMEOUTS_ARRANQUE["postgres"])
+    except Exception:
+        pool.close()
+        raise
+    print("Pool de conexiones a PostgreSQL establecido.")
+    return pool
+
+# 2. Embeddings de consultas con caché (memoria + tabla compartida opcional en PostgreSQL)
+def setup_embeddings():
+    """Configura el modelo de embeddings envuelto en la caché de consultas."""
+    if arranque.inyectado("embeddings"):
+        return arranque.obtener_inyectado("embeddings")
+    try:
+        from langchain_openai import OpenAIEmbeddings
 
-# 4. Vector Store
+        return EmbeddingsConCache(
+            OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY),
+            modelo="text-embedding-3-large",
+        )
+    except Exception as e:
+        print(f"ERROR: Fallo al configurar el modelo de embeddings. Detalle: {e}")
+        return None
+
+# 3. Vector Store
 def setup_vector_store():
-    """Configura la conexión al vector store."""
+    """Configura el vector store: Elasticsearch (por defecto) o el índice local mapeado en memoria."""
+    if EMBEDDINGS is None:
+        return None
+
+    if VECTOR_BACKEND == "local":
+        from servicios.indice_local import IndiceVectorialLocal
+
+        vector_store = IndiceVectorialLocal(INDICE_LOCAL_RUTA, EMBEDDINGS)
+        print(f"Índice vectorial local cargado desde '{INDICE_LOCAL_RUTA}' ({len(vector_store)} documentos).")
+        return vector_store
+
     if not all([ELASTIC_URL, ELASTIC_PASSWORD, ELASTIC_INDEX]):
         print("ADVERTENCIA: Faltan credenciales/URL de Elasticsearch.")
         return None
-    try:
-        embedding = OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY)
-        vector_store = ElasticsearchStore(
-            es_url=ELASTIC_URL,
-            es_user=ELASTIC_USER,
-            es_password=ELASTIC_PASSWORD,
-            index_name=ELASTIC_INDEX,
-            embedding=embedding
+    from langchain_elasticsearch import ElasticsearchStore
+
+    vector_store = ElasticsearchStore(
+        es_url=ELASTIC_URL,
+        es_user=ELASTIC_USER,
+        es_password=ELASTIC_PASSWORD,
+        index_name=ELASTIC_INDEX,
+        embedding=EMBEDDINGS
+    )
+    print("Conexión a Elasticsearch establecida.")
+    return vector_store
+
+with ARRANQUE.fase("embeddings"):
+    EMBEDDINGS = setup_embeddings()
+
+COMPONENTES = ARRANQUE.en_paralelo(
+    {"postgres": setup_postgres, "vector_store": setup_vector_store},
+    timeouts=TIMEOUTS_ARRANQUE,
+)
+CONN_POOL = COMPONENTES["postgres"]
+VECTOR_STORE = COMPONENTES["vector_store"]
+if CONN_POOL is None and not arranque.inyectado("repositorio"):
+    print("ERROR: Fallo al conectar con la base de datos SQL. Herramientas SQL deshabilitadas.")
+if VECTOR_STORE is None:
+    print("ERROR: Vector store no disponible. Herramienta de documentación deshabilitada.")
+
+# Repositorio de solicitudes. Caché de solicitudes para las consultas de estado repetidas;
+# CACHE_SOLICITUDES_LISTEN=true la invalida entre instancias con LISTEN/NOTIFY
+# (migración 002_notificar_cambios_reembolsos.sql)
+REPOSITORIO = arranque.obtener_inyectado("repositorio")
+if REPOSITORIO is None and CONN_POOL is not None:
+    REPOSITORIO = RepositorioReembolsos(CONN_POOL, cache=crear_cache_solicitudes())
+    if os.environ.get("CACHE_SOLICITUDES_LISTEN", "false").lower() == "true":
+        REPOSITORIO.iniciar_escucha(POSTGRES_URI)
+
+# El nivel compartido de la caché de embeddings necesita el pool, que se abrió en paralelo
+if CONN_POOL is not None and isinstance(EMBEDDINGS, EmbeddingsConCache) \
+        and os.environ.get("CACHE_EMBEDDINGS_POSTGRES", "false").lower() == "true":
+    EMBEDDINGS.usar_compartida(CONN_POOL)
+
+# 4. Configuración del LLM
+# stream_usage: los tokens también se reportan en /agent/stream (métrica llm_tokens_total)
+# LLM_PLANIFICADOR=true (por defecto): todas las llamadas pasan por un planificador con concurrencia
+# máxima, presupuesto de tokens por minuto y prioridades; los reintentos ante un 429 los hace el
+# planificador (el cliente de OpenAI no reintenta por su cuenta)
+LLM_PLANIFICADOR = os.environ.get("LLM_PLANIFICADOR", "true").lower() == "true"
+PLAZO_SOLICITUD_S = float(os.environ.get("PLAZO_SOLICITUD_S", "60"))
+MODEL = arranque.obtener_inyectado("modelo") or ChatOpenAI(
+    model="gpt-4o-mini", api_key=OPENAI_API_KEY, stream_usage=True, **({"max_retries": 0} if LLM_PLANIFICADOR else {})
+)
+metricas.instrumentar_modelo(MODEL)
+PLANIFICADOR_LLM = None
+if LLM_PLANIFICADOR:
+    PLANIFICADOR_LLM = PlanificadorLLM()
+    MODEL = ChatPlanificado(modelo=MODEL, planificador=PLANIFICADOR_LLM)
+
+# 5. Configuración de Memoria Persistente (Checkpointer)
+if arranque.inyectado("checkpointer"):
+    MEMORY_SAVER = arranque.obtener_inyectado("checkpointer")
+elif CONN_POOL is not None:
+    from langgraph.checkpoint.postgres import PostgresSaver
+
+    MEMORY_SAVER = PostgresSaver(CONN_POOL)
+    print("Checkpointer (PostgresSaver) inicializado.")
+    # Job opcional de compactación/expiración de checkpoints (una sola instancia a la vez)
+    if os.environ.get("CHECKPOINTS_MANTENIMIENTO_CADA_S"):
+        iniciar_mantenimiento_periodico(
+            CONN_POOL, float(os.environ["CHECKPOINTS_MANTENIMIENTO_CADA_S"]), **opciones_desde_entorno()
         )
-        print("Conexión a Elasticsearch establecida.")
-        return vector_store
-    except Exception as e:
-        print(f"ERROR: Fallo al conectar con Elasticsearch. Herramienta de documentación deshabilitada. Detalle: {e}")
-        return None
+else:
+    print("ERROR: Sin pool de PostgreSQL. La memoria no será persistente.")
+    # Fallback
+    MEMORY_SAVER = MemorySaver()
+
+# CHECKPOINTER_COALESCENTE=true: un solo checkpoint por turno en lugar de uno por paso del grafo
+CHECKPOINTER_COALESCENTE = os.environ.get("CHECKPOINTER_COALESCENTE", "false").lower() == "true"
+if CHECKPOINTER_COALESCENTE:
+    MEMORY_SAVER = CheckpointerCoalescente(MEMORY_SAVER)
+
+# Caché semántica de respuestas de documentación (se vacía si el índice se re-ingesta)
+def version_indice_documental() -> str:
+    """Versión del índice: `_meta.version_ingesta` si la ingesta la publicó; si no, conteo e indexaciones."""
+    if hasattr(VECTOR_STORE, "version"):
+        # Índice local (o uno inyectado): publica su propia versión
+        return VECTOR_STORE.version()
+    cliente = VECTOR_STORE.client
+    mapping = cliente.indices.get_mapping(index=ELASTIC_INDEX)
+    mapping = getattr(mapping, "body", mapping)
+    meta = next(iter(mapping.values()))["mappings"].get("_meta", {})
+    if "version_ingesta" in meta:
+        return str(meta["version_ingesta"])
+    estadisticas = cliente.indices.stats(index=ELASTIC_INDEX, metric="docs,indexing")
+    primarios = getattr(estadisticas, "body", estadisticas)["_all"]["primaries"]
+    return f'{primarios["docs"]["count"]}:{primarios["indexing"]["index_total"]}'
 
-VECTOR_STORE = setup_vector_store()
+CACHE_SEMANTICA = None
+if VECTOR_STORE and os.environ.get("CACHE_SEMANTICA", "true").lower() == "true":
+    from servicios.cache_semantica import CacheSemantica
 
-# 4. Creación de todas las herramientas
+    CACHE_SEMANTICA = CacheSemantica(EMBEDDINGS, obtener_version=version_indice_documental)
+
+# 6. Creación de todas las herramientas
 TOOLS = []
-if DB_CONN:
-    TOOLS.append(create_tool_registrar_solicitud(DB_CONN))
-    TOOLS.append(create_tool_consultar_estado(DB_CONN))
-    TOOLS.append(create_tool_actualizar_solicitud(DB_CONN))
+if REPOSITORIO:
+    TOOLS.append(create_tool_registrar_solicitud(REPOSITORIO))
+    TOOLS.append(create_tool_consultar_estado(REPOSITORIO))
+    TOOLS.append(create_tool_listar_solicitudes(REPOSITORIO))
+    TOOLS.append(create_tool_resumen_solicitudes(REPOSITORIO))
+    TOOLS.append(create_tool_actualizar_solicitud(REPOSITORIO))
+    TOOLS.append(create_tool_actualizar_solicitudes_masivo(REPOSITORIO))
 if VECTOR_STORE:
-    TOOLS.append(create_tool_busqueda_documental(VECTOR_STORE))
+    # BUSQUEDA_MODO=hibrida combina BM25 y kNN con Reciprocal Rank Fusion
+    RECUPERADOR = None
+    if os.environ.get("BUSQUEDA_MODO", "vector").lower() == "hibrida":
+        from servicios.busqueda_hibrida import crear_recuperador_hibrido
+
+        RECUPERADOR = crear_recuperador_hibrido(VECTOR_STORE, ELASTIC_INDEX)
+    TOOLS.append(create_tool_busqueda_documental(VECTOR_STORE, RECUPERADOR))
 print(f"Total de herramientas disponibles: {len(TOOLS)}")
 
+# RECUPERACION_ESPECULATIVA=true: la búsqueda documental corre en paralelo con el supervisor y,
+# si la ruta es DOCUMENTACION, el agente responde con ese contexto en una sola llamada al LLM
+RECUPERACION_ESPECULATIVA = None
+if VECTOR_STORE and os.environ.get("RECUPERACION_ESPECULATIVA", "false").lower() == "true":
+    RECUPERACION_ESPECULATIVA = RecuperacionEspeculativa(
+        lambda pregunta: busqueda_documental_logica(VECTOR_STORE, pregunta, RECUPERADOR),
+        lambda pregunta: abusqueda_documental_logica(VECTOR_STORE, pregunta, RECUPERADOR),
+    )
+
+# IDEMPOTENCIA=true (por defecto): reintentos con la misma Idempotency-Key reciben la respuesta guardada,
+# los envíos duplicados en vuelo se agrupan y cada conversación procesa un turno a la vez
+CONTROL_TURNOS = ControlTurnos() if os.environ.get("IDEMPOTENCIA", "true").lower() == "true" else None
+
 # --- DEFINICIÓN DEL GRAFO Y AGENTES ---
 
-# Estado del grafo
+# Estado del grafo (add_messages permite quitar los turnos ya resumidos con RemoveMessage)
 class AgenteState(TypedDict):
-    messages: Annotated[List[Any], operator.add]
+    messages: Annotated[List[Any], add_messages]
     next: str
+    usuario: str
+    nombre_usuario: str
+    rol: str
+    enrutamiento: dict
+    resumen: str
+    turnos: int
+    contexto_documental: str
+
+# Estado de los agentes: la identidad del usuario y el resumen del historial llegan en el estado, no en el prompt compilado
+class AgenteRolState(AgentState):
+    usuario: str
+    nombre_usuario: str
+    rol: str
+    resumen: str
+    turnos: int
+
+# Política de historial: últimos HISTORIAL_TURNOS turnos literales, los anteriores plegados en `resumen`
+HISTORIAL = PoliticaHistorial(resumidor=MODEL)
+
+def historial_node(state: AgenteState):
+    """Primer nodo del turno: cuenta el turno y, si el hilo creció, pliega los turnos viejos en el resumen."""
+    # El resumen puede esperar: sus llamadas van detrás de las del supervisor y los agentes
+    with prioridad_llm(PRIORIDAD_RESUMEN):
+        return {"turnos": state.get("turnos", 0) + 1, **HISTORIAL.plegar(state)}
+
+async def ahistorial_node(state: AgenteState):
+    with prioridad_llm(PRIORIDAD_RESUMEN):
+        return {"turnos": state.get("turnos", 0) + 1, **await HISTORIAL.aplegar(state)}
+
+def prompt_con_historial(instrucciones: str):
+    """
+    Prompt de los agentes: instrucciones + resumen + ventana de los últimos turnos como mensajes reales
+    (MessagesPlaceholder en lugar de volcar la lista en un único mensaje humano). Registra los tokens enviados.
+    """
+    plantilla = ChatPromptTemplate.from_messages([
+        ("system", instrucciones),
+        MessagesPlaceholder("resumen", optional=True),
+        MessagesPlaceholder("messages"),
+    ])
+
+    def preparar(state):
+        mensajes = plantilla.invoke({
+            "messages": HISTORIAL.ventana(state["messages"]),
+            "resumen": HISTORIAL.mensaje_resumen(state.get("resumen")),
+            "usuario": state.get("usuario", ""),
+            "nombre_usuario": state.get("nombre_usuario", ""),
+            "contexto": state.get("contexto_documental") or "",
+        }).to_messages()
+        HISTORIAL.registrar_envio(mensajes, state.get("turnos") or len(dividir_en_turnos(state["messages"])))
+        return mensajes
+
+    return RunnableLambda(preparar)
 
 # Nodo de agente
-def agent_node(state, agent_instance):
-    """Ejecuta el agente."""
-    result = agent_instance.invoke(state)
-    return {"messages": [result["messages"][-1]]}
+def _registrar_iteraciones(nombre, state, result):
+    """Iteraciones ReAct del turno = mensajes AI que agregó el agente."""
+    if nombre and metricas.REGISTRO.habilitado:
+        nuevos = result["messages"][len(state["messages"]):]
+        metricas.REACT_ITERACIONES.observar(sum(1 for m in nuevos if m.type == "ai"), agente=nombre)
+
+def _respuesta_agente(nombre, result):
+    """Última respuesta del agente, firmada con el nombre del nodo (el enrutador sabe quién hizo la pregunta)."""
+    respuesta = result["messages"][-1]
+    return {"messages": [respuesta.model_copy(update={"name": nombre}) if nombre else respuesta]}
+
+def agent_node(state, agent_instance, config=None, nombre=None):
+    """Ejecuta el agente. Se propaga el config para que el streaming vea los tokens del agente interno."""
+    result = agent_instance.invoke(state, config)
+    _registrar_iteraciones(nombre, state, result)
+    return _respuesta_agente(nombre, result)
+
+async def aagent_node(state, agent_instance, config=None, nombre=None):
+    """Variante asíncrona de agent_node (modo ASGI)."""
+    result = await agent_instance.ainvoke(state, config)
+    _registrar_iteraciones(nombre, state, result)
+    return _respuesta_agente(nombre, result)
+
+def _pregunta_actual(state) -> str:
+    return state["messages"][-1].content
+
+def _registrar_latencia_documentacion(state, duracion_s):
+    """Anota cuánto costó el turno sin caché (supervisor + agente de documentación)."""
+    latencia_supervisor = (state.get("enrutamiento") or {}).get("latencia_s", 0.0)
+    CACHE_SEMANTICA.registrar_latencia_fallo(duracion_s + latencia_supervisor)
+
+# Respuesta de documentación en una sola llamada, con el contexto que trajo la recuperación especulativa
+RESPUESTA_DOCUMENTAL = prompt_con_historial(
+    "Eres el agente de documentación. Responde la última pregunta del usuario usando únicamente el contexto "
+    "recuperado de la base de datos vectorial de reembolsos y resume la información encontrada. "
+    "Si el contexto no contiene la información, indica al usuario que no encontraste ese detalle.\n\n"
+    "Contexto recuperado:\n{contexto}"
+) | MODEL
+
+def _documentacion(state, agent_instance, config):
+    """Con contexto especulativo responde directamente; si no, ejecuta el agente ReAct con la herramienta."""
+    if state.get("contexto_documental") is not None:
+        return {"messages": [RESPUESTA_DOCUMENTAL.invoke(state, config)]}
+    return agent_node(state, agent_instance, config, "documentacion")
+
+async def _adocumentacion(state, agent_instance, config):
+    if state.get("contexto_documental") is not None:
+        return {"messages": [await RESPUESTA_DOCUMENTAL.ainvoke(state, config)]}
+    return await aagent_node(state, agent_instance, config, "documentacion")
+
+def _turno_sin_contexto(state) -> bool:
+    """
+    La caché semántica se indexa solo por la pregunta: un turno con historial o resumen puede depender
+    de lo conversado antes ("¿y el segundo?") y su respuesta no sirve para otra conversación.
+    """
+    return len(state["messages"]) == 1 and not state.get("resumen")
+
+def _respuesta_cacheable(state, respuesta) -> bool:
+    """No se guardan respuestas que mencionen al usuario (saludos, nombre): se reutilizarían con otros usuarios."""
+    if not _turno_sin_contexto(state):
+        return False
+    texto = respuesta.lower()
+    return not any(dato and dato.lower() in texto for dato in (state.get("usuario"), state.get("nombre_usuario")))
+
+def nodo_documentacion(agent_instance):
+    """Nodo de documentación: ejecuta el agente y alimenta la caché semántica con su respuesta."""
+    def ejecutar(state, config):
+        inicio = time.perf_counter()
+        resultado = _documentacion(state, agent_instance, config)
+        if CACHE_SEMANTICA is not None:
+            _registrar_latencia_documentacion(state, time.perf_counter() - inicio)
+            respuesta = resultado["messages"][-1].content
+            if _respuesta_cacheable(state, respuesta):
+                CACHE_SEMANTICA.guardar(_pregunta_actual(state), respuesta)
+        return resultado
+
+    async def aejecutar(state, config):
+        inicio = time.perf_counter()
+        resultado = await _adocumentacion(state, agent_instance, config)
+        if CACHE_SEMANTICA is not None:
+            _registrar_latencia_documentacion(state, time.perf_counter() - inicio)
+            respuesta = resultado["messages"][-1].content
+            if _respuesta_cacheable(state, respuesta):
+                await CACHE_SEMANTICA.aguardar(_pregunta_actual(state), respuesta)
+        return resultado
+
+    return RunnableLambda(ejecutar, afunc=aejecutar)
+
+def _resultado_cache_semantica(acierto):
+    if acierto is None:
+        return {"next": "supervisor"}
+    return {
+        "next": "cache",
+        "messages": [AIMessage(content=acierto.respuesta)],
+        "enrutamiento": {
+            "ruta": DOCUMENTACION,
+            "nivel": "cache_semantica",
+            "confianza": round(acierto.similitud, 4),
+            "motivo": f"similar a: {acierto.pregunta}",
+        },
+    }
+
+def _consultar_cache_semantica(state) -> bool:
+    """Solo se consulta si la caché está activa, el turno no tiene contexto previo y las reglas no lo marcan como una acción."""
+    return (
+        CACHE_SEMANTICA is not None
+        and _turno_sin_contexto(state)
+        and decidir_por_reglas(state["messages"]).ruta != USUARIO_EXTERNO
+    )
+
+# Nodo de caché semántica (antes del supervisor): en un acierto se omiten el supervisor y el agente
+def cache_semantica_node(state: AgenteState):
+    if not _consultar_cache_semantica(state):
+        return {"next": "supervisor"}
+    return _resultado_cache_semantica(CACHE_SEMANTICA.buscar(_pregunta_actual(state)))
+
+async def acache_semantica_node(state: AgenteState):
+    if not _consultar_cache_semantica(state):
+        return {"next": "supervisor"}
+    return _resultado_cache_semantica(await CACHE_SEMANTICA.abuscar(_pregunta_actual(state)))
+
+def nodo_agente(agent_instance, nombre=None):
+    """Nodo del grafo que funciona tanto con invoke/stream como con ainvoke/astream."""
+    def ejecutar(state, config):
+        return agent_node(state, agent_instance, config, nombre)
+
+    async def aejecutar(state, config):
+        return await aagent_node(state, agent_instance, config, nombre)
+
+    return RunnableLambda(ejecutar, afunc=aejecutar)
+
+# Decisión de ruta con el LLM (último nivel del enrutador, solo si las reglas no son concluyentes)
+PROMPT_DECISION = ChatPromptTemplate.from_messages([
+    ("system", 
+     "Eres un agente supervisor de un sistema de reembolsos. Tu tarea es enrutar la consulta del usuario. "
+    "--- REGLA DE PRIORIDAD CRÍTICA --- "
+     "1. Si el historial muestra que el AI pidió un dato obligatorio (ej. nombre, monto, fecha) y la última consulta del usuario es una respuesta corta que proporciona ese dato, **DEBES** asumir que es una continuación de la acción y enrutar a **USUARIO_EXTERNO**."
+     "2. Solo enruta a **DOCUMENTACION** si la pregunta del usuario es una pregunta teórica nueva (ej. '¿Qué documentos necesito...?' o '¿Qué dice la política...?')."
+     "Basado en la última consulta, decide a qué equipo debe ir: "
+     "- **DOCUMENTACION**: Si la pregunta es sobre políticas, procedimientos, requisitos, qué documentos llevar, o cualquier información teórica general. "
+     "- **USUARIO_EXTERNO**: Si la pregunta implica una ACCIÓN sobre una solicitud: registrar una solicitud, consultar el estado o actualizar una solicitud. "
+     "Tu respuesta DEBE ser una de las siguientes palabras ÚNICAMENTE: DOCUMENTACION, USUARIO_EXTERNO."
+    ),
+    ("human", "Última consulta del usuario: {user_query}")
+])
+
+# La decisión de ruta es corta y bloquea el resto del turno: pasa primero en la cola del planificador
+def decidir_ruta_con_llm(user_query: str) -> str:
+    cadena_decision = PROMPT_DECISION | MODEL
+    with prioridad_llm(PRIORIDAD_SUPERVISOR):
+        return cadena_decision.invoke({"user_query": user_query}).content.strip().upper()
+
+async def adecidir_ruta_con_llm(user_query: str) -> str:
+    cadena_decision = PROMPT_DECISION | MODEL
+    with prioridad_llm(PRIORIDAD_SUPERVISOR):
+        respuesta = await cadena_decision.ainvoke({"user_query": user_query})
+    return respuesta.content.strip().upper()
+
+# Enrutador escalonado: reglas → clasificador local (opcional) → LLM
+ENRUTADOR = EnrutadorEscalonado(decidir_ruta_con_llm, adecidir_ruta_con_llm)
+
+def _resultado_enrutamiento(decision, contexto=None):
+    metricas.SUPERVISOR_DURACION.observar(decision.latencia_s, ruta=decision.ruta, nivel=decision.nivel)
+    enrutamiento = {
+        "ruta": decision.ruta,
+        "nivel": decision.nivel,
+        "confianza": decision.confianza,
+        "motivo": decision.motivo,
+        "latencia_s": round(decision.latencia_s, 4),
+    }
+    
+    # Lógica de enrutamiento
+    # contexto_documental se reescribe en cada turno para no arrastrar el de un turno anterior
+    if decision.ruta == DOCUMENTACION:
+        return {"next": "documentacion", "enrutamiento": enrutamiento, "contexto_documental": contexto}
+    return {"next": "usuario_externo", "enrutamiento": enrutamiento, "contexto_documental": None}
+
+def _especular(state) -> bool:
+    """Se busca en paralelo salvo que las reglas ya marquen el turno como una acción."""
+    return RECUPERACION_ESPECULATIVA is not None and decidir_por_reglas(state["messages"]).ruta != USUARIO_EXTERNO
 
 # Nodo supervisor
 def supervisor_node(state: AgenteState):
     """Decide qué agente debe ser el siguiente en responder (DOCUMENTACION o USUARIO_EXTERNO)."""
-    user_query = state["messages"][-1].content
-    decision_prompt = ChatPromptTemplate.from_messages([
-        ("system", 
-         "Eres un agente supervisor de un sistema de reembolsos. Tu tarea es enrutar la consulta del usuario. "
-        "--- REGLA DE PRIORIDAD CRÍTICA --- "
-         "1. Si el historial muestra que el AI pidió un dato obligatorio (ej. nombre, monto, fecha) y la última consulta del usuario es una respuesta corta que proporciona ese dato, **DEBES** asumir que es una continuación de la acción y enrutar a **USUARIO_EXTERNO**."
-         "2. Solo enruta a **DOCUMENTACION** si la pregunta del usuario es una pregunta teórica nueva (ej. '¿Qué documentos necesito...?' o '¿Qué dice la política...?')."
-         "Basado en la última consulta, decide a qué equipo debe ir: "
-         "- **DOCUMENTACION**: Si la pregunta es sobre políticas, procedimientos, requisitos, qué documentos llevar, o cualquier información teórica general. "
-         "- **USUARIO_EXTERNO**: Si la pregunta implica una ACCIÓN sobre una solicitud: registrar una solicitud, consultar el estado o actualizar una solicitud. "
-         "Tu respuesta DEBE ser una de las siguientes palabras ÚNICAMENTE: DOCUMENTACION, USUARIO_EXTERNO."
-        ),
-        ("human", f"Última consulta del usuario: {user_query}")
-    ])
-    
-    cadena_decision = decision_prompt | MODEL
-    decision = cadena_decision.invoke({"user_query": user_query}).content.strip().upper()
-    
-    # Lógica de enrutamiento
-    if "DOCUMENTACION" in decision:
-        return {"next": "documentacion"}
-    elif "USUARIO_EXTERNO" in decision:
-        return {"next": "usuario_externo"}
-    else:
-        # Falla segura al agente de acción si la decisión no es clara
-        return {"next": "usuario_externo"} 
+    if not _especular(state):
+        return _resultado_enrutamiento(ENRUTADOR.decidir(state["messages"]))
+    return _resultado_enrutamiento(*RECUPERACION_ESPECULATIVA.decidir(
+        _pregunta_actual(state), lambda: ENRUTADOR.decidir(state["messages"])
+    ))
+
+async def asupervisor_node(state: AgenteState):
+    if not _especular(state):
+        return _resultado_enrutamiento(await ENRUTADOR.adecidir(state["messages"]))
+    return _resultado_enrutamiento(*await RECUPERACION_ESPECULATIVA.adecidir(
+        _pregunta_actual(state), lambda: ENRUTADOR.adecidir(state["messages"])
+    ))
 
 # Función para crear el agente de Usuario basado en el rol de la solicitud
-def create_agent_for_role(rol: str, usuario_logueado_user: str, usuario_logueado_fullname: str):
-    """Crea el agente de LangGraph con el conjunto de herramientas apropiado según el rol."""
+def create_agent_for_role(rol: str):
+    """
+    Crea el agente de LangGraph con el conjunto de herramientas apropiado según el rol.
+    El prompt usa las variables {usuario} y {nombre_usuario}, que se resuelven desde el estado en cada turno.
+    El agente no tiene checkpointer propio: el historial del hilo lo persiste solo el grafo supervisor.
+    """
     
-    if rol == "Administrador":
-        # Filtra herramientas para el rol de Admin
-        toolkit = [t for t in TOOLS if t.name in ['registrar_solicitud', 'consultar_estado', 'actualizar_solicitud']]
+    # Las herramientas de cada rol se definen en servicios/permisos.py (las mismas reglas usa la API REST)
+    toolkit = [t for t in TOOLS if permisos.puede(rol, t.name)]
+    if rol == permisos.ADMINISTRADOR:
         prompt_instruccion = (
-            f"El usuario logueado es **{usuario_logueado_user}** y tiene acceso total. "
+            "El usuario logueado es **{usuario}** y tiene acceso total. "
             "Cuando uses la herramienta 'consultar_estado_tool', **NO incluyas el argumento 'usuario'** en la llamada. "
-            f"Para la herramienta 'registrar_solicitud_tool', utiliza **{usuario_logueado_user}** y **{usuario_logueado_fullname}** automáticamente para los argumentos: 'usuario' y 'nombre_asegurado', respectivamente."
+            "Para la herramienta 'registrar_solicitud_tool', utiliza **{usuario}** y **{nombre_usuario}** automáticamente para los argumentos: 'usuario' y 'nombre_asegurado', respectivamente. "
+            "En 'listar_solicitudes' y 'resumen_solicitudes' usa 'usuario_consultado' solo si pregunta por otro usuario (o **{usuario}** para sus propios totales); para los totales generales omítelo."
         )
-    elif rol == "General":
-        # Filtra herramientas para el rol General
-        toolkit = [t for t in TOOLS if t.name in ['registrar_solicitud', 'consultar_estado']]
+    elif rol == permisos.GENERAL:
         prompt_instruccion = (
-            f"El usuario logueado es **{usuario_logueado_user}**. "
-            f"Para las herramientas 'registrar_solicitud_tool' y 'consultar_estado_tool', utiliza **{usuario_logueado_user}** y **{usuario_logueado_fullname}** automáticamente para los argumentos: 'usuario' y 'nombre_asegurado', respectivamente. "
+            "El usuario logueado es **{usuario}**. "
+            "Para las herramientas 'registrar_solicitud_tool' y 'consultar_estado_tool', utiliza **{usuario}** y **{nombre_usuario}** automáticamente para los argumentos: 'usuario' y 'nombre_asegurado', respectivamente. "
+            "Las herramientas 'listar_solicitudes' y 'resumen_solicitudes' ya consultan las solicitudes de **{usuario}**: no indiques 'usuario_consultado'. "
             "Solo puedes consultar solicitudes asociadas a tu usuario."
         )
     else:
-        toolkit = [] 
         prompt_instruccion = "Rol desconocido. No tienes permisos para realizar acciones."
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", 
+    prompt = prompt_con_historial(
           f"Eres el agente de soporte para reembolsos médicos. {prompt_instruccion} "
           "Si el usuario menciona un 'Beneficiario', úsalo para el argumento 'nombre_beneficiario'. "
           "Céntrate siempre en responder únicamente a la última pregunta del usuario. NO repitas ni resumas acciones o confirmaciones de solicitudes ya procesadas en turnos anteriores de la conversación si es que el usuario no te las pide."
-          "Usa las herramientas disponibles solo cuando sea necesario y sé cortés."),
-        ("human", "{messages}")
-    ])
+          "Usa las herramientas disponibles solo cuando sea necesario y sé cortés."
+    )
 
-    agent_instance = create_react_agent(MODEL, toolkit, checkpointer=MEMORY_SAVER, prompt=prompt)
+    agent_instance = create_react_agent(
+        MODEL, toolkit, checkpointer=False, prompt=prompt, state_schema=AgenteRolState
+    )
     return agent_instance
 
 # Función para crear el agente de Documentación (solo tiene acceso a busqueda_documental)
 def create_documentacion_agent():
     toolkit = [t for t in TOOLS if t.name == 'busqueda_documental'] 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", 
+    prompt = prompt_con_historial(
          "Eres el agente de documentación. Tu ÚNICA función es usar la herramienta 'busqueda_documental' para encontrar el procedimiento o pasos de reembolsos en la base de datos vectorial y resumir la información encontrada. "
          "Si la herramienta no devuelve información, indica al usuario que no encontraste ese detalle."
-        ),
-        ("human", "{messages}")
-    ])
+    )
     
-    agent_instance = create_react_agent(MODEL, toolkit, checkpointer=MEMORY_SAVER, prompt=prompt)
+    agent_instance = create_react_agent(
+        MODEL, toolkit, checkpointer=False, prompt=prompt, state_schema=AgenteRolState
+    )
     return agent_instance
 
 # Construcción del grafo
-def build_agent_graph(agente_usuario, agente_documentacion):
+def build_agent_graph(agente_usuario, agente_documentacion, checkpointer=None):
     """Construye el grafo supervisor que conecta los agentes de rol."""
     workflow = StateGraph(AgenteState)
     
-    # Nodos
-    workflow.add_node("documentacion", lambda state: agent_node(state, agente_documentacion))
-    workflow.add_node("usuario_externo", lambda state: agent_node(state, agente_usuario))
-    workflow.add_node("supervisor", supervisor_node)
+    # Nodos (cada uno admite ejecución síncrona y asíncrona)
+    workflow.add_node("documentacion", nodo_documentacion(agente_documentacion))
+    workflow.add_node("usuario_externo", nodo_agente(agente_usuario, AGENTE_ACCION))
+    workflow.add_node("supervisor", RunnableLambda(supervisor_node, afunc=asupervisor_node))
+    workflow.add_node("cache_semantica", RunnableLambda(cache_semantica_node, afunc=acache_semantica_node))
+    workflow.add_node("historial", RunnableLambda(historial_node, afunc=ahistorial_node))
     
     # Flujo
-    workflow.set_entry_point("supervisor")
+    workflow.set_entry_point("historial")
+    workflow.add_edge("historial", "cache_semantica")
+    
+    workflow.add_conditional_edges(
+        "cache_semantica",
+        lambda x: x["next"],
+        {
+            "supervisor": "supervisor",
+            "cache": END
+        }
+    )
     
     workflow.add_edge("documentacion", END)
     workflow.add_edge("usuario_externo", END)
@@ -225,86 +607,288 @@ def build_agent_graph(agente_usuario, agente_documentacion):
         }
     )
     
-    app_instance = workflow.compile(checkpointer=MEMORY_SAVER)
+    app_instance = workflow.compile(checkpointer=checkpointer or MEMORY_SAVER)
     return app_instance
 
 # Agente de Documentación (es global porque no depende de datos del usuario)
 AGENTE_DOCUMENTACION = create_documentacion_agent()
 
+# Registro de grafos: un grafo compilado por rol, reutilizado en todas las solicitudes
+REGISTRO_GRAFOS = RegistroGrafos(
+    lambda rol: build_agent_graph(create_agent_for_role(rol), AGENTE_DOCUMENTACION)
+)
+# La precompilación no bloquea el arranque: /ready responde 503 hasta que termina
+# (una solicitud que llegue antes compila su grafo bajo demanda)
+ARRANQUE.en_segundo_plano("grafos", REGISTRO_GRAFOS.precompilar, al_terminar=ARRANQUE.marcar_listo)
+
 # --- RUTA API PRINCIPAL ---
 
+def _datos_solicitud():
+    if request.method == 'POST':
+        return request.get_json(silent=True) or request.args
+    return request.args
+
+def _leer_parametros():
+    """Lee los parámetros de sesión enviados por el frontend (query string o JSON)."""
+    return parametros_sesion(_datos_solicitud())
+
+def parametros_sesion(data):
+    """Extrae los parámetros del agente con sus valores por defecto (compartido con el modo ASGI)."""
+    return {
+        "session_id": data.get('id_agente'),
+        "user_input": data.get('msg'),
+        "user_role": data.get('user_role', 'General'),
+        "username": data.get('username', 'usuario_default'),
+        "display_name": data.get('display_name', 'Usuario Desconocido'),
+    }
+
+def preparar_invocacion(registro, params):
+    """Devuelve el grafo del rol, la entrada y el config de una invocación."""
+    # Grafo compilado del rol (se construye una sola vez por proceso)
+    agent_app = registro.obtener(params["user_role"])
+
+    # La identidad del usuario viaja en el estado del grafo
+    entrada = {
+        "messages": [HumanMessage(content=params["user_input"])],
+        "usuario": params["username"],
+        "nombre_usuario": params["display_name"],
+        "rol": params["user_role"],
+    }
+    config = {"configurable": {"thread_id": params["session_id"]}}
+    return agent_app, entrada, config
+
+def _error_parametros():
+    return jsonify({
+        "response": "Error: Faltan parámetros de sesión, mensaje o usuario.",
+        "status": "error"
+    }), 400
+
+def clave_idempotencia(cabeceras, data):
+    """Clave de idempotencia opcional: cabecera Idempotency-Key o parámetro idempotency_key."""
+    return cabeceras.get("Idempotency-Key") or data.get("idempotency_key") or None
+
+def firma_turno(params):
+    """Identifica el mensaje de un turno para agrupar envíos duplicados sin clave de idempotencia."""
+    return "|".join(params[campo] for campo in ("user_role", "username", "display_name", "user_input"))
+
+def almacenar_turno(resultado):
+    # Los errores internos no se guardan: un reintento con la misma clave vuelve a ejecutarse
+    return resultado[1] < 500
+
+def cuerpo_conversacion_ocupada(e):
+    return {
+        "response": "Esta conversación todavía está procesando un mensaje anterior. Intente nuevamente en unos segundos.",
+        "status": "error",
+        "error_detail": str(e)
+    }
+
+def cuerpo_llm_saturado(e):
+    # 503 reintentable: no se pudo generar la respuesta a tiempo (Retry-After con `reintentar_en_s`)
+    return {
+        "response": "El servicio está atendiendo demasiadas consultas en este momento. Intente nuevamente en unos segundos.",
+        "status": "error",
+        "reintentable": True,
+        "reintentar_en_s": e.reintentar_en_s,
+        "error_detail": str(e)
+    }
+
+def cabeceras_reintento(cuerpo, codigo):
+    return {"Retry-After": str(cuerpo["reintentar_en_s"])} if codigo == 503 and "reintentar_en_s" in cuerpo else {}
+
+def serializar_turno(session_id):
+    """Un turno a la vez por conversación (sin efecto si IDEMPOTENCIA=false)."""
+    return CONTROL_TURNOS.serializar(session_id) if CONTROL_TURNOS else nullcontext()
+
+def _ejecutar_turno(params):
+    """Ejecuta un turno del agente. Devuelve (cuerpo JSON, código HTTP)."""
+    agent_app, entrada, config = preparar_invocacion(REGISTRO_GRAFOS, params)
+    inicio = time.perf_counter()
+
+    try:
+        # 3. Invocar al agente (con el checkpointer coalescente, el turno se persiste al salir del bloque)
+        with plazo_solicitud(PLAZO_SOLICITUD_S), turno_checkpointer(MEMORY_SAVER, params["session_id"]):
+            response = agent_app.invoke(entrada, config=config)
+
+        output = response["messages"][-1].content
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="ok")
+
+        return {
+            "response": output,
+            "thread_id": params["session_id"],
+            "enrutamiento": response.get("enrutamiento"),
+            "status": "success"
+        }, 200
+
+    except LLMSaturado as e:
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="saturado")
+        print(f"Turno rechazado por el planificador del LLM ({e.motivo}): {e}")
+        return cuerpo_llm_saturado(e), 503
+
+    except Exception as e:
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="error")
+        print(f"Error al ejecutar el agente de LangGraph: {e}")
+        return {
+            "response": f"Ocurrió un error interno al ejecutar el agente.",
+            "status": "error",
+            "error_detail": str(e)
+        }, 500
+
 @app.route('/agent', methods=['GET', 'POST'])
 def handle_agent_request():
     """
     Endpoint principal para interactuar con el agente de LangChain. 
     Es invocado por el frontend de Next.js.
+    Acepta una cabecera Idempotency-Key opcional: un reintento con la misma clave recibe la
+    respuesta ya calculada (cabecera X-Turno-Origen: repetida) sin volver a ejecutar el agente.
     """
     
-    # 1. Capturar parámetros de la solicitud
-    if request.method == 'GET':
-        data = request.args
-    elif request.method == 'POST':
-        try:
-            data = request.get_json()
-        except Exception:
-            data = request.args
-            
-    # Parámetros necesarios para el agente (enviados desde el Front-end)
-    session_id = data.get('id_agente')
-    user_input = data.get('msg')
-    user_role = data.get('user_role', 'General')
-    username = data.get('username', 'usuario_default')
-    display_name = data.get('display_name', 'Usuario Desconocido')
+    # 1. Capturar parámetros de la solicitud (enviados desde el Front-end)
+    params = _leer_parametros()
 
     # Validación mínima
-    if not all([session_id, user_input, user_role, username, display_name]):
-        return jsonify({
-            "response": "Error: Faltan parámetros de sesión, mensaje o usuario.",
-            "status": "error"
-        }), 400
-
-    # 2. Crear el agente de Usuario basado en el rol de la solicitud
-    agente_usuario_externo = create_agent_for_role(
-        user_role, 
-        username, 
-        display_name
-    )
-    
-    # 3. Construir el Grafo con los agentes correctos
-    agent_app = build_agent_graph(agente_usuario_externo, AGENTE_DOCUMENTACION)
+    if not all(params.values()):
+        return _error_parametros()
+
+    # 2. Ejecutar el turno (deduplicado y serializado por conversación)
+    if CONTROL_TURNOS is None:
+        cuerpo, codigo = _ejecutar_turno(params)
+        return jsonify(cuerpo), codigo, cabeceras_reintento(cuerpo, codigo)
 
-    # 4. Preparar la invocación
-    config = {"configurable": {"thread_id": session_id}}
-    langchain_messages = [HumanMessage(content=user_input)]
-    
     try:
-        # 5. Invocar al agente
-        response = agent_app.invoke(
-            {"messages": langchain_messages},
-            config=config
+        (cuerpo, codigo), origen = CONTROL_TURNOS.ejecutar(
+            params["session_id"],
+            firma_turno(params),
+            clave_idempotencia(request.headers, _datos_solicitud()),
+            lambda: _ejecutar_turno(params),
+            almacenar=almacenar_turno,
         )
-        
-        output = response["messages"][-1].content
-        
-        return jsonify({
-            "response": output,
-            "thread_id": session_id,
-            "status": "success"
-        })
-        
+    except ConversacionOcupada as e:
+        return jsonify(cuerpo_conversacion_ocupada(e)), 409, {"Retry-After": "2"}
+
+    return jsonify(cuerpo), codigo, {"X-Turno-Origen": origen, **cabeceras_reintento(cuerpo, codigo)}
+
+@app.route('/agent/stream', methods=['GET', 'POST'])
+def handle_agent_stream():
+    """
+    Variante en streaming (Server-Sent Events) de /agent.
+    Emite la decisión de enrutamiento, el inicio/fin de cada herramienta y los tokens del LLM
+    a medida que se generan; el evento 'final' tiene la misma forma que la respuesta JSON de /agent.
+    """
+    params = _leer_parametros()
+    if not all(params.values()):
+        return _error_parametros()
+
+    agent_app, entrada, config = preparar_invocacion(REGISTRO_GRAFOS, params)
+    traductor = TraductorEventos(params["session_id"])
+
+    def generar():
+        inicio = time.perf_counter()
+        yield traductor.inicio()
+        try:
+            with serializar_turno(params["session_id"]), plazo_solicitud(PLAZO_SOLICITUD_S), \
+                    turno_checkpointer(MEMORY_SAVER, params["session_id"]):
+                for modo, dato in agent_app.stream(entrada, config=config, stream_mode=MODOS_STREAM):
+                    yield from traductor.traducir(modo, dato)
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="ok")
+            yield traductor.final()
+        except LLMSaturado as e:
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="saturado")
+            yield traductor.error(e, cuerpo_llm_saturado(e))
+        except Exception as e:
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="error")
+            print(f"Error al ejecutar el agente de LangGraph (stream): {e}")
+            yield traductor.error(e)
+
+    return Response(stream_with_context(generar()), mimetype="text/event-stream", headers=CABECERAS_SSE)
+
+@app.route('/admin/solicitudes/estado', methods=['POST'])
+def actualizar_estado_masivo():
+    """
+    Actualización masiva de estado sin pasar por el agente (rol Administrador).
+    Cuerpo JSON: user_role, nuevo_estado, nueva_respuesta y al menos un filtro entre
+    codigos (lista), estado_actual y prefijo. Todo se aplica en una sola transacción.
+    """
+    data = request.get_json(silent=True) or {}
+    if not permisos.puede(data.get('user_role'), 'actualizar_solicitudes_masivo'):
+        return jsonify({"status": "error", "response": "Solo el rol Administrador puede actualizar solicitudes."}), 403
+    if REPOSITORIO is None:
+        return jsonify({"status": "error", "response": "La base de datos SQL no está disponible."}), 503
+
+    try:
+        solicitudes = actualizar_solicitudes_masivo(
+            REPOSITORIO,
+            data.get('nuevo_estado'),
+            data.get('nueva_respuesta', ''),
+            codigos=data.get('codigos'),
+            estado_actual=data.get('estado_actual'),
+            prefijo=data.get('prefijo'),
+        )
+    except (ValueError, LimiteActualizacionExcedido) as e:
+        return jsonify({"status": "error", "response": str(e)}), 400
     except Exception as e:
-        print(f"Error al ejecutar el agente de LangGraph: {e}")
-        return jsonify({
-            "response": f"Ocurrió un error interno al ejecutar el agente.",
-            "status": "error",
-            "error_detail": str(e)
-        }), 500
+        print(f"Error en la actualización masiva de solicitudes: {e}")
+        return jsonify({"status": "error", "response": "Error al actualizar solicitudes.", "error_detail": str(e)}), 500
+
+    return jsonify({
+        "status": "success",
+        "actualizadas": len(solicitudes),
+        "solicitudes": [s.a_dict() for s in solicitudes],
+    })
+
+# Operaciones estructuradas sin LLM (formularios del frontend): /solicitudes
+app.register_blueprint(crear_api_solicitudes(REPOSITORIO))
 
 # Endpoint de verificación de salud
 @app.route('/', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "service": "Agente de Reembolsos Médicos API"})
 
+# Liveness: el proceso responde (no consulta backends, no debe reiniciar la instancia si uno cae)
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# Readiness: 503 hasta terminar el arranque; informa qué componentes y herramientas quedaron disponibles
+@app.route('/ready', methods=['GET'])
+def ready():
+    estado = ARRANQUE.estadisticas()
+    return jsonify({
+        "status": "ok" if estado["listo"] else "iniciando",
+        "componentes": {
+            "postgres": CONN_POOL is not None,
+            "repositorio": REPOSITORIO is not None,
+            "vector_store": VECTOR_STORE is not None,
+            "checkpointer": type(MEMORY_SAVER).__name__,
+        },
+        "herramientas": [t.name for t in TOOLS],
+        "arranque": estado,
+    }), 200 if estado["listo"] else 503
+
+# Métricas en formato Prometheus (METRICAS=false las desactiva)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not metricas.REGISTRO.habilitado:
+        return Response("Métricas desactivadas (METRICAS=false).\n", status=404, mimetype="text/plain")
+    return Response(metricas.REGISTRO.exponer(), content_type=metricas.TIPO_CONTENIDO)
+
+# Endpoint de estadísticas internas (caché de grafos, tiempos de construcción)
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "grafos": REGISTRO_GRAFOS.estadisticas(),
+        "enrutador": ENRUTADOR.estadisticas(),
+        "cache_embeddings": EMBEDDINGS.estadisticas() if EMBEDDINGS else None,
+        "cache_semantica": CACHE_SEMANTICA.estadisticas() if CACHE_SEMANTICA else None,
+        "base_datos": REPOSITORIO.estadisticas() if REPOSITORIO else None,
+        "historial": HISTORIAL.estadisticas(),
+        "checkpointer": MEMORY_SAVER.estadisticas() if CHECKPOINTER_COALESCENTE else None,
+        "arranque": ARRANQUE.estadisticas(),
+        "recuperacion_especulativa": RECUPERACION_ESPECULATIVA.estadisticas() if RECUPERACION_ESPECULATIVA else None,
+        "control_turnos": CONTROL_TURNOS.estadisticas() if CONTROL_TURNOS else None,
+        "salida_herramientas": SALIDAS.estadisticas(),
+        "planificador_llm": PLANIFICADOR_LLM.estadisticas() if PLANIFICADOR_LLM else None,
+    })
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
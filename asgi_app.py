@@ -0,0 +1,271 @@
+"""
+Modo de servicio asíncrono (ASGI).
+
+Atiende /agent y /agent/stream con handlers asíncronos sobre grafos compilados con un
+checkpointer asíncrono (AsyncPostgresSaver), de modo que una instancia pueda mantener muchas
+conversaciones en vuelo mientras espera al LLM, a PostgreSQL o a Elasticsearch.
+El resto de rutas (/, /stats, ...) se sirven desde la app Flask montada como WSGI.
+
+Ejecución: uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from a2wsgi import WSGIMiddleware
+
+from app import (
+    app as flask_app,
+    ARRANQUE,
+    POSTGRES_URI,
+    CHECKPOINTER_COALESCENTE,
+    create_agent_for_role,
+    create_documentacion_agent,
+    build_agent_graph,
+    parametros_sesion,
+    preparar_invocacion,
+    CONTROL_TURNOS,
+    clave_idempotencia,
+    firma_turno,
+    almacenar_turno,
+    cuerpo_conversacion_ocupada,
+    cuerpo_llm_saturado,
+    cabeceras_reintento,
+    PLAZO_SOLICITUD_S,
+)
+from servicios import arranque, metricas
+from servicios.registro_grafos import RegistroGrafos
+from servicios.checkpointer_coalescente import CheckpointerCoalescente, aturno_checkpointer
+from servicios.control_turnos import ConversacionOcupada
+from servicios.planificador_llm import LLMSaturado, plazo_solicitud
+from servicios.streaming_sse import TraductorEventos, MODOS_STREAM, CABECERAS_SSE
+
+# Conversaciones simultáneas por instancia y espera máxima por un turno libre antes de responder 503
+MAX_CONVERSACIONES_CONCURRENTES = int(os.environ.get("MAX_CONVERSACIONES_CONCURRENTES", "32"))
+ESPERA_MAXIMA_COLA_S = float(os.environ.get("ESPERA_MAXIMA_COLA_S", "30"))
+ASYNC_DB_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", "20"))
+
+
+class EstadoAsgi:
+    registro: RegistroGrafos = None
+    semaforo: asyncio.Semaphore = None
+    pool = None
+    checkpointer = None
+
+
+ESTADO = EstadoAsgi()
+
+
+async def _crear_checkpointer():
+    """Abre el pool asíncrono de PostgreSQL y crea el AsyncPostgresSaver (con fallback en memoria)."""
+    if arranque.inyectado("checkpointer"):
+        return arranque.obtener_inyectado("checkpointer")
+    try:
+        from psycopg_pool import AsyncConnectionPool
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+        ESTADO.pool = AsyncConnectionPool(
+            conninfo=POSTGRES_URI,
+            min_size=1,
+            max_size=ASYNC_DB_POOL_MAX,
+            kwargs={"autocommit": True, "prepare_threshold": 0},
+            open=False,
+        )
+        await ESTADO.pool.open()
+        print("Checkpointer asíncrono (AsyncPostgresSaver) inicializado.")
+        return AsyncPostgresSaver(ESTADO.pool)
+    except Exception as e:
+        print(f"ERROR: Fallo al inicializar AsyncPostgresSaver. La memoria no será persistente. Detalle: {e}")
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    with ARRANQUE.fase("checkpointer_asgi"):
+        checkpointer = await _crear_checkpointer()
+    if CHECKPOINTER_COALESCENTE:
+        checkpointer = CheckpointerCoalescente(checkpointer)
+    ESTADO.checkpointer = checkpointer
+    with ARRANQUE.fase("grafos_asgi"):
+        agente_documentacion = create_documentacion_agent()
+        ESTADO.registro = RegistroGrafos(
+            lambda rol: build_agent_graph(create_agent_for_role(rol), agente_documentacion, checkpointer)
+        )
+        ESTADO.registro.precompilar()
+    ESTADO.semaforo = asyncio.Semaphore(MAX_CONVERSACIONES_CONCURRENTES)
+    yield
+    if ESTADO.pool is not None:
+        await ESTADO.pool.close()
+
+
+app = FastAPI(title="Agente de Reembolsos Médicos API", lifespan=lifespan)
+
+
+async def _leer_datos(request: Request):
+    data = dict(request.query_params)
+    if request.method == "POST":
+        try:
+            cuerpo = await request.json()
+            if isinstance(cuerpo, dict):
+                data = cuerpo
+        except Exception:
+            pass
+    return data
+
+
+async def _leer_parametros(request: Request):
+    return parametros_sesion(await _leer_datos(request))
+
+
+def _error_parametros():
+    return JSONResponse({
+        "response": "Error: Faltan parámetros de sesión, mensaje o usuario.",
+        "status": "error"
+    }, status_code=400)
+
+
+_CUERPO_SATURADO = {
+    "response": "El servicio está atendiendo demasiadas conversaciones. Intente nuevamente en unos segundos.",
+    "status": "error"
+}
+
+
+# En /agent/stream la saturación llega como evento `error` (las cabeceras 200 ya se enviaron)
+_CUERPO_SATURADO_STREAM = dict(_CUERPO_SATURADO, reintentable=True, reintentar_en_s=5)
+
+
+async def _adquirir_turno() -> bool:
+    """Espera un turno libre del límite de concurrencia; False si se agota la espera."""
+    try:
+        await asyncio.wait_for(ESTADO.semaforo.acquire(), timeout=ESPERA_MAXIMA_COLA_S)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+@asynccontextmanager
+async def _sin_serializar():
+    yield
+
+
+def _aserializar_turno(session_id):
+    # nullcontext solo es asíncrono desde Python 3.10
+    return CONTROL_TURNOS.aserializar(session_id) if CONTROL_TURNOS else _sin_serializar()
+
+
+async def _aejecutar_turno(params):
+    """Ejecuta un turno del agente. Devuelve (cuerpo JSON, código HTTP)."""
+    if not await _adquirir_turno():
+        return _CUERPO_SATURADO, 503
+
+    inicio = time.perf_counter()
+    try:
+        agent_app, entrada, config = preparar_invocacion(ESTADO.registro, params)
+        with plazo_solicitud(PLAZO_SOLICITUD_S):
+            async with aturno_checkpointer(ESTADO.checkpointer, params["session_id"]):
+                response = await agent_app.ainvoke(entrada, config=config)
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="ok")
+
+        return {
+            "response": response["messages"][-1].content,
+            "thread_id": params["session_id"],
+            "enrutamiento": response.get("enrutamiento"),
+            "status": "success"
+        }, 200
+
+    except LLMSaturado as e:
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="saturado")
+        print(f"Turno rechazado por el planificador del LLM ({e.motivo}): {e}")
+        return cuerpo_llm_saturado(e), 503
+
+    except Exception as e:
+        metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent", estado="error")
+        print(f"Error al ejecutar el agente de LangGraph: {e}")
+        return {
+            "response": "Ocurrió un error interno al ejecutar el agente.",
+            "status": "error",
+            "error_detail": str(e)
+        }, 500
+    finally:
+        ESTADO.semaforo.release()
+
+
+def _respuesta_turno(cuerpo, codigo, cabeceras=None):
+    cabeceras = dict(cabeceras or {})
+    if codigo == 503:
+        cabeceras["Retry-After"] = "5"
+        cabeceras.update(cabeceras_reintento(cuerpo, codigo))
+    return JSONResponse(cuerpo, status_code=codigo, headers=cabeceras)
+
+
+@app.api_route("/agent", methods=["GET", "POST"])
+async def handle_agent_request(request: Request):
+    """Versión asíncrona de /agent: misma entrada (incluida Idempotency-Key) y misma respuesta JSON."""
+    datos = await _leer_datos(request)
+    params = parametros_sesion(datos)
+    if not all(params.values()):
+        return _error_parametros()
+
+    if CONTROL_TURNOS is None:
+        cuerpo, codigo = await _aejecutar_turno(params)
+        return _respuesta_turno(cuerpo, codigo)
+
+    try:
+        (cuerpo, codigo), origen = await CONTROL_TURNOS.aejecutar(
+            params["session_id"],
+            firma_turno(params),
+            clave_idempotencia(request.headers, datos),
+            lambda: _aejecutar_turno(params),
+            almacenar=almacenar_turno,
+        )
+    except ConversacionOcupada as e:
+        return JSONResponse(cuerpo_conversacion_ocupada(e), status_code=409, headers={"Retry-After": "2"})
+
+    return _respuesta_turno(cuerpo, codigo, {"X-Turno-Origen": origen})
+
+
+@app.api_route("/agent/stream", methods=["GET", "POST"])
+async def handle_agent_stream(request: Request):
+    """Versión asíncrona de /agent/stream (Server-Sent Events)."""
+    params = await _leer_parametros(request)
+    if not all(params.values()):
+        return _error_parametros()
+
+    traductor = TraductorEventos(params["session_id"])
+
+    # El turno de concurrencia se pide dentro del generador: si el cliente se desconecta antes de
+    # que empiece el stream, el generador nunca corre y no queda un lugar tomado sin liberar
+    async def generar():
+        inicio = time.perf_counter()
+        yield traductor.inicio()
+        if not await _adquirir_turno():
+            yield traductor.error(None, _CUERPO_SATURADO_STREAM)
+            return
+        try:
+            agent_app, entrada, config = preparar_invocacion(ESTADO.registro, params)
+            with plazo_solicitud(PLAZO_SOLICITUD_S):
+                async with _aserializar_turno(params["session_id"]), aturno_checkpointer(ESTADO.checkpointer, params["session_id"]):
+                    async for modo, dato in agent_app.astream(entrada, config=config, stream_mode=MODOS_STREAM):
+                        for evento in traductor.traducir(modo, dato):
+                            yield evento
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="ok")
+            yield traductor.final()
+        except LLMSaturado as e:
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="saturado")
+            yield traductor.error(e, cuerpo_llm_saturado(e))
+        except Exception as e:
+            metricas.AGENTE_DURACION.observar(time.perf_counter() - inicio, endpoint="/agent/stream", estado="error")
+            print(f"Error al ejecutar el agente de LangGraph (stream): {e}")
+            yield traductor.error(e)
+        finally:
+            ESTADO.semaforo.release()
+
+    return StreamingResponse(generar(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
+
+# El resto de rutas síncronas (salud, estadísticas, ...) se atienden desde Flask
+app.mount("/", WSGIMiddleware(flask_app))
@@ -0,0 +1,133 @@
+"""
+Benchmark del checkpointer coalescente frente a PostgresSaver contra una base PostgreSQL real.
+
+Ejecuta turnos sobre un grafo con la misma forma que el de la API (historial → caché semántica →
+supervisor → agente con un ciclo LLM → herramienta → LLM), sin LLM de por medio: cada nodo solo
+espera --latencia-ms. Así la diferencia medida es la de persistencia de checkpoints.
+Cuenta las operaciones del checkpointer contra la BD (put, put_writes, get_tuple) y la latencia por turno.
+
+Uso:
+    POSTGRES_URI=postgresql://... python benchmarks/checkpointer_coalescente.py --hilos 50 --turnos 10
+"""
+import os
+import sys
+import time
+import uuid
+import operator
+import argparse
+from collections import Counter
+from typing import Annotated, List, TypedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.postgres import PostgresSaver
+
+from servicios.checkpointer_coalescente import CheckpointerCoalescente, turno_checkpointer
+from tools.repositorio import crear_pool
+
+# Operaciones contra la BD de todas las instancias (también las que crea el checkpointer coalescente)
+OPERACIONES = Counter()
+
+
+class PostgresSaverContado(PostgresSaver):
+    def get_tuple(self, config):
+        OPERACIONES["get_tuple"] += 1
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        OPERACIONES["put"] += 1
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        OPERACIONES["put_writes"] += 1
+        return super().put_writes(config, writes, task_id, task_path)
+
+
+class Estado(TypedDict):
+    mensajes: Annotated[List[str], operator.add]
+    pasos_agente: int
+
+
+def construir_grafo(checkpointer, latencia_s: float):
+    def nodo(nombre):
+        def ejecutar(state):
+            time.sleep(latencia_s)
+            return {"mensajes": [nombre]}
+        return ejecutar
+
+    def agente(state):
+        time.sleep(latencia_s)
+        return {"mensajes": ["agente"], "pasos_agente": state.get("pasos_agente", 0) + 1}
+
+    grafo = StateGraph(Estado)
+    for nombre in ("historial", "cache_semantica", "supervisor", "herramienta"):
+        grafo.add_node(nombre, nodo(nombre))
+    grafo.add_node("agente", agente)
+    grafo.set_entry_point("historial")
+    grafo.add_edge("historial", "cache_semantica")
+    grafo.add_edge("cache_semantica", "supervisor")
+    grafo.add_edge("supervisor", "agente")
+    # Agente ReAct: LLM → herramienta → LLM (respuesta final)
+    grafo.add_conditional_edges("agente", lambda s: "herramienta" if s["pasos_agente"] % 2 else END,
+                                {"herramienta": "herramienta", END: END})
+    grafo.add_edge("herramienta", "agente")
+    return grafo.compile(checkpointer=checkpointer)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(nombre, checkpointer, hilos: int, turnos: int, latencia_s: float):
+    grafo = construir_grafo(checkpointer, latencia_s)
+    ids = [f"bench-{nombre}-{uuid.uuid4().hex[:8]}-{i}" for i in range(hilos)]
+    OPERACIONES.clear()
+    latencias = []
+    for _ in range(turnos):
+        for thread_id in ids:
+            config = {"configurable": {"thread_id": thread_id}}
+            inicio = time.perf_counter()
+            with turno_checkpointer(checkpointer, thread_id):
+                grafo.invoke({"mensajes": ["usuario"], "pasos_agente": 0}, config)
+            latencias.append(time.perf_counter() - inicio)
+
+    total_turnos = hilos * turnos
+    resultado = {
+        "modo": nombre,
+        "turnos": total_turnos,
+        "operaciones_bd_por_turno": round(sum(OPERACIONES.values()) / total_turnos, 2),
+        **{f"{op}_por_turno": round(n / total_turnos, 2) for op, n in sorted(OPERACIONES.items())},
+        "latencia_p50_ms": round(1000 * _percentil(latencias, 50), 2),
+        "latencia_p95_ms": round(1000 * _percentil(latencias, 95), 2),
+    }
+    return resultado, ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hilos", type=int, default=50)
+    parser.add_argument("--turnos", type=int, default=10)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Tiempo simulado de cada nodo.")
+    parser.add_argument("--conservar", action="store_true", help="No borrar los hilos de prueba.")
+    args = parser.parse_args()
+
+    pool = crear_pool(os.environ["POSTGRES_URI"])
+    saver = PostgresSaverContado(pool)
+    saver.setup()
+
+    creados = []
+    for nombre, checkpointer in (("postgres", saver), ("coalescente", CheckpointerCoalescente(saver))):
+        resultado, ids = medir(nombre, checkpointer, args.hilos, args.turnos, args.latencia_ms / 1000)
+        creados.extend(ids)
+        print(resultado)
+
+    if not args.conservar:
+        for thread_id in creados:
+            saver.delete_thread(thread_id)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
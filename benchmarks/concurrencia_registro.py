@@ -0,0 +1,76 @@
+"""
+Prueba de concurrencia de registrar_solicitud contra una base PostgreSQL real.
+
+Registra miles de solicitudes en paralelo y verifica que no haya códigos n_solicitud duplicados
+(ni en las respuestas ni en la tabla). Al final borra las solicitudes creadas, salvo --conservar.
+Requiere haber aplicado las migraciones (python migrar.py) y un usuario existente en el sistema.
+
+Uso:
+    POSTGRES_URI=postgresql://... python benchmarks/concurrencia_registro.py --total 2000 --hilos 64 --usuario braitsan-admin
+"""
+import os
+import re
+import sys
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.registrar_solicitud import registrar_solicitud_logica
+from tools.repositorio import RepositorioReembolsos, crear_pool
+
+PATRON_CODIGO = re.compile(r"código: ([A-Z]{3}_\d+)")
+TIPOS_GASTO = ["Medicinas", "Exámenes", "Consultas"]
+NOMBRE_PRUEBA = "Prueba Concurrencia"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--total", type=int, default=2000)
+    parser.add_argument("--hilos", type=int, default=64)
+    parser.add_argument("--usuario", default=os.environ.get("USUARIO_PRUEBA", "braitsan-admin"))
+    parser.add_argument("--conservar", action="store_true", help="No borrar las solicitudes creadas.")
+    args = parser.parse_args()
+
+    pool = crear_pool(os.environ["POSTGRES_URI"], min_size=args.hilos, max_size=args.hilos)
+    repositorio = RepositorioReembolsos(pool)
+
+    def registrar(i):
+        return registrar_solicitud_logica(repositorio, args.usuario, NOMBRE_PRUEBA, TIPOS_GASTO[i % 3], 10.0 + i)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as ejecutor:
+        respuestas = list(ejecutor.map(registrar, range(args.total)))
+    duracion = time.perf_counter() - inicio
+
+    codigos = [m.group(1) for m in (PATRON_CODIGO.search(r) for r in respuestas) if m]
+    errores = [r for r in respuestas if not PATRON_CODIGO.search(r)]
+    duplicados_respuesta = [c for c, n in Counter(codigos).items() if n > 1]
+
+    with pool.connection() as conn:
+        duplicados_tabla = conn.execute("""
+            SELECT "n_solicitud" FROM reembolsos
+            WHERE "n_solicitud" = ANY(%s)
+            GROUP BY "n_solicitud" HAVING COUNT(*) > 1
+        """, (codigos,)).fetchall()
+
+    print(f"Registros: {len(codigos)}/{args.total} en {duracion:.2f}s ({len(codigos) / duracion:.1f} registros/s)")
+    print(f"Errores: {len(errores)}" + (f" (primero: {errores[0]})" if errores else ""))
+    print(f"Espera por conexión: {repositorio.estadisticas()['repositorio']}")
+    print(f"Duplicados en respuestas: {len(duplicados_respuesta)} | duplicados en la tabla: {len(duplicados_tabla)}")
+
+    if not args.conservar and codigos:
+        with pool.connection() as conn:
+            conn.execute('DELETE FROM reembolsos WHERE "n_solicitud" = ANY(%s) AND "nomusuario" = %s',
+                         (codigos, NOMBRE_PRUEBA))
+
+    pool.close()
+    ok = not errores and not duplicados_respuesta and not duplicados_tabla
+    print("OK: sin duplicados." if ok else "FALLO: revisar errores/duplicados.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark de extremo a extremo de /agent sin red (OpenAI, PostgreSQL y Elasticsearch sustituidos).
+
+Arranca la app Flask con los sustitutos de benchmarks/fakes.py inyectados (servicios.arranque.inyectar):
+modelo de chat y embeddings deterministas, repositorio en memoria e índice vectorial local. Cada
+conversación repite el mismo guion de turnos por el endpoint real (test_client de Flask): registrar,
+consultar el estado, actualizar y una pregunta de política. Reporta throughput, percentiles de latencia
+por turno y por tipo de turno, y las llamadas al LLM, a embeddings y a la BD por turno.
+
+Con --errores-limite N las primeras N llamadas al modelo responden 429 (límite de tasa): mide cómo el
+planificador de llamadas (servicios/planificador_llm.py) reintenta o rechaza con 503 reintentable.
+
+Uso:
+    python benchmarks/e2e_agente.py --conversaciones 50 --concurrencia 8 --latencia-llm-ms 200 --latencia-bd-ms 5
+    python benchmarks/e2e_agente.py --errores-limite 20
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import ModeloFalso, EmbeddingsFalsos, RepositorioEnMemoria, crear_indice_local
+
+# (tipo de turno, mensaje del usuario, paso del guion del modelo falso; None = búsqueda documental)
+TURNOS = [
+    ("registrar", "Quiero registrar un reembolso de Medicinas por 150 soles, el beneficiario soy yo.", {
+        "herramienta": "registrar_solicitud",
+        "args": {"usuario": "$usuario", "nombre_asegurado": "$nombre_usuario", "tipo_gasto": "Medicinas", "monto": 150.0},
+    }),
+    ("consultar", "¿Cuál es el estado de la solicitud que acabo de registrar?", {
+        "herramienta": "consultar_estado",
+        "args": {"n_solicitud": "$ultima_solicitud"},
+    }),
+    ("actualizar", "Actualiza esa solicitud a Aprobado con la respuesta: documentos conformes.", {
+        "herramienta": "actualizar_solicitud",
+        "args": {"n_solicitud": "$ultima_solicitud", "nuevo_estado": "Aprobado", "nueva_respuesta": "Documentos conformes"},
+    }),
+    ("politica", "¿Qué documentos necesito para el reembolso de medicinas?", None),
+]
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _resumen_latencias(valores):
+    return {f"p{p}_ms": round(1000 * _percentil(valores, p), 2) for p in (50, 95, 99)}
+
+
+def preparar_app(args, directorio_indice):
+    """Inyecta los sustitutos e importa la app (la configuración se lee al importar)."""
+    os.environ.pop("POSTGRES_URI", None)
+    os.environ.setdefault("OPENAI_API_KEY", "sin-red")
+    os.environ["TRAZAS_LANGSMITH"] = "false"
+    os.environ["CACHE_SEMANTICA"] = "true" if args.cache_semantica else "false"
+    os.environ["RECUPERACION_ESPECULATIVA"] = "true" if args.recuperacion_especulativa else "false"
+
+    from servicios import arranque
+    from servicios.cache_embeddings import EmbeddingsConCache
+    from servicios.indice_local import IndiceVectorialLocal
+
+    modelo = ModeloFalso(guion={mensaje: paso for _, mensaje, paso in TURNOS if paso}, latencia_s=args.latencia_llm_ms / 1000)
+    embeddings = EmbeddingsFalsos(latencia_s=args.latencia_embeddings_ms / 1000)
+    repositorio = RepositorioEnMemoria(latencia_s=args.latencia_bd_ms / 1000)
+    crear_indice_local(directorio_indice, embeddings)
+    embeddings.reiniciar()
+
+    # Los embeddings pasan por la misma caché que en producción
+    embeddings_app = EmbeddingsConCache(embeddings, modelo="embeddings-falso")
+    arranque.inyectar(
+        modelo=modelo,
+        embeddings=embeddings_app,
+        repositorio=repositorio,
+        vector_store=IndiceVectorialLocal(directorio_indice, embeddings_app),
+    )
+
+    import app as aplicacion
+    while not aplicacion.ARRANQUE.estadisticas()["listo"]:
+        time.sleep(0.05)
+    return aplicacion, modelo, embeddings, repositorio
+
+
+def conversar(aplicacion, rol: str):
+    """Ejecuta el guion completo en un hilo nuevo. Devuelve [(tipo, latencia_s, código HTTP, ok)]."""
+    cliente = aplicacion.app.test_client()
+    id_agente = f"bench-{uuid.uuid4().hex[:12]}"
+    resultados = []
+    for tipo, mensaje, _ in TURNOS:
+        inicio = time.perf_counter()
+        respuesta = cliente.post("/agent", json={
+            "id_agente": id_agente,
+            "msg": mensaje,
+            "user_role": rol,
+            "username": f"usuario_{id_agente[-6:]}",
+            "display_name": "Asegurado de Prueba",
+        })
+        ok = respuesta.status_code == 200 and respuesta.get_json().get("status") == "success"
+        resultados.append((tipo, time.perf_counter() - inicio, respuesta.status_code, ok))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversaciones", type=int, default=50)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--rol", default="Administrador", help="Rol de las conversaciones (Administrador puede actualizar).")
+    parser.add_argument("--latencia-llm-ms", type=float, default=0.0)
+    parser.add_argument("--latencia-embeddings-ms", type=float, default=0.0)
+    parser.add_argument("--latencia-bd-ms", type=float, default=0.0)
+    parser.add_argument("--cache-semantica", action="store_true", help="Activa la caché semántica de documentación.")
+    parser.add_argument("--recuperacion-especulativa", action="store_true",
+                        help="Busca en paralelo con el supervisor y responde la documentación en una sola llamada.")
+    parser.add_argument("--calentamiento", type=int, default=2, help="Conversaciones previas que no se miden.")
+    parser.add_argument("--errores-limite", type=int, default=0,
+                        help="Llamadas al modelo (las primeras de la medición) que fallan con un 429.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="indice_bench_") as directorio:
+        aplicacion, modelo, embeddings, repositorio = preparar_app(args, directorio)
+
+        for _ in range(args.calentamiento):
+            conversar(aplicacion, args.rol)
+        for sustituto in (modelo, embeddings, repositorio):
+            sustituto.reiniciar()
+        modelo.limitar(args.errores_limite)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrencia) as ejecutor:
+            conversaciones = list(ejecutor.map(lambda _: conversar(aplicacion, args.rol), range(args.conversaciones)))
+        duracion = time.perf_counter() - inicio
+
+    turnos = [turno for conversacion in conversaciones for turno in conversacion]
+    por_tipo = defaultdict(list)
+    for tipo, latencia, _, _ in turnos:
+        por_tipo[tipo].append(latencia)
+    llamadas_llm, llamadas_embeddings, operaciones_bd = modelo.reiniciar(), embeddings.reiniciar(), repositorio.reiniciar()
+    total = len(turnos)
+
+    print({
+        "conversaciones": args.conversaciones,
+        "concurrencia": args.concurrencia,
+        "turnos": total,
+        "errores": sum(1 for _, _, _, ok in turnos if not ok),
+        "rechazos_503": sum(1 for _, _, codigo, _ in turnos if codigo == 503),
+        "duracion_s": round(duracion, 3),
+        "throughput_turnos_s": round(total / duracion, 2),
+        **_resumen_latencias([latencia for _, latencia, _, _ in turnos]),
+        "llm_llamadas_por_turno": round(sum(llamadas_llm.values()) / total, 2),
+        "embeddings_modelo_por_turno": round(sum(llamadas_embeddings.values()) / total, 2),
+        "bd_operaciones_por_turno": round(sum(operaciones_bd.values()) / total, 2),
+    })
+    print({"llm_por_tipo": llamadas_llm, "bd_por_tipo": operaciones_bd})
+    if aplicacion.PLANIFICADOR_LLM is not None:
+        print({"planificador_llm": aplicacion.PLANIFICADOR_LLM.estadisticas()})
+    for tipo, _, _ in TURNOS:
+        print({"turno": tipo, **_resumen_latencias(por_tipo[tipo])})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Verificación offline del primer nivel del enrutador (servicios/enrutador.py: decidir_por_reglas).
+
+Cada caso es un mensaje con la ruta que deben darle las reglas: DOCUMENTACION, USUARIO_EXTERNO o
+None (ambiguo: decide el clasificador o el LLM). Una ruta distinta a la esperada es un error grave:
+las reglas deciden sin LLM y, si marcan el turno como acción, también se omiten la caché semántica
+y la recuperación especulativa. Informa los fallos y termina con código 1 si hay alguno.
+
+Uso:
+    python benchmarks/enrutamiento_reglas.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+
+from servicios.enrutador import DOCUMENTACION, USUARIO_EXTERNO, decidir_por_reglas
+
+CASOS = [
+    ("¿Cuál es el estado de la solicitud MED_00012?", USUARIO_EXTERNO),
+    ("Actualiza CON_01234 a Aprobado", USUARIO_EXTERNO),
+    ("Quiero registrar un reembolso de Medicinas por 150 soles", USUARIO_EXTERNO),
+    ("¿Qué documentos necesito para el reembolso de medicinas?", DOCUMENTACION),
+    ("¿Cuál es el plazo para presentar una solicitud?", DOCUMENTACION),
+    # "con" seguido de un número no es un código de solicitud
+    ("¿Qué documentos necesito para reembolsar una receta con 2 medicamentos?", DOCUMENTACION),
+    # Los verbos de acción cuentan solo como palabras completas ("consultas" no es "consulta")
+    ("¿El seguro cubre consultas con 3 especialistas?", None),
+    ("¿Se reembolsan las consultas de especialistas?", None),
+    ("Quiero consultar mi solicitud", USUARIO_EXTERNO),
+]
+
+
+def main():
+    fallos = []
+    inicio = time.perf_counter()
+    for mensaje, esperada in CASOS:
+        decision = decidir_por_reglas([HumanMessage(content=mensaje)])
+        if decision.ruta != esperada:
+            fallos.append((mensaje, esperada, decision))
+    duracion_ms = 1000 * (time.perf_counter() - inicio)
+
+    for mensaje, esperada, decision in fallos:
+        print(f"FALLO: {mensaje!r} → {decision.ruta} ({decision.motivo}, {decision.confianza}); esperada {esperada}")
+    print(f"Casos: {len(CASOS)} | fallos: {len(fallos)} | {duracion_ms / len(CASOS):.3f} ms por caso")
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Sustitutos locales de OpenAI, PostgreSQL y Elasticsearch para los benchmarks sin red.
+
+- ModeloFalso: modelo de chat determinista con bind_tools. Decide la ruta del supervisor, resume el
+  historial y, según un guion (mensaje del usuario → herramienta y argumentos), emite la llamada a la
+  herramienta y luego la respuesta final con el resultado. Con `errores_limite` las primeras llamadas
+  fallan como un 429 del proveedor (para probar el planificador de llamadas).
+- EmbeddingsFalsos: bolsa de palabras con hashing (mismas palabras → vectores parecidos).
+- RepositorioEnMemoria: misma interfaz que tools.repositorio.RepositorioReembolsos sobre un dict.
+- crear_indice_local: exportación en disco que abre servicios.indice_local.IndiceVectorialLocal.
+
+Todos admiten una latencia artificial y cuentan sus llamadas.
+"""
+import re
+import time
+import zlib
+import asyncio
+import datetime
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from servicios.busqueda_hibrida import tokenizar
+from servicios.historial import estimar_tokens
+from servicios.indice_local import guardar_exportacion
+from tools.repositorio import (
+    LimiteActualizacionExcedido, ResumenSolicitudes, Solicitud, codificar_cursor, decodificar_cursor,
+)
+
+PATRON_SOLICITUD = re.compile(r"\b[A-Z]{3}_\d{5,}\b")
+
+# Datos del usuario que el prompt de los agentes deja en el mensaje de sistema
+PATRONES_PROMPT = {
+    "$usuario": re.compile(r"El usuario logueado es \*\*(.+?)\*\*"),
+    "$nombre_usuario": re.compile(r"\*\*([^*]+)\*\*\s+automáticamente"),
+}
+
+# Fragmentos de documentación del índice local de prueba
+DOCUMENTOS_POLITICA = [
+    "Documentos que necesito para el reembolso de medicinas: receta médica, boleta o factura.",
+    "Documentos que necesito para el reembolso de exámenes: orden médica, resultados, boleta o factura.",
+    "Documentos que necesito para el reembolso de consultas: boleta o factura e informe del médico.",
+    "Plazo para presentar una solicitud de reembolso: 60 días calendario desde la fecha del gasto.",
+    "Plazo de respuesta del área de reembolsos: 15 días hábiles desde el registro de la solicitud.",
+    "Solicitud observada: subsanar los documentos faltantes dentro de los 10 días siguientes.",
+    "Comprobantes de pago aceptados: boletas de venta y facturas electrónicas a nombre del asegurado titular; no se aceptan tickets ni proformas.",
+    "Gastos de dependientes: el titular puede pedir el reembolso de su cónyuge e hijos inscritos indicando el nombre del beneficiario.",
+    "Estados de una solicitud: Pendiente mientras se revisa, Observado si falta un documento o un dato, Aprobado o Rechazado.",
+]
+FUENTE_POLITICA = "politica_prueba.pdf"
+
+
+class _Latencia:
+    """Latencia artificial y contador de llamadas compartidos por los sustitutos."""
+
+    def __init__(self, latencia_s: float = 0.0):
+        self.latencia_s = latencia_s
+        self.llamadas = Counter()
+        self._lock = threading.Lock()
+
+    def contar(self, tipo: str):
+        with self._lock:
+            self.llamadas[tipo] += 1
+
+    def esperar(self):
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    async def aesperar(self):
+        if self.latencia_s:
+            await asyncio.sleep(self.latencia_s)
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.llamadas.values())
+
+    def reiniciar(self) -> Dict[str, int]:
+        with self._lock:
+            llamadas = dict(self.llamadas)
+            self.llamadas.clear()
+        return llamadas
+
+
+# --- LLM --- #
+class LimiteDeTasaFalso(Exception):
+    """Mismo aspecto que openai.RateLimitError para el planificador: status_code 429."""
+
+    status_code = 429
+
+
+class ModeloFalso(BaseChatModel):
+    """Modelo de chat determinista. `guion`: mensaje del usuario → {"herramienta": ..., "args": {...}}."""
+
+    guion: Dict[str, Dict[str, Any]] = {}
+    latencia_s: float = 0.0
+    model_name: str = "modelo-falso"
+    # Cantidad de llamadas (las primeras) que responden con un límite de tasa
+    errores_limite: int = 0
+
+    _contador: _Latencia = PrivateAttr(default=None)
+    _limites_pendientes: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context):
+        self._contador = _Latencia(self.latencia_s)
+        self._limites_pendientes = self.errores_limite
+
+    def limitar(self, cantidad: int):
+        """Las próximas `cantidad` llamadas fallan con LimiteDeTasaFalso."""
+        with self._contador._lock:
+            self._limites_pendientes = cantidad
+
+    def _quizas_limitar(self):
+        with self._contador._lock:
+            if self._limites_pendientes <= 0:
+                return
+            self._limites_pendientes -= 1
+        self._contador.contar("limite")
+        raise LimiteDeTasaFalso("Rate limit reached for requests (falso)")
+
+    @property
+    def _llm_type(self) -> str:
+        return "modelo_falso"
+
+    @property
+    def llamadas(self) -> Counter:
+        return self._contador.llamadas
+
+    def reiniciar(self) -> Dict[str, int]:
+        return self._contador.reiniciar()
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(herramientas=[convert_to_openai_tool(t)["function"]["name"] for t in tools], **kwargs)
+
+    # --- Respuestas --- #
+    @staticmethod
+    def _texto(mensaje) -> str:
+        return mensaje.content if isinstance(mensaje.content, str) else str(mensaje.content)
+
+    def _ruta(self, consulta: str) -> str:
+        paso = self.guion.get(consulta.strip())
+        if paso and paso.get("herramienta") != "busqueda_documental":
+            return "USUARIO_EXTERNO"
+        return "DOCUMENTACION"
+
+    def _resolver(self, valor, mensajes):
+        if not isinstance(valor, str) or not valor.startswith("$"):
+            return valor
+        if valor == "$ultima_solicitud":
+            for mensaje in reversed(mensajes):
+                codigos = PATRON_SOLICITUD.findall(self._texto(mensaje))
+                if codigos:
+                    return codigos[-1]
+            return ""
+        patron = PATRONES_PROMPT.get(valor)
+        sistema = next((self._texto(m) for m in mensajes if m.type == "system"), "")
+        encontrado = patron.search(sistema) if patron else None
+        return encontrado.group(1) if encontrado else valor
+
+    def _responder(self, mensajes, herramientas: Optional[List[str]]) -> Tuple[str, AIMessage]:
+        ultimo = self._texto(mensajes[-1])
+
+        if herramientas is None:
+            if "Última consulta del usuario:" in ultimo:
+                return "supervisor", AIMessage(content=self._ruta(ultimo.split("Última consulta del usuario:", 1)[1]))
+            if ultimo.startswith("Resume la siguiente conversación"):
+                return "resumen", AIMessage(content="- El usuario gestionó solicitudes de reembolso.")
+            sistema = self._texto(mensajes[0]) if mensajes[0].type == "system" else ""
+            if "Contexto recuperado:" in sistema:
+                # Respuesta directa de documentación (recuperación especulativa)
+                return "respuesta", AIMessage(content=f"Según la documentación: {sistema.split('Contexto recuperado:', 1)[1].strip()}")
+            return "respuesta", AIMessage(content="Entendido.")
+
+        if mensajes[-1].type == "tool":
+            return "respuesta", AIMessage(content=f"Listo. {ultimo}")
+
+        pregunta = next((self._texto(m) for m in reversed(mensajes) if m.type == "human"), "").strip()
+        paso = self.guion.get(pregunta) or {"herramienta": "busqueda_documental", "args": {"pregunta": pregunta}}
+        if paso["herramienta"] not in herramientas:
+            return "respuesta", AIMessage(content="No tengo una herramienta para atender ese pedido.")
+
+        numero = self._contador.total()
+        args = {nombre: self._resolver(valor, mensajes) for nombre, valor in paso["args"].items()}
+        return "herramienta", AIMessage(
+            content="",
+            tool_calls=[{"name": paso["herramienta"], "args": args, "id": f"llamada_{numero}", "type": "tool_call"}],
+        )
+
+    def _resultado(self, mensajes, herramientas) -> ChatResult:
+        tipo, mensaje = self._responder(mensajes, herramientas)
+        self._contador.contar(tipo)
+        entrada, salida = estimar_tokens(mensajes), estimar_tokens([mensaje])
+        mensaje.usage_metadata = {"input_tokens": entrada, "output_tokens": salida, "total_tokens": entrada + salida}
+        mensaje.response_metadata = {"model_name": self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    def _generate(self, messages, stop=None, run_manager=None, herramientas=None, **kwargs) -> ChatResult:
+        self._contador.esperar()
+        self._quizas_limitar()
+        return self._resultado(messages, herramientas)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, herramientas=None, **kwargs) -> ChatResult:
+        await self._contador.aesperar()
+        self._quizas_limitar()
+        return self._resultado(messages, herramientas)
+
+
+# --- Embeddings --- #
+class EmbeddingsFalsos(Embeddings):
+    """Bolsa de palabras con hashing en `dimension` posiciones, normalizada."""
+
+    def __init__(self, dimension: int = 256, latencia_s: float = 0.0):
+        self.dimension = dimension
+        self._contador = _Latencia(latencia_s)
+
+    @property
+    def llamadas(self) -> Counter:
+        return self._contador.llamadas
+
+    def reiniciar(self) -> Dict[str, int]:
+        return self._contador.reiniciar()
+
+    def _vector(self, texto: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in tokenizar(texto):
+            vector[zlib.crc32(token.encode("utf-8")) % self.dimension] += 1.0
+        norma = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norma for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._contador.contar("documentos")
+        self._contador.esperar()
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._contador.contar("consulta")
+        self._contador.esperar()
+        return self._vector(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self._contador.contar("consulta")
+        await self._contador.aesperar()
+        return self._vector(text)
+
+
+def crear_indice_local(destino: str, embeddings: Embeddings, documentos: List[str] = None) -> int:
+    """Escribe en `destino` un índice local con los fragmentos de política de prueba (uno por página)."""
+    documentos = documentos or DOCUMENTOS_POLITICA
+    vectores = embeddings.embed_documents(documentos)
+    return guardar_exportacion(
+        destino,
+        [{"id": f"doc_{i}", "text": texto, "metadata": {"source": FUENTE_POLITICA, "page": i}} for i, texto in enumerate(documentos)],
+        vectores,
+        dtype="float32",
+        version_ingesta="benchmark",
+    )
+
+
+# --- Base de datos --- #
+class RepositorioEnMemoria:
+    """Tabla `reembolsos` en memoria con la interfaz de RepositorioReembolsos."""
+
+    def __init__(self, latencia_s: float = 0.0):
+        self._filas: Dict[str, Solicitud] = {}
+        self._contadores: Counter = Counter()
+        self._lock = threading.Lock()
+        self._contador = _Latencia(latencia_s)
+
+    @property
+    def llamadas(self) -> Counter:
+        return self._contador.llamadas
+
+    def reiniciar(self) -> Dict[str, int]:
+        return self._contador.reiniciar()
+
+    def _operacion(self, tipo: str):
+        self._contador.contar(tipo)
+        self._contador.esperar()
+
+    def registrar(self, usuario: str, nomusuario: str, nombeneficiario: str, tipogasto: str,
+                  prefijo: str, monto: float, fecharegistro: datetime.date) -> Solicitud:
+        self._operacion("registrar")
+        with self._lock:
+            self._contadores[prefijo] += 1
+            solicitud = Solicitud(
+                n_solicitud=f"{prefijo}_{self._contadores[prefijo]:05d}",
+                usuario=usuario,
+                nomusuario=nomusuario,
+                nombeneficiario=nombeneficiario,
+                tipogasto=tipogasto,
+                monto=monto,
+                estado="Pendiente",
+                fecharegistro=fecharegistro,
+                fecharespuesta=None,
+                respuestaequipo="En revisión por el área de Reembolsos",
+            )
+            self._filas[solicitud.n_solicitud] = solicitud
+        return solicitud
+
+    def obtener(self, n_solicitud: str, usuario: str = None) -> Optional[Solicitud]:
+        self._operacion("obtener")
+        solicitud = self._filas.get(n_solicitud)
+        if solicitud is None or (usuario is not None and solicitud.usuario != usuario):
+            return None
+        return solicitud
+
+    def listar_por_usuario(self, usuario: str, limite: int = 20, estado: str = None,
+                           cursor: str = None) -> Tuple[List[Solicitud], Optional[str]]:
+        self._operacion("listar")
+        with self._lock:
+            propias = [s for s in self._filas.values() if s.usuario == usuario and (estado is None or s.estado == estado)]
+        propias.sort(key=lambda s: (s.fecharegistro, s.n_solicitud), reverse=True)
+        if cursor:
+            limite_superior = decodificar_cursor(cursor)
+            propias = [s for s in propias if (s.fecharegistro, s.n_solicitud) < limite_superior]
+        if len(propias) > limite:
+            return propias[:limite], codificar_cursor(propias[limite - 1])
+        return propias, None
+
+    def resumen(self, usuario: str = None) -> List[ResumenSolicitudes]:
+        self._operacion("resumen")
+        grupos: Dict[Tuple[str, str], List[float]] = {}
+        with self._lock:
+            for s in self._filas.values():
+                if usuario is None or s.usuario == usuario:
+                    grupo = grupos.setdefault((s.estado, s.tipogasto), [0, 0.0])
+                    grupo[0] += 1
+                    grupo[1] += s.monto
+        return [ResumenSolicitudes(estado, tipo, cantidad, monto) for (estado, tipo), (cantidad, monto) in sorted(grupos.items())]
+
+    def actualizar_estado(self, n_solicitud: str, estado: str, respuesta: str,
+                          fecharespuesta: datetime.date) -> Optional[Solicitud]:
+        self._operacion("actualizar")
+        with self._lock:
+            solicitud = self._filas.get(n_solicitud)
+            if solicitud is None:
+                return None
+            solicitud.estado, solicitud.respuestaequipo, solicitud.fecharespuesta = estado, respuesta, fecharespuesta
+            return solicitud
+
+    def actualizar_estado_masivo(self, estado: str, respuesta: str, fecharespuesta: datetime.date,
+                                 codigos: List[str] = None, estado_actual: str = None, prefijo: str = None,
+                                 maximo: int = 500) -> List[Solicitud]:
+        if not (codigos or estado_actual or prefijo):
+            raise ValueError("Indique al menos un filtro: códigos, estado actual o prefijo.")
+        self._operacion("actualizar_masivo")
+        with self._lock:
+            seleccion = [
+                s for s in self._filas.values()
+                if (not codigos or s.n_solicitud in codigos)
+                and (not estado_actual or s.estado == estado_actual)
+                and (not prefijo or s.n_solicitud.startswith(f"{prefijo}_"))
+            ]
+            if len(seleccion) > maximo:
+                raise LimiteActualizacionExcedido(f"La actualización afectaría {len(seleccion)} solicitudes (máximo {maximo}).")
+            for solicitud in seleccion:
+                solicitud.estado, solicitud.respuestaequipo, solicitud.fecharespuesta = estado, respuesta, fecharespuesta
+        return seleccion
+
+    def invalidar(self, n_solicitud: str):
+        pass
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {"repositorio": "memoria", "solicitudes": len(self._filas), "operaciones": dict(self.llamadas)}
@@ -0,0 +1,159 @@
+"""
+Benchmark offline de relevancia y latencia de busqueda_documental.
+
+Compara la búsqueda vectorial (k-NN con corte score > 0.7) con la híbrida (BM25 + vector con RRF)
+sobre un conjunto de preguntas grabadas. Cada línea del archivo JSONL tiene la pregunta y los chunks
+relevantes, identificados como en los metadatos de ingesta.py (archivo de origen y página desde 0):
+
+    {"pregunta": "...", "relevantes": [{"source": "procedimiento_reembolsos.pdf", "page": 3}, ...]}
+
+Si una página tiene varios chunks, "pasaje" (un texto del chunk) elige cuál. Por pregunta se mide
+recall@k (fracción de los chunks relevantes entre los k devueltos) y el rango recíproco del primero
+(MRR); se informan los promedios.
+
+benchmarks/preguntas_relevancia.jsonl está etiquetado sobre el índice de prueba de benchmarks/fakes.py
+(--indice-prueba, sin red). Para el índice real, --etiquetar lista los candidatos de ambos modos con su
+origen y página para escribir un JSONL propio:
+    python benchmarks/relevancia_busqueda.py --indice-prueba
+    python benchmarks/relevancia_busqueda.py --preguntas preguntas_reales.jsonl --k 3
+    python benchmarks/relevancia_busqueda.py --preguntas preguntas_reales.jsonl --etiquetar
+
+Con el índice real usa las mismas variables de entorno que app.py (VECTOR_BACKEND=local evita la red
+para la búsqueda).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from servicios.busqueda_hibrida import crear_recuperador_hibrido, tokenizar
+from servicios.cache_embeddings import EmbeddingsConCache
+
+
+def _normalizar(texto: str) -> str:
+    return " ".join(tokenizar(texto))
+
+
+def _crear_vector_store(embeddings):
+    if os.environ.get("VECTOR_BACKEND", "elasticsearch").lower() == "local":
+        from servicios.indice_local import IndiceVectorialLocal
+        return IndiceVectorialLocal(os.environ.get("INDICE_LOCAL_RUTA", "indice_local"), embeddings)
+
+    from langchain_elasticsearch import ElasticsearchStore
+    return ElasticsearchStore(
+        es_url=os.environ.get("ELASTIC_URL"),
+        es_user=os.environ.get("ELASTIC_USER"),
+        es_password=os.environ.get("ELASTIC_PASSWORD"),
+        index_name=os.environ.get("ELASTIC_INDEX"),
+        embedding=embeddings,
+    )
+
+
+def _crear_indice_prueba(directorio):
+    """Índice local con los fragmentos de benchmarks/fakes.py y embeddings falsos (sin red)."""
+    from benchmarks.fakes import EmbeddingsFalsos, crear_indice_local
+    from servicios.indice_local import IndiceVectorialLocal
+
+    embeddings = EmbeddingsConCache(EmbeddingsFalsos(), modelo="embeddings-falso")
+    crear_indice_local(directorio, embeddings)
+    return embeddings, IndiceVectorialLocal(directorio, embeddings)
+
+
+def _buscar_vector(vector_store, pregunta, k):
+    return [doc for doc, score in vector_store.similarity_search_with_score(pregunta, k=k) if score > 0.7]
+
+
+def _buscar_hibrida(recuperador, pregunta, k):
+    return [r.documento for r in recuperador.buscar(pregunta, k)]
+
+
+def _es_chunk(documento, etiqueta) -> bool:
+    metadatos = documento.metadata or {}
+    if os.path.basename(str(metadatos.get("source", ""))) != os.path.basename(etiqueta["source"]):
+        return False
+    if metadatos.get("page") != etiqueta["page"]:
+        return False
+    return "pasaje" not in etiqueta or _normalizar(etiqueta["pasaje"]) in _normalizar(documento.page_content)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def evaluar(nombre, buscar, preguntas, k):
+    recalls, reciprocos, latencias = [], [], []
+    for item in preguntas:
+        inicio = time.perf_counter()
+        documentos = buscar(item["pregunta"], k)[:k]
+        latencias.append(1000 * (time.perf_counter() - inicio))
+
+        relevantes = item["relevantes"]
+        encontrados = [e for e in relevantes if any(_es_chunk(d, e) for d in documentos)]
+        recalls.append(len(encontrados) / len(relevantes))
+        rango = next((i for i, d in enumerate(documentos, 1) if any(_es_chunk(d, e) for e in relevantes)), None)
+        reciprocos.append(1 / rango if rango else 0.0)
+
+    return {
+        "modo": nombre,
+        f"recall@{k}": round(statistics.mean(recalls), 3),
+        "mrr": round(statistics.mean(reciprocos), 3),
+        "latencia_p50_ms": round(statistics.median(latencias), 2),
+        "latencia_p95_ms": round(_percentil(latencias, 95), 2),
+    }
+
+
+def etiquetar(buscadores, preguntas, k):
+    """Candidatos de todos los modos por pregunta, con el identificador que espera el JSONL."""
+    for item in preguntas:
+        candidatos = {}
+        for nombre, buscar in buscadores.items():
+            for documento in buscar(item["pregunta"], k):
+                metadatos = documento.metadata or {}
+                clave = (metadatos.get("source"), metadatos.get("page"), documento.page_content[:120])
+                candidatos.setdefault(clave, []).append(nombre)
+        print(json.dumps({
+            "pregunta": item["pregunta"],
+            "candidatos": [
+                {"source": source, "page": page, "modos": modos, "texto": texto}
+                for (source, page, texto), modos in candidatos.items()
+            ],
+        }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preguntas", default=os.path.join(os.path.dirname(__file__), "preguntas_relevancia.jsonl"))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--indice-prueba", action="store_true", help="Índice de prueba de benchmarks/fakes.py (sin red).")
+    parser.add_argument("--etiquetar", action="store_true", help="Lista candidatos por pregunta en lugar de medir.")
+    args = parser.parse_args()
+
+    with open(args.preguntas, encoding="utf-8") as archivo:
+        preguntas = [json.loads(linea) for linea in archivo if linea.strip()]
+
+    if args.indice_prueba:
+        embeddings, vector_store = _crear_indice_prueba(tempfile.mkdtemp(prefix="relevancia_"))
+    else:
+        # Caché de embeddings: ambos modos reutilizan el mismo vector de consulta y la latencia mide solo la búsqueda
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = EmbeddingsConCache(OpenAIEmbeddings(model="text-embedding-3-large"), modelo="text-embedding-3-large")
+        vector_store = _crear_vector_store(embeddings)
+    recuperador = crear_recuperador_hibrido(vector_store, os.environ.get("ELASTIC_INDEX"))
+    for item in preguntas:
+        embeddings.embed_query(item["pregunta"])
+
+    buscadores = {
+        "vector": lambda p, k: _buscar_vector(vector_store, p, k),
+        "hibrida": lambda p, k: _buscar_hibrida(recuperador, p, k),
+    }
+    if args.etiquetar:
+        etiquetar(buscadores, preguntas, args.k)
+    else:
+        for nombre, buscar in buscadores.items():
+            print(json.dumps(evaluar(nombre, buscar, preguntas, args.k), ensure_ascii=False))
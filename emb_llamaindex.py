@@ -1,4 +1,5 @@
 import os
+import hashlib
 from llama_index.readers.wikipedia import WikipediaReader
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.elasticsearch import ElasticsearchStore
@@ -21,6 +22,10 @@ documents = reader.load_data(pages=["Seguro médico"])
 splitter = SentenceSplitter(chunk_size=512, chunk_overlap=50)
 nodes = splitter.get_nodes_from_documents(documents)
 
+# ID estable por contenido: re-ejecutar el script sobrescribe los mismos nodos en vez de duplicarlos
+for node in nodes:
+    node.id_ = hashlib.sha256(" ".join(node.get_content().split()).encode("utf-8")).hexdigest()
+
 # Embedding
 embed_model = OpenAIEmbedding(model="text-embedding-3-large")
 
@@ -0,0 +1,238 @@
+"""
+Ingesta incremental de la documentación de reembolsos en Elasticsearch (reemplaza a emb_langchain.py).
+
+- Lee un PDF o una carpeta de PDFs, extrayendo las páginas en paralelo con un pool de procesos.
+- Divide en chunks con los mismos parámetros de siempre (chunk_size=1000, chunk_overlap=200).
+- Identifica cada chunk por el hash de su fuente (ruta normalizada respecto de --raiz) y su contenido:
+  solo se calculan embeddings de los chunks nuevos o modificados, en lotes grandes, con concurrencia
+  y reintentos.
+- Hace upsert por ID estable, actualiza la página de los chunks que solo cambiaron de lugar y
+  elimina los que ya no existen en los documentos procesados.
+- Publica `_meta.version_ingesta` en el índice (la API lo usa para invalidar su caché semántica).
+
+Uso:
+    python ingesta.py --origen procedimiento_reembolsos.pdf
+    python ingesta.py --origen politicas/ --lote 256 --concurrencia 4 --exportar-local indice_local
+"""
+import os
+import glob
+import time
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+SEPARADORES = [
+    "\n## ",
+    "\n### ",
+    "\n\n",
+    "\n",
+    " "
+]
+
+# Páginas que procesa cada tarea del pool (abrir el PDF tiene un costo fijo por tarea)
+PAGINAS_POR_TAREA = 8
+
+
+def _credencial(variable: str, archivo: str) -> str:
+    """Variable de entorno o, como antes, el archivo de texto con la credencial."""
+    valor = os.environ.get(variable)
+    if not valor and os.path.exists(archivo):
+        with open(archivo) as f:
+            valor = f.read().strip()
+    return valor
+
+
+# --- 1. Extracción de páginas (en procesos) --- #
+def _contar_paginas(ruta: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(ruta).pages)
+
+
+def _extraer_paginas(ruta: str, inicio: int, fin: int) -> List[Tuple[str, int, str]]:
+    from pypdf import PdfReader
+    lector = PdfReader(ruta)
+    return [(ruta, num, lector.pages[num].extract_text() or "") for num in range(inicio, fin)]
+
+
+def extraer_paginas(rutas: List[str], procesos: int) -> List[Tuple[str, int, str]]:
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        totales = list(pool.map(_contar_paginas, rutas))
+        tareas = [
+            pool.submit(_extraer_paginas, ruta, inicio, min(inicio + PAGINAS_POR_TAREA, total))
+            for ruta, total in zip(rutas, totales)
+            for inicio in range(0, total, PAGINAS_POR_TAREA)
+        ]
+        paginas = [pagina for tarea in tareas for pagina in tarea.result()]
+    return paginas
+
+
+# --- 2. Chunking e identificadores por fuente y contenido --- #
+def normalizar_fuente(ruta: str, raiz: str) -> str:
+    """Ruta relativa a `raiz` con "/": ./docs/x.pdf y docs/x.pdf son la misma fuente."""
+    return os.path.relpath(os.path.abspath(ruta), os.path.abspath(raiz)).replace(os.sep, "/")
+
+
+def id_chunk(fuente: str, contenido: str) -> str:
+    # La fuente forma parte del ID: el mismo pasaje en dos documentos son dos chunks con su propia cita
+    return hashlib.sha256(f"{fuente}\n{' '.join(contenido.split())}".encode("utf-8")).hexdigest()
+
+
+def dividir_en_chunks(paginas: List[Tuple[str, int, str]], raiz: str) -> Dict[str, Document]:
+    """Devuelve los chunks indexados por el hash de fuente y contenido (los duplicados en una fuente se descartan)."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, separators=SEPARADORES, is_separator_regex=False)
+    documentos = [
+        Document(page_content=texto, metadata={"source": normalizar_fuente(ruta, raiz), "page": num})
+        for ruta, num, texto in paginas if texto.strip()
+    ]
+
+    chunks: Dict[str, Document] = {}
+    for chunk in splitter.split_documents(documentos):
+        chunks.setdefault(id_chunk(chunk.metadata["source"], chunk.page_content), chunk)
+    return chunks
+
+
+def ids_existentes(cliente, indice: str, fuentes: List[str], raiz: str) -> Dict[str, dict]:
+    """
+    IDs ya indexados de los documentos procesados → metadatos. La fuente guardada se normaliza igual
+    que la de los chunks, así que también aparecen los chunks indexados con otra forma de la ruta.
+    """
+    from elasticsearch.helpers import scan
+
+    if not cliente.indices.exists(index=indice):
+        return {}
+    fuentes = set(fuentes)
+    existentes = {}
+    for hit in scan(cliente, index=indice, query={"query": {"match_all": {}}}, _source=["metadata.source", "metadata.page"]):
+        metadatos = hit["_source"].get("metadata", {})
+        if metadatos.get("source") and normalizar_fuente(metadatos["source"], raiz) in fuentes:
+            existentes[hit["_id"]] = metadatos
+    return existentes
+
+
+def actualizar_metadatos(cliente, indice: str, chunks: Dict[str, Document], ids: List[str]) -> int:
+    """Reescribe fuente y página de chunks ya embebidos (el texto no cambió, el vector se conserva)."""
+    from elasticsearch.helpers import bulk
+
+    acciones = [
+        {"_op_type": "update", "_index": indice, "_id": i, "doc": {"metadata": chunks[i].metadata}}
+        for i in ids
+    ]
+    actualizados, _ = bulk(cliente, acciones, refresh=False)
+    return actualizados
+
+
+# --- 3. Embeddings por lotes con concurrencia y reintentos --- #
+def _embeber_con_reintentos(embedding, textos: List[str], reintentos: int) -> List[List[float]]:
+    for intento in range(reintentos + 1):
+        try:
+            return embedding.embed_documents(textos)
+        except Exception as e:
+            if intento == reintentos:
+                raise
+            espera = 2 ** intento
+            print(f"ADVERTENCIA: Falló el lote de embeddings ({e}). Reintento en {espera}s.")
+            time.sleep(espera)
+
+
+def indexar(vector_store, chunks: Dict[str, Document], ids_nuevos: List[str], lote: int, concurrencia: int, reintentos: int):
+    lotes = [ids_nuevos[i:i + lote] for i in range(0, len(ids_nuevos), lote)]
+
+    def procesar(ids_lote):
+        textos = [chunks[i].page_content for i in ids_lote]
+        vectores = _embeber_con_reintentos(vector_store.embeddings, textos, reintentos)
+        vector_store.add_embeddings(
+            list(zip(textos, vectores)),
+            metadatas=[chunks[i].metadata for i in ids_lote],
+            ids=ids_lote,
+            refresh_indices=False,
+        )
+        return len(ids_lote)
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        return sum(pool.map(procesar, lotes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de PDFs de políticas en Elasticsearch.")
+    parser.add_argument("--origen", default="procedimiento_reembolsos.pdf", help="PDF o carpeta con PDFs.")
+    parser.add_argument("--raiz", default=os.environ.get("INGESTA_RAIZ", "."),
+                        help="Carpeta respecto de la que se guarda la fuente de cada chunk (usar siempre la misma).")
+    parser.add_argument("--indice", default=os.environ.get("ELASTIC_INDEX", "reembolsos_001_urp"))
+    parser.add_argument("--lote", type=int, default=256, help="Chunks por llamada de embeddings.")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Lotes de embeddings en paralelo.")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Procesos para extraer páginas.")
+    parser.add_argument("--reintentos", type=int, default=3)
+    parser.add_argument("--exportar-local", default=None, help="Carpeta para exportar además el índice vectorial local.")
+    args = parser.parse_args()
+
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_elasticsearch import ElasticsearchStore
+
+    rutas = sorted(glob.glob(os.path.join(args.origen, "**", "*.pdf"), recursive=True)) if os.path.isdir(args.origen) else [args.origen]
+    if not rutas:
+        raise SystemExit(f"No se encontraron PDFs en '{args.origen}'.")
+
+    embedding = OpenAIEmbeddings(
+        model="text-embedding-3-large",
+        api_key=_credencial("OPENAI_API_KEY", "openai.txt"),
+        chunk_size=args.lote,
+    )
+    vector_store = ElasticsearchStore(
+        es_url=os.environ.get("ELASTIC_URL", "http://34.45.156.122:9200"),
+        es_user=os.environ.get("ELASTIC_USER", "elastic"),
+        es_password=_credencial("ELASTIC_PASSWORD", "elasticstore.txt"),
+        index_name=args.indice,
+        embedding=embedding,
+    )
+    cliente = vector_store.client
+
+    # 1. Extracción paralela de páginas
+    inicio = time.perf_counter()
+    paginas = extraer_paginas(rutas, args.procesos)
+    t_extraccion = time.perf_counter() - inicio
+
+    # 2. Chunks y diferencia contra lo ya indexado
+    inicio = time.perf_counter()
+    chunks = dividir_en_chunks(paginas, args.raiz)
+    existentes = ids_existentes(cliente, args.indice, [normalizar_fuente(r, args.raiz) for r in rutas], args.raiz)
+    ids_nuevos = [i for i in chunks if i not in existentes]
+    ids_obsoletos = [i for i in existentes if i not in chunks]
+    # Mismo chunk con otra página o la fuente guardada con otra forma de la ruta: solo cambian los metadatos
+    ids_movidos = [i for i in chunks if i in existentes and existentes[i] != chunks[i].metadata]
+    t_chunking = time.perf_counter() - inicio
+
+    # 3. Embeddings solo de lo nuevo + upsert por ID estable; 4. borrar chunks obsoletos
+    inicio = time.perf_counter()
+    indexados = indexar(vector_store, chunks, ids_nuevos, args.lote, args.concurrencia, args.reintentos) if ids_nuevos else 0
+    movidos = actualizar_metadatos(cliente, args.indice, chunks, ids_movidos) if ids_movidos else 0
+    if ids_obsoletos:
+        vector_store.delete(ids=ids_obsoletos, refresh_indices=False)
+    t_indexacion = time.perf_counter() - inicio
+
+    if indexados or movidos or ids_obsoletos:
+        cliente.indices.refresh(index=args.indice)
+        # Versión de ingesta: la API la usa para invalidar su caché semántica de respuestas
+        cliente.indices.put_mapping(
+            index=args.indice,
+            meta={"version_ingesta": datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+    if args.exportar_local:
+        from servicios.indice_local import exportar_desde_elasticsearch
+        exportar_desde_elasticsearch(cliente, args.indice, args.exportar_local)
+
+    total = t_extraccion + t_chunking + t_indexacion
+    print("Indexación finalizada.")
+    print(f"- PDFs: {len(rutas)} | páginas: {len(paginas)} ({len(paginas) / max(t_extraccion, 1e-9):.1f} páginas/s)")
+    print(f"- Chunks: {len(chunks)} ({len(chunks) / max(t_chunking, 1e-9):.1f} chunks/s)")
+    print(f"- Nuevos/modificados: {indexados} | sin cambios (embeddings ahorrados): {len(chunks) - len(ids_nuevos)}"
+          f" | metadatos actualizados: {movidos} | eliminados: {len(ids_obsoletos)}")
+    print(f"- Tiempo total: {total:.2f}s (extracción {t_extraccion:.2f}s, chunking {t_chunking:.2f}s, embeddings+indexación {t_indexacion:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
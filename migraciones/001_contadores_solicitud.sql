@@ -0,0 +1,28 @@
+-- Contadores por prefijo (MED, EXA, CON, OTR) para asignar n_solicitud en O(1) y sin carreras.
+-- Reemplaza el cálculo SELECT MAX(CAST(SUBSTRING(n_solicitud, 5) AS INTEGER)) sobre reembolsos.
+
+CREATE TABLE IF NOT EXISTS contadores_solicitud (
+    prefijo TEXT PRIMARY KEY,
+    ultimo INTEGER NOT NULL
+);
+
+-- Evita que se registren solicitudes con el esquema anterior mientras se siembran los contadores
+LOCK TABLE reembolsos IN SHARE ROW EXCLUSIVE MODE;
+
+-- Sembrar los contadores con el último número existente de cada prefijo
+INSERT INTO contadores_solicitud (prefijo, ultimo)
+SELECT SUBSTRING("n_solicitud", 1, 3), MAX(CAST(SUBSTRING("n_solicitud", 5) AS INTEGER))
+FROM reembolsos
+WHERE "n_solicitud" ~ '^[A-Z]{3}_[0-9]+$'
+GROUP BY 1
+ON CONFLICT (prefijo) DO UPDATE SET ultimo = GREATEST(contadores_solicitud.ultimo, EXCLUDED.ultimo);
+
+-- Garantía de unicidad de n_solicitud (si ya hay duplicados, se avisa y hay que depurarlos a mano)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM reembolsos GROUP BY "n_solicitud" HAVING COUNT(*) > 1) THEN
+        RAISE WARNING 'reembolsos tiene n_solicitud duplicados: no se creó el índice único reembolsos_n_solicitud_uidx.';
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS reembolsos_n_solicitud_uidx ON reembolsos ("n_solicitud");
+    END IF;
+END $$;
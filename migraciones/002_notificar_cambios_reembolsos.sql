@@ -0,0 +1,18 @@
+-- Notifica por el canal 'reembolsos_cambios' cada solicitud modificada o eliminada, para que las
+-- instancias de la API invaliden su caché de solicitudes aunque el cambio venga de otro sistema.
+-- NOTIFY es transaccional: el aviso llega recién cuando el cambio se confirma.
+
+CREATE OR REPLACE FUNCTION notificar_cambio_reembolso() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('reembolsos_cambios', OLD."n_solicitud");
+    IF TG_OP = 'UPDATE' AND NEW."n_solicitud" IS DISTINCT FROM OLD."n_solicitud" THEN
+        PERFORM pg_notify('reembolsos_cambios', NEW."n_solicitud");
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS reembolsos_notificar_cambios ON reembolsos;
+CREATE TRIGGER reembolsos_notificar_cambios
+AFTER UPDATE OR DELETE ON reembolsos
+FOR EACH ROW EXECUTE FUNCTION notificar_cambio_reembolso();
@@ -0,0 +1,113 @@
+-- Listado paginado por usuario y resumen por estado/tipo de gasto sin recorrer reembolsos.
+--
+-- 1. Índices para la paginación por cursor (keyset) sobre (usuario, fecharegistro, n_solicitud):
+--    cada página es un rango del índice, su costo no depende de cuántas páginas se saltaron.
+-- 2. Agregados mantenidos por triggers: cantidad y monto por (usuario, estado, tipogasto) y
+--    globales por (estado, tipogasto). Los triggers son por sentencia (tablas de transición), así una
+--    actualización masiva aplica un solo UPSERT por grupo, y las filas se bloquean siempre en el
+--    mismo orden (ORDER BY de la clave) para que dos transacciones concurrentes no se bloqueen mutuamente.
+--
+-- Requiere PostgreSQL 10 o superior. Los índices se crean dentro de la transacción de la migración
+-- (bloquean escrituras mientras se construyen); en tablas muy grandes conviene crearlos antes a mano
+-- con CREATE INDEX CONCURRENTLY y los mismos nombres: aquí se omiten si ya existen.
+
+CREATE INDEX IF NOT EXISTS reembolsos_usuario_fecha_idx
+    ON reembolsos ("usuario", fecharegistro DESC, "n_solicitud" DESC);
+
+CREATE INDEX IF NOT EXISTS reembolsos_usuario_estado_fecha_idx
+    ON reembolsos ("usuario", estado, fecharegistro DESC, "n_solicitud" DESC);
+
+CREATE TABLE IF NOT EXISTS resumen_reembolsos_usuario (
+    usuario TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    tipogasto TEXT NOT NULL,
+    cantidad BIGINT NOT NULL DEFAULT 0,
+    monto_total NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (usuario, estado, tipogasto)
+);
+
+CREATE TABLE IF NOT EXISTS resumen_reembolsos (
+    estado TEXT NOT NULL,
+    tipogasto TEXT NOT NULL,
+    cantidad BIGINT NOT NULL DEFAULT 0,
+    monto_total NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (estado, tipogasto)
+);
+
+CREATE OR REPLACE FUNCTION actualizar_resumen_reembolsos() RETURNS trigger AS $$
+DECLARE
+    cambios TEXT;
+BEGIN
+    -- Deltas de la sentencia: +1/+monto por fila nueva, -1/-monto por fila anterior
+    cambios := CASE TG_OP
+        WHEN 'INSERT' THEN
+            'SELECT "usuario", estado, tipogasto, 1 AS cantidad, monto FROM nuevas'
+        WHEN 'DELETE' THEN
+            'SELECT "usuario", estado, tipogasto, -1 AS cantidad, -monto AS monto FROM anteriores'
+        ELSE
+            'SELECT "usuario", estado, tipogasto, 1 AS cantidad, monto FROM nuevas
+             UNION ALL
+             SELECT "usuario", estado, tipogasto, -1, -monto FROM anteriores'
+    END;
+
+    EXECUTE format($sql$
+        INSERT INTO resumen_reembolsos_usuario AS r (usuario, estado, tipogasto, cantidad, monto_total)
+        SELECT COALESCE("usuario", ''), COALESCE(estado, ''), COALESCE(tipogasto, ''), SUM(cantidad), COALESCE(SUM(monto), 0)
+        FROM (%s) AS c
+        GROUP BY 1, 2, 3
+        HAVING SUM(cantidad) <> 0 OR COALESCE(SUM(monto), 0) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (usuario, estado, tipogasto) DO UPDATE
+        SET cantidad = r.cantidad + EXCLUDED.cantidad,
+            monto_total = r.monto_total + EXCLUDED.monto_total
+    $sql$, cambios);
+
+    EXECUTE format($sql$
+        INSERT INTO resumen_reembolsos AS r (estado, tipogasto, cantidad, monto_total)
+        SELECT COALESCE(estado, ''), COALESCE(tipogasto, ''), SUM(cantidad), COALESCE(SUM(monto), 0)
+        FROM (%s) AS c
+        GROUP BY 1, 2
+        HAVING SUM(cantidad) <> 0 OR COALESCE(SUM(monto), 0) <> 0
+        ORDER BY 1, 2
+        ON CONFLICT (estado, tipogasto) DO UPDATE
+        SET cantidad = r.cantidad + EXCLUDED.cantidad,
+            monto_total = r.monto_total + EXCLUDED.monto_total
+    $sql$, cambios);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Sin escrituras mientras se siembran los agregados y se instalan los triggers
+LOCK TABLE reembolsos IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS reembolsos_resumen_insert ON reembolsos;
+CREATE TRIGGER reembolsos_resumen_insert
+AFTER INSERT ON reembolsos
+REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION actualizar_resumen_reembolsos();
+
+DROP TRIGGER IF EXISTS reembolsos_resumen_update ON reembolsos;
+CREATE TRIGGER reembolsos_resumen_update
+AFTER UPDATE ON reembolsos
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION actualizar_resumen_reembolsos();
+
+DROP TRIGGER IF EXISTS reembolsos_resumen_delete ON reembolsos;
+CREATE TRIGGER reembolsos_resumen_delete
+AFTER DELETE ON reembolsos
+REFERENCING OLD TABLE AS anteriores
+FOR EACH STATEMENT EXECUTE FUNCTION actualizar_resumen_reembolsos();
+
+-- Siembra (único recorrido completo de reembolsos)
+TRUNCATE resumen_reembolsos_usuario, resumen_reembolsos;
+
+INSERT INTO resumen_reembolsos_usuario (usuario, estado, tipogasto, cantidad, monto_total)
+SELECT COALESCE("usuario", ''), COALESCE(estado, ''), COALESCE(tipogasto, ''), COUNT(*), COALESCE(SUM(monto), 0)
+FROM reembolsos
+GROUP BY 1, 2, 3;
+
+INSERT INTO resumen_reembolsos (estado, tipogasto, cantidad, monto_total)
+SELECT estado, tipogasto, SUM(cantidad), SUM(monto_total)
+FROM resumen_reembolsos_usuario
+GROUP BY 1, 2;
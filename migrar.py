@@ -0,0 +1,40 @@
+"""
+Aplica en orden las migraciones SQL de la carpeta migraciones/ (cada una una sola vez).
+
+Uso:
+    POSTGRES_URI=postgresql://... python migrar.py
+"""
+import os
+import glob
+
+import psycopg
+
+CARPETA_MIGRACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migraciones")
+
+
+def aplicar_migraciones(conninfo: str):
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS migraciones_aplicadas (
+                nombre TEXT PRIMARY KEY,
+                aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        aplicadas = {fila[0] for fila in conn.execute("SELECT nombre FROM migraciones_aplicadas")}
+
+        for ruta in sorted(glob.glob(os.path.join(CARPETA_MIGRACIONES, "*.sql"))):
+            nombre = os.path.basename(ruta)
+            if nombre in aplicadas:
+                continue
+            with open(ruta, encoding="utf-8") as archivo:
+                sql = archivo.read()
+            # Cada migración se aplica en su propia transacción junto con su registro
+            with conn.transaction():
+                conn.execute(sql)
+                conn.execute("INSERT INTO migraciones_aplicadas (nombre) VALUES (%s)", (nombre,))
+            print(f"Migración aplicada: {nombre}")
+
+
+if __name__ == "__main__":
+    aplicar_migraciones(os.environ["POSTGRES_URI"])
+    print("Migraciones al día.")
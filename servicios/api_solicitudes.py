@@ -0,0 +1,162 @@
+"""
+API REST directa para las operaciones estructuradas sobre solicitudes (sin LLM).
+
+El frontend ya tiene formularios para registrar, consultar y actualizar: estas rutas llaman a la misma
+lógica que usan las herramientas del agente, con las mismas reglas por rol (servicios/permisos.py),
+y responden en una sola ida y vuelta a la BD en lugar de un turno de chat con supervisor y ReAct.
+
+La identidad llega igual que en /agent (user_role, username, display_name) por JSON o query string.
+"""
+from flask import Blueprint, jsonify, request
+
+from servicios import permisos
+from servicios.permisos import AccesoDenegado
+from tools.registrar_solicitud import registrar_solicitud
+from tools.consultar_estado import consultar_solicitud
+from tools.listar_solicitudes import listar_solicitudes, resumen_solicitudes, totales_por_estado
+from tools.actualizar_solicitud import actualizar_solicitud
+
+LIMITE_LISTADO_MAXIMO = 100
+
+
+def _datos():
+    if request.method in ("POST", "PATCH"):
+        return request.get_json(silent=True) or request.args
+    return request.args
+
+
+def _identidad(datos):
+    return datos.get('user_role', 'General'), datos.get('username'), datos.get('display_name')
+
+
+def _error(mensaje: str, codigo: int, detalle: str = None):
+    cuerpo = {"status": "error", "response": mensaje}
+    if detalle is not None:
+        cuerpo["error_detail"] = detalle
+    return jsonify(cuerpo), codigo
+
+
+def crear_api_solicitudes(repositorio) -> Blueprint:
+    """Blueprint con las rutas /solicitudes sobre el repositorio dado (None = BD no disponible)."""
+    api = Blueprint("api_solicitudes", __name__)
+
+    @api.errorhandler(AccesoDenegado)
+    def _acceso_denegado(e):
+        return _error(str(e), 403)
+
+    @api.errorhandler(ValueError)
+    def _datos_invalidos(e):
+        return _error(str(e), 400)
+
+    @api.before_request
+    def _exigir_repositorio():
+        if repositorio is None:
+            return _error("La base de datos SQL no está disponible.", 503)
+
+    @api.route('/solicitudes', methods=['POST'])
+    def registrar():
+        """Cuerpo JSON: user_role, username, display_name, tipo_gasto, monto y nombre_beneficiario (opcional)."""
+        datos = _datos()
+        rol, username, display_name = _identidad(datos)
+        permisos.exigir(rol, "registrar_solicitud")
+        if not username or not display_name:
+            raise ValueError("Faltan username o display_name.")
+
+        try:
+            solicitud = registrar_solicitud(
+                repositorio, username, display_name, datos.get('tipo_gasto'), datos.get('monto'),
+                datos.get('nombre_beneficiario'),
+            )
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error al registrar solicitud (API): {e}")
+            return _error("Error al registrar la solicitud.", 500, str(e))
+        return jsonify({"status": "success", "solicitud": solicitud.a_dict()}), 201
+
+    @api.route('/solicitudes/<n_solicitud>', methods=['GET'])
+    def consultar(n_solicitud):
+        rol, username, _ = _identidad(_datos())
+        usuario = permisos.usuario_de_consulta(rol, username)
+        try:
+            solicitud = consultar_solicitud(repositorio, n_solicitud, usuario)
+        except Exception as e:
+            print(f"Error al consultar solicitud (API): {e}")
+            return _error("Error al consultar la solicitud.", 500, str(e))
+        if solicitud is None:
+            return _error(f"No se encontró la solicitud {n_solicitud}.", 404)
+        return jsonify({"status": "success", "solicitud": solicitud.a_dict()})
+
+    @api.route('/solicitudes', methods=['GET'])
+    def listar():
+        """
+        Página de solicitudes de `username` (el Administrador puede indicar otro con `usuario`),
+        filtrable por `estado`. `siguiente_cursor` se envía como `cursor` para pedir la página siguiente.
+        """
+        datos = _datos()
+        rol, username, _ = _identidad(datos)
+        usuario = permisos.usuario_de_consulta(rol, username, datos.get('usuario'), "listar_solicitudes") or username
+        if not usuario:
+            raise ValueError("Falta username.")
+        try:
+            limite = min(max(int(datos.get('limite', 20)), 1), LIMITE_LISTADO_MAXIMO)
+        except ValueError:
+            raise ValueError("El límite debe ser un número entero.")
+
+        try:
+            solicitudes, siguiente = listar_solicitudes(repositorio, usuario, limite, datos.get('estado'), datos.get('cursor'))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error al listar solicitudes (API): {e}")
+            return _error("Error al listar las solicitudes.", 500, str(e))
+        return jsonify({
+            "status": "success",
+            "usuario": usuario,
+            "solicitudes": [s.a_dict() for s in solicitudes],
+            "siguiente_cursor": siguiente,
+        })
+
+    @api.route('/solicitudes/resumen', methods=['GET'])
+    def resumen():
+        """
+        Cantidad y monto por estado y tipo de gasto. El rol General ve los suyos; el Administrador,
+        los globales o los de `usuario`.
+        """
+        datos = _datos()
+        rol, username, _ = _identidad(datos)
+        usuario = permisos.usuario_de_consulta(rol, username, datos.get('usuario'), "resumen_solicitudes")
+        try:
+            filas = resumen_solicitudes(repositorio, usuario)
+        except Exception as e:
+            print(f"Error al consultar el resumen de solicitudes (API): {e}")
+            return _error("Error al consultar el resumen.", 500, str(e))
+        return jsonify({
+            "status": "success",
+            "usuario": usuario,
+            "por_estado": {
+                estado: {"cantidad": cantidad, "monto_total": monto}
+                for estado, (cantidad, monto) in totales_por_estado(filas).items()
+            },
+            "detalle": [f.a_dict() for f in filas],
+        })
+
+    @api.route('/solicitudes/<n_solicitud>/estado', methods=['PATCH', 'POST'])
+    def actualizar(n_solicitud):
+        """Cuerpo JSON: user_role, nuevo_estado y nueva_respuesta."""
+        datos = _datos()
+        rol, _, _ = _identidad(datos)
+        permisos.exigir(rol, "actualizar_solicitud")
+
+        try:
+            solicitud = actualizar_solicitud(repositorio, n_solicitud, datos.get('nuevo_estado'), datos.get('nueva_respuesta', ''))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error al actualizar solicitud (API): {e}")
+            return _error("Error al actualizar la solicitud.", 500, str(e))
+        if solicitud is None:
+            return _error(f"No se encontró la solicitud {n_solicitud}.", 404)
+        return jsonify({"status": "success", "solicitud": solicitud.a_dict()})
+
+    return api
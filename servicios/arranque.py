@@ -0,0 +1,159 @@
+"""
+Arranque de la API: inicializa los componentes externos en paralelo, con un timeout por componente,
+y registra cuánto tardó cada fase (se expone en /ready y /stats).
+
+Los componentes se pueden inyectar antes de importar `app` (benchmarks offline, pruebas locales):
+
+    from servicios import arranque
+    arranque.inyectar(modelo=ModeloFalso(), embeddings=EmbeddingsFalsos(), repositorio=RepositorioEnMemoria())
+    import app
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TimeoutFuturo
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+OMITIDO = "omitido"
+INYECTADO = "inyectado"
+PENDIENTE = "pendiente"
+
+_INYECTADOS: Dict[str, Any] = {}
+
+
+def inyectar(**componentes):
+    """Reemplaza componentes por nombre (modelo, embeddings, vector_store, pool, repositorio, checkpointer, ...)."""
+    _INYECTADOS.update(componentes)
+
+
+def inyectado(nombre: str) -> bool:
+    return nombre in _INYECTADOS
+
+
+def obtener_inyectado(nombre: str) -> Any:
+    return _INYECTADOS.get(nombre)
+
+
+class Arranque:
+    """Estado y tiempos del arranque de la instancia."""
+
+    def __init__(self, timeout_por_defecto_s: float = None):
+        self.timeout_por_defecto_s = timeout_por_defecto_s or float(os.environ.get("ARRANQUE_TIMEOUT_S", "20"))
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self.fases: Dict[str, Dict[str, Any]] = {}
+        self.listo = False
+        self.duracion_total_s: Optional[float] = None
+
+    def _registrar(self, nombre: str, estado: str, duracion_s: float, detalle: str = None):
+        with self._lock:
+            self.fases[nombre] = {"estado": estado, "duracion_s": round(duracion_s, 3)}
+            if detalle:
+                self.fases[nombre]["detalle"] = detalle
+
+    @contextmanager
+    def fase(self, nombre: str):
+        """Fase secuencial: solo mide su duración (los errores los maneja quien la ejecuta)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._registrar(nombre, ERROR, time.perf_counter() - inicio, str(e))
+            raise
+        self._registrar(nombre, OK, time.perf_counter() - inicio)
+
+    def en_paralelo(self, componentes: Dict[str, Callable[[], Any]], timeouts: Dict[str, float] = None) -> Dict[str, Any]:
+        """
+        Ejecuta los inicializadores a la vez. Devuelve nombre → componente; None si falló, agotó su
+        timeout o no está configurado (el inicializador devuelve None). Los inyectados no se inicializan.
+        """
+        timeouts = timeouts or {}
+        resultados: Dict[str, Any] = {}
+        pendientes = {}
+        ejecutor = ThreadPoolExecutor(max_workers=max(1, len(componentes)), thread_name_prefix="arranque")
+        for nombre, inicializar in componentes.items():
+            if inyectado(nombre):
+                resultados[nombre] = obtener_inyectado(nombre)
+                self._registrar(nombre, INYECTADO, 0.0)
+                continue
+            pendientes[nombre] = (ejecutor.submit(self._medir, nombre, inicializar), time.perf_counter())
+
+        for nombre, (futuro, inicio) in pendientes.items():
+            limite = timeouts.get(nombre, self.timeout_por_defecto_s)
+            restante = max(0.0, limite - (time.perf_counter() - inicio))
+            try:
+                resultados[nombre] = futuro.result(timeout=restante)
+            except TimeoutFuturo:
+                # El hilo sigue en segundo plano, pero el componente queda deshabilitado en esta instancia:
+                # si llega a construirse se cierra (p. ej. el pool de PostgreSQL)
+                print(f"ERROR: '{nombre}' no se inicializó en {limite:.0f}s. Se continúa sin ese componente.")
+                self._registrar(nombre, TIMEOUT, limite)
+                futuro.add_done_callback(lambda f, nombre=nombre: self._descartar(nombre, f))
+                resultados[nombre] = None
+            except Exception as e:
+                print(f"ERROR: Fallo al inicializar '{nombre}'. Detalle: {e}")
+                resultados[nombre] = None
+        ejecutor.shutdown(wait=False)
+        return resultados
+
+    def _medir(self, nombre: str, inicializar: Callable[[], Any]) -> Any:
+        inicio = time.perf_counter()
+        try:
+            componente = inicializar()
+        except Exception as e:
+            self._registrar(nombre, ERROR, time.perf_counter() - inicio, str(e))
+            raise
+        with self._lock:
+            # Un componente que agotó su timeout sigue deshabilitado aunque termine después
+            if self.fases.get(nombre, {}).get("estado") == TIMEOUT:
+                return componente
+        self._registrar(nombre, OK if componente is not None else OMITIDO, time.perf_counter() - inicio)
+        return componente
+
+    @staticmethod
+    def _descartar(nombre: str, futuro):
+        """Cierra lo que un inicializador construyó después de su timeout (nadie más lo va a usar)."""
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        componente = futuro.result()
+        cerrar = getattr(componente, "close", None)
+        if componente is None or not callable(cerrar):
+            return
+        try:
+            cerrar()
+            print(f"'{nombre}' terminó de inicializarse después de su timeout; se cerró sin usarse.")
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo cerrar '{nombre}' inicializado tarde. Detalle: {e}")
+
+    def en_segundo_plano(self, nombre: str, tarea: Callable[[], Any], al_terminar: Callable[[], None] = None):
+        """Fase que no bloquea el arranque (p. ej. precompilar grafos); `listo` queda en True al terminar."""
+        self._registrar(nombre, PENDIENTE, 0.0)
+
+        def ejecutar():
+            try:
+                with self.fase(nombre):
+                    tarea()
+            except Exception as e:
+                print(f"ERROR: Falló la fase de arranque '{nombre}'. Detalle: {e}")
+            finally:
+                if al_terminar:
+                    al_terminar()
+
+        threading.Thread(target=ejecutar, name=f"arranque_{nombre}", daemon=True).start()
+
+    def marcar_listo(self):
+        with self._lock:
+            self.listo = True
+            self.duracion_total_s = round(time.perf_counter() - self._inicio, 3)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "listo": self.listo,
+                "duracion_total_s": self.duracion_total_s,
+                "fases": {nombre: dict(datos) for nombre, datos in self.fases.items()},
+            }
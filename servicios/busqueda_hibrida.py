@@ -0,0 +1,201 @@
+import os
+import re
+import math
+import asyncio
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Palabras vacías frecuentes en las preguntas; no aportan a la búsqueda léxica
+PALABRAS_VACIAS = {
+    "a", "al", "como", "con", "cual", "cuales", "cuando", "de", "del", "el", "en", "es", "esta", "hay",
+    "la", "las", "lo", "los", "me", "mi", "mis", "o", "para", "pero", "por", "que", "se", "si", "sin",
+    "su", "sus", "un", "una", "uno", "y", "ya", "debo", "puedo", "tengo",
+}
+
+_EJECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="busqueda_hibrida")
+
+
+def tokenizar(texto: str) -> List[str]:
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return [t for t in re.findall(r"[a-z0-9_]+", texto) if t not in PALABRAS_VACIAS]
+
+
+def fusion_rrf(rankings: List[List[str]], k_rrf: int = 60) -> Dict[str, float]:
+    """Reciprocal Rank Fusion: suma 1 / (k + posición) de cada lista en la que aparece el documento."""
+    puntajes: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for posicion, doc_id in enumerate(ranking, start=1):
+            puntajes[doc_id] += 1.0 / (k_rrf + posicion)
+    return puntajes
+
+
+@dataclass
+class ResultadoBusqueda:
+    documento: Document
+    score_rrf: float
+    score_vector: Optional[float] = None
+    score_lexico: Optional[float] = None
+
+
+class RecuperadorHibrido:
+    """
+    Búsqueda híbrida: consulta léxica (BM25) y vectorial (kNN) fusionadas con RRF.
+    Las subclases implementan `_candidatos`, que devuelve ambas listas ordenadas.
+    """
+
+    def __init__(self, top_k: int = None, candidatos: int = None, k_rrf: int = None, umbral_vector: float = 0.7):
+        self.top_k = top_k or int(os.environ.get("BUSQUEDA_TOP_K", "3"))
+        self.candidatos = candidatos or int(os.environ.get("BUSQUEDA_CANDIDATOS", "20"))
+        self.k_rrf = k_rrf or int(os.environ.get("BUSQUEDA_RRF_K", "60"))
+        self.umbral_vector = umbral_vector
+
+    def _candidatos(self, pregunta: str) -> Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]:
+        raise NotImplementedError
+
+    def buscar(self, pregunta: str, k: int = None) -> List[ResultadoBusqueda]:
+        lexicos, vectoriales = self._candidatos(pregunta)
+        return self._fusionar(lexicos, vectoriales, k or self.top_k)
+
+    async def abuscar(self, pregunta: str, k: int = None) -> List[ResultadoBusqueda]:
+        return await asyncio.to_thread(self.buscar, pregunta, k)
+
+    def _fusionar(self, lexicos, vectoriales, k: int) -> List[ResultadoBusqueda]:
+        documentos, score_lexico, score_vector = {}, {}, {}
+        for doc, score in lexicos:
+            documentos[doc.id] = doc
+            score_lexico[doc.id] = score
+        for doc, score in vectoriales:
+            documentos.setdefault(doc.id, doc)
+            score_vector[doc.id] = score
+
+        puntajes = fusion_rrf([[d.id for d, _ in lexicos], [d.id for d, _ in vectoriales]], self.k_rrf)
+        resultados = []
+        for doc_id, score_rrf in sorted(puntajes.items(), key=lambda x: x[1], reverse=True):
+            # Se conserva el corte semántico original, pero una coincidencia léxica también cuenta como relevante
+            if doc_id not in score_lexico and score_vector.get(doc_id, 0.0) <= self.umbral_vector:
+                continue
+            resultados.append(ResultadoBusqueda(
+                documento=documentos[doc_id],
+                score_rrf=score_rrf,
+                score_vector=score_vector.get(doc_id),
+                score_lexico=score_lexico.get(doc_id),
+            ))
+            if len(resultados) == k:
+                break
+        return resultados
+
+
+class RecuperadorHibridoElasticsearch(RecuperadorHibrido):
+    """Ejecuta la consulta BM25 y la kNN en una sola petición `_msearch` y fusiona en el cliente."""
+
+    def __init__(self, cliente, indice: str, embeddings, minimo_coincidencia: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cliente = cliente
+        self.indice = indice
+        self.embeddings = embeddings
+        self.minimo_coincidencia = minimo_coincidencia or os.environ.get("BUSQUEDA_LEXICA_MINIMO", "40%")
+
+    @staticmethod
+    def _documento(hit) -> Document:
+        fuente = hit["_source"]
+        return Document(page_content=fuente.get("text", ""), metadata=fuente.get("metadata", {}), id=hit["_id"])
+
+    def _candidatos(self, pregunta: str):
+        vector = self.embeddings.embed_query(pregunta)
+        cabecera = {"index": self.indice}
+        campos = ["text", "metadata"]
+        busquedas = [
+            cabecera,
+            {
+                "size": self.candidatos,
+                "_source": campos,
+                "query": {"match": {"text": {"query": pregunta, "minimum_should_match": self.minimo_coincidencia}}},
+            },
+            cabecera,
+            {
+                "size": self.candidatos,
+                "_source": campos,
+                "knn": {
+                    "field": "vector",
+                    "query_vector": vector,
+                    "k": self.candidatos,
+                    "num_candidates": max(100, self.candidatos * 5),
+                },
+            },
+        ]
+        respuesta = self.cliente.msearch(searches=busquedas)
+        respuesta = getattr(respuesta, "body", respuesta)
+        lexica, vectorial = respuesta["responses"]
+        return (
+            [(self._documento(h), float(h["_score"])) for h in lexica.get("hits", {}).get("hits", [])],
+            [(self._documento(h), float(h["_score"])) for h in vectorial.get("hits", {}).get("hits", [])],
+        )
+
+
+class IndiceBM25:
+    """Índice BM25 en memoria sobre los textos de un índice vectorial local."""
+
+    def __init__(self, textos: List[str], k1: float = 1.5, b: float = 0.75, minimo_coincidencia: float = 0.4):
+        self.k1, self.b, self.minimo_coincidencia = k1, b, minimo_coincidencia
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._longitudes = []
+        for posicion, texto in enumerate(textos):
+            tokens = tokenizar(texto)
+            self._longitudes.append(len(tokens))
+            for termino, frecuencia in Counter(tokens).items():
+                self._postings[termino].append((posicion, frecuencia))
+        total = len(self._longitudes)
+        self._longitud_media = (sum(self._longitudes) / total) if total else 0.0
+        self._idf = {
+            termino: math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5))
+            for termino, p in self._postings.items()
+        }
+
+    def buscar(self, consulta: str, k: int) -> List[Tuple[int, float]]:
+        terminos = set(tokenizar(consulta))
+        if not terminos:
+            return []
+        puntajes: Dict[int, float] = defaultdict(float)
+        coincidencias: Dict[int, int] = defaultdict(int)
+        for termino in terminos:
+            for posicion, frecuencia in self._postings.get(termino, ()):
+                normalizacion = self.k1 * (1 - self.b + self.b * self._longitudes[posicion] / self._longitud_media)
+                puntajes[posicion] += self._idf[termino] * frecuencia * (self.k1 + 1) / (frecuencia + normalizacion)
+                coincidencias[posicion] += 1
+        minimo = max(1, math.ceil(self.minimo_coincidencia * len(terminos)))
+        candidatos = [(p, s) for p, s in puntajes.items() if coincidencias[p] >= minimo]
+        return sorted(candidatos, key=lambda x: x[1], reverse=True)[:k]
+
+
+class RecuperadorHibridoLocal(RecuperadorHibrido):
+    """Sobre el índice local: BM25 en un hilo mientras se calcula el embedding de la consulta."""
+
+    def __init__(self, indice_local, **kwargs):
+        super().__init__(**kwargs)
+        self.indice_local = indice_local
+        minimo = os.environ.get("BUSQUEDA_LEXICA_MINIMO", "40%").rstrip("%")
+        self.bm25 = IndiceBM25(indice_local.textos(), minimo_coincidencia=float(minimo) / 100)
+
+    def _candidatos(self, pregunta: str):
+        futuro_lexico = _EJECUTOR.submit(self.bm25.buscar, pregunta, self.candidatos)
+        vectoriales = self.indice_local.buscar_por_vector(self.indice_local.embedding.embed_query(pregunta), self.candidatos)
+        lexicos = futuro_lexico.result()
+        return (
+            [(self.indice_local.documento(p), s) for p, s in lexicos],
+            [(self.indice_local.documento(p), s) for p, s in vectoriales],
+        )
+
+
+def crear_recuperador_hibrido(vector_store, indice: str = None) -> RecuperadorHibrido:
+    """Devuelve el recuperador híbrido adecuado al backend del vector store."""
+    from servicios.indice_local import IndiceVectorialLocal
+
+    if isinstance(vector_store, IndiceVectorialLocal):
+        return RecuperadorHibridoLocal(vector_store)
+    return RecuperadorHibridoElasticsearch(vector_store.client, indice, vector_store.embeddings)
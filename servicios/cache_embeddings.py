@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from servicios.cache_lru import CacheLRU
+from servicios.metricas import EMBEDDINGS_DURACION
+
+# Nivel compartido en PostgreSQL: permite reutilizar vectores entre workers e instancias
+SQL_CREAR_TABLA = """
+CREATE TABLE IF NOT EXISTS cache_embeddings (
+    clave TEXT PRIMARY KEY,
+    modelo TEXT NOT NULL,
+    vector REAL[] NOT NULL,
+    creado TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+SQL_LEER = """
+SELECT vector FROM cache_embeddings
+WHERE clave = %(clave)s AND creado > now() - make_interval(secs => %(ttl)s);
+"""
+
+SQL_GUARDAR = """
+INSERT INTO cache_embeddings (clave, modelo, vector, creado)
+VALUES (%(clave)s, %(modelo)s, %(vector)s, now())
+ON CONFLICT (clave) DO UPDATE SET vector = EXCLUDED.vector, creado = EXCLUDED.creado;
+"""
+
+SQL_PURGAR = "DELETE FROM cache_embeddings WHERE creado < now() - make_interval(secs => %(ttl)s);"
+
+# Cada cuántas escrituras en el nivel compartido se purgan las entradas expiradas
+PURGAR_CADA = 500
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Clave de caché: minúsculas, sin signos de interrogación/exclamación ni espacios repetidos."""
+    texto = unicodedata.normalize("NFKC", texto or "").lower()
+    texto = re.sub(r"[¿?¡!]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip(" .,;:")
+
+
+class EmbeddingsConCache(Embeddings):
+    """
+    Envuelve un modelo de embeddings y cachea los vectores de las consultas (embed_query).
+    Nivel 1: LRU en memoria con TTL. Nivel 2 (opcional): tabla compartida en PostgreSQL.
+    embed_documents (ingesta) no se cachea.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        modelo: str,
+        tamano_maximo: int = None,
+        ttl_s: float = None,
+        pool=None,
+    ):
+        self._embeddings = embeddings
+        self.modelo = modelo
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.environ.get("CACHE_EMBEDDINGS_TTL_S", "86400"))
+        tamano_maximo = tamano_maximo or int(os.environ.get("CACHE_EMBEDDINGS_TAMANO", "2048"))
+        self._memoria = CacheLRU(tamano_maximo, self.ttl_s)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.aciertos_compartido = 0
+        self.errores_compartido = 0
+        self.llamadas_modelo = 0
+        self._escrituras = 0
+
+        if pool is not None:
+            self.usar_compartida(pool)
+
+    def usar_compartida(self, pool):
+        """Activa el nivel compartido (se puede llamar después de crear la caché, cuando el pool ya está listo)."""
+        try:
+            with pool.connection() as conn:
+                conn.execute(SQL_CREAR_TABLA)
+            self._pool = pool
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo preparar la caché compartida de embeddings. Se usará solo memoria. Detalle: {e}")
+
+    def _clave(self, texto: str) -> str:
+        return hashlib.sha256(f"{self.modelo}|{normalizar_consulta(texto)}".encode("utf-8")).hexdigest()
+
+    # --- Nivel compartido (PostgreSQL) --- #
+    def _leer_compartido(self, clave: str) -> Optional[List[float]]:
+        if self._pool is None:
+            return None
+        try:
+            with self._pool.connection() as conn:
+                fila = conn.execute(SQL_LEER, {"clave": clave, "ttl": self.ttl_s}).fetchone()
+        except Exception as e:
+            self._contar_error(e)
+            return None
+        if fila is None:
+            return None
+        with self._lock:
+            self.aciertos_compartido += 1
+        return list(fila[0])
+
+    def _guardar_compartido(self, clave: str, vector: List[float]):
+        if self._pool is None:
+            return
+        try:
+            with self._pool.connection() as conn:
+                conn.execute(SQL_GUARDAR, {"clave": clave, "modelo": self.modelo, "vector": vector})
+                with self._lock:
+                    self._escrituras += 1
+                    purgar = self._escrituras % PURGAR_CADA == 0
+                if purgar:
+                    conn.execute(SQL_PURGAR, {"ttl": self.ttl_s})
+        except Exception as e:
+            self._contar_error(e)
+
+    def _contar_error(self, e: Exception):
+        with self._lock:
+            self.errores_compartido += 1
+        print(f"ADVERTENCIA: Falló la caché compartida de embeddings. Detalle: {e}")
+
+    # --- Interfaz Embeddings --- #
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        inicio = time.perf_counter()
+        clave = self._clave(text)
+
+        vector = self._memoria.obtener(clave)
+        if vector is not None:
+            EMBEDDINGS_DURACION.observar(time.perf_counter() - inicio, origen="memoria")
+            return list(vector)
+
+        origen = "compartido"
+        vector = self._leer_compartido(clave)
+        if vector is None:
+            origen = "modelo"
+            vector = self._embeddings.embed_query(text)
+            with self._lock:
+                self.llamadas_modelo += 1
+            self._guardar_compartido(clave, vector)
+
+        self._memoria.guardar(clave, tuple(vector))
+        EMBEDDINGS_DURACION.observar(time.perf_counter() - inicio, origen=origen)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        inicio = time.perf_counter()
+        clave = self._clave(text)
+
+        vector = self._memoria.obtener(clave)
+        if vector is not None:
+            EMBEDDINGS_DURACION.observar(time.perf_counter() - inicio, origen="memoria")
+            return list(vector)
+
+        origen = "compartido"
+        vector = await asyncio.to_thread(self._leer_compartido, clave)
+        if vector is None:
+            origen = "modelo"
+            vector = await self._embeddings.aembed_query(text)
+            with self._lock:
+                self.llamadas_modelo += 1
+            await asyncio.to_thread(self._guardar_compartido, clave, vector)
+
+        self._memoria.guardar(clave, tuple(vector))
+        EMBEDDINGS_DURACION.observar(time.perf_counter() - inicio, origen=origen)
+        return vector
+
+    def estadisticas(self) -> Dict[str, Any]:
+        datos = self._memoria.estadisticas()
+        with self._lock:
+            datos.update({
+                "compartido_habilitado": self._pool is not None,
+                "aciertos_compartido": self.aciertos_compartido,
+                "errores_compartido": self.errores_compartido,
+                "llamadas_modelo": self.llamadas_modelo,
+            })
+        return datos
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    """
+    Caché en memoria con expulsión LRU por tamaño y expiración por TTL.
+    Es segura entre hilos y lleva contadores de aciertos, fallos, expulsiones y expiraciones.
+    """
+
+    def __init__(self, tamano_maximo: int, ttl_s: Optional[float] = None):
+        self.tamano_maximo = tamano_maximo
+        self.ttl_s = ttl_s
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+
+    def obtener(self, clave: Hashable, por_defecto: Any = None) -> Any:
+        with self._lock:
+            entrada = self._datos.get(clave, _AUSENTE)
+            if entrada is _AUSENTE:
+                self.fallos += 1
+                return por_defecto
+
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                del self._datos[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return por_defecto
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave: Hashable, valor: Any, ttl_s: Optional[float] = None):
+        ttl = ttl_s if ttl_s is not None else self.ttl_s
+        expira = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano_maximo:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+
+    def invalidar(self, clave: Hashable) -> bool:
+        with self._lock:
+            return self._datos.pop(clave, _AUSENTE) is not _AUSENTE
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "tamano_maximo": self.tamano_maximo,
+                "ttl_s": self.ttl_s,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else None,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+            }
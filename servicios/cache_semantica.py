@@ -0,0 +1,178 @@
+import asyncio
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+
+@dataclass
+class AciertoSemantico:
+    pregunta: str
+    respuesta: str
+    similitud: float
+
+
+class CacheSemantica:
+    """
+    Caché de respuestas del agente de documentación indexada por el embedding de la pregunta.
+    Una pregunta nueva cuya similitud coseno con una ya respondida supere el umbral reutiliza
+    la respuesta guardada. Se vacía cuando cambia la versión del índice documental (re-ingesta).
+    La pregunta es la única clave: quien la usa solo debe consultarla y alimentarla con turnos sin
+    contexto previo y con respuestas que no contengan datos del usuario.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        obtener_version: Optional[Callable[[], str]] = None,
+        umbral: float = None,
+        tamano_maximo: int = None,
+        ttl_s: float = None,
+        verificar_cada_s: float = None,
+    ):
+        self._embeddings = embeddings
+        self._obtener_version = obtener_version
+        self.umbral = umbral if umbral is not None else float(os.environ.get("CACHE_SEMANTICA_UMBRAL", "0.92"))
+        self.tamano_maximo = tamano_maximo or int(os.environ.get("CACHE_SEMANTICA_TAMANO", "1000"))
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.environ.get("CACHE_SEMANTICA_TTL_S", "86400"))
+        self.verificar_cada_s = (
+            verificar_cada_s if verificar_cada_s is not None
+            else float(os.environ.get("CACHE_SEMANTICA_VERIFICAR_CADA_S", "60"))
+        )
+
+        self._lock = threading.Lock()
+        # clave → (vector normalizado, pregunta, respuesta, creado)
+        self._entradas: "OrderedDict[int, tuple]" = OrderedDict()
+        self._siguiente_clave = 0
+        self._matriz = None
+        self._claves_matriz = []
+        self._version = None
+        self._ultima_verificacion = 0.0
+
+        self.consultas = 0
+        self.aciertos = 0
+        self.invalidaciones = 0
+        self.latencia_ahorrada_s = 0.0
+        # Media móvil de lo que cuesta un turno de documentación sin caché (supervisor + ReAct)
+        self._latencia_media_fallo_s = None
+
+    # --- Versión del índice --- #
+    def _toca_verificar(self) -> bool:
+        if self._obtener_version is None:
+            return False
+        ahora = time.monotonic()
+        if ahora - self._ultima_verificacion < self.verificar_cada_s:
+            return False
+        self._ultima_verificacion = ahora
+        return True
+
+    def _actualizar_version(self):
+        try:
+            version = self._obtener_version()
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo obtener la versión del índice documental. Detalle: {e}")
+            return
+        if self._version is not None and version != self._version:
+            print(f"Índice documental re-ingestado ({self._version} → {version}). Se vacía la caché semántica.")
+            self.invalidar()
+        self._version = version
+
+    def _verificar_version(self):
+        if self._toca_verificar():
+            self._actualizar_version()
+
+    async def _averificar_version(self):
+        # obtener_version consulta Elasticsearch de forma bloqueante: fuera del event loop
+        if self._toca_verificar():
+            await asyncio.to_thread(self._actualizar_version)
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._matriz = None
+            self.invalidaciones += 1
+
+    # --- Búsqueda y guardado --- #
+    @staticmethod
+    def _normalizar(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+
+    def _buscar_vector(self, vector: np.ndarray) -> Optional[AciertoSemantico]:
+        with self._lock:
+            self.consultas += 1
+            if not self._entradas:
+                return None
+
+            if self._matriz is None:
+                self._claves_matriz = list(self._entradas.keys())
+                self._matriz = np.stack([self._entradas[c][0] for c in self._claves_matriz])
+
+            similitudes = self._matriz @ vector
+            indice = int(np.argmax(similitudes))
+            similitud = float(similitudes[indice])
+            if similitud < self.umbral:
+                return None
+
+            clave = self._claves_matriz[indice]
+            _, pregunta, respuesta, creado = self._entradas[clave]
+            if self.ttl_s and time.monotonic() - creado > self.ttl_s:
+                del self._entradas[clave]
+                self._matriz = None
+                return None
+
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            if self._latencia_media_fallo_s is not None:
+                self.latencia_ahorrada_s += self._latencia_media_fallo_s
+            return AciertoSemantico(pregunta, respuesta, similitud)
+
+    def _guardar_vector(self, vector: np.ndarray, pregunta: str, respuesta: str):
+        with self._lock:
+            self._entradas[self._siguiente_clave] = (vector, pregunta, respuesta, time.monotonic())
+            self._siguiente_clave += 1
+            while len(self._entradas) > self.tamano_maximo:
+                self._entradas.popitem(last=False)
+            self._matriz = None
+
+    def buscar(self, pregunta: str) -> Optional[AciertoSemantico]:
+        self._verificar_version()
+        return self._buscar_vector(self._normalizar(self._embeddings.embed_query(pregunta)))
+
+    async def abuscar(self, pregunta: str) -> Optional[AciertoSemantico]:
+        await self._averificar_version()
+        return self._buscar_vector(self._normalizar(await self._embeddings.aembed_query(pregunta)))
+
+    def guardar(self, pregunta: str, respuesta: str):
+        # El embedding de la pregunta ya está en la caché de embeddings desde buscar()
+        self._guardar_vector(self._normalizar(self._embeddings.embed_query(pregunta)), pregunta, respuesta)
+
+    async def aguardar(self, pregunta: str, respuesta: str):
+        self._guardar_vector(self._normalizar(await self._embeddings.aembed_query(pregunta)), pregunta, respuesta)
+
+    def registrar_latencia_fallo(self, segundos: float):
+        """Latencia de un turno de documentación resuelto sin caché (base para estimar el ahorro)."""
+        with self._lock:
+            if self._latencia_media_fallo_s is None:
+                self._latencia_media_fallo_s = segundos
+            else:
+                self._latencia_media_fallo_s = 0.9 * self._latencia_media_fallo_s + 0.1 * segundos
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "umbral": self.umbral,
+                "consultas": self.consultas,
+                "aciertos": self.aciertos,
+                "tasa_aciertos": round(self.aciertos / self.consultas, 4) if self.consultas else None,
+                "invalidaciones": self.invalidaciones,
+                "version_indice": self._version,
+                "latencia_media_fallo_s": round(self._latencia_media_fallo_s, 4) if self._latencia_media_fallo_s else None,
+                "latencia_ahorrada_s": round(self.latencia_ahorrada_s, 3),
+            }
@@ -0,0 +1,281 @@
+"""
+Checkpointer que agrupa las escrituras de un turno y persiste un único checkpoint al final.
+
+LangGraph guarda un checkpoint (más sus escrituras pendientes) en cada super-paso del grafo:
+historial → caché semántica → supervisor → agente son varias idas y vueltas a PostgreSQL por turno.
+Dentro de `turno(thread_id)` los `put`/`put_writes` quedan en memoria y al salir se escribe el último
+checkpoint (con el padre del primero y las versiones nuevas de todos los pasos) en una sola transacción.
+Fuera de un turno, y para otros hilos, se comporta igual que el checkpointer interno.
+
+Si el proceso muere a mitad de un turno se pierde ese turno, no el historial previo del hilo.
+"""
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+
+try:
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool
+except ImportError:  # pragma: no cover - el checkpointer en memoria no necesita psycopg
+    AsyncConnectionPool = ConnectionPool = None
+
+
+@dataclass
+class _BufferTurno:
+    config_padre: Optional[RunnableConfig] = None
+    config: Optional[RunnableConfig] = None
+    checkpoint: Optional[dict] = None
+    metadata: Optional[dict] = None
+    versiones: Dict[str, Any] = field(default_factory=dict)
+    # (task_id, task_path) → escrituras del último checkpoint
+    escrituras: Dict[Tuple[str, str], List[Tuple[str, Any]]] = field(default_factory=dict)
+
+    @property
+    def checkpoint_id(self) -> Optional[str]:
+        return self.checkpoint["id"] if self.checkpoint else None
+
+
+def _clave(config: RunnableConfig) -> Tuple[str, str]:
+    configurable = config["configurable"]
+    return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+
+class CheckpointerCoalescente(BaseCheckpointSaver):
+    """Envuelve otro checkpointer (PostgresSaver, AsyncPostgresSaver o MemorySaver) y agrupa sus escrituras por turno."""
+
+    def __init__(self, interno: BaseCheckpointSaver):
+        super().__init__(serde=interno.serde)
+        self.interno = interno
+        self._lock = threading.Lock()
+        # thread_id → [turnos abiertos, {checkpoint_ns → buffer}]
+        self._turnos: Dict[str, list] = {}
+
+        self.turnos = 0
+        self.puts_recibidos = 0
+        self.escrituras_recibidas = 0
+        self.puts_persistidos = 0
+        self.escrituras_persistidas = 0
+
+    @property
+    def config_specs(self) -> list:
+        return self.interno.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.interno.get_next_version(current, channel)
+
+    # --- Turnos --- #
+    def iniciar_turno(self, thread_id: str):
+        with self._lock:
+            abierto = self._turnos.setdefault(str(thread_id), [0, {}])
+            abierto[0] += 1
+
+    def _cerrar_turno(self, thread_id: str) -> List[_BufferTurno]:
+        """Devuelve los buffers a persistir si era el último turno abierto del hilo."""
+        with self._lock:
+            abierto = self._turnos.get(str(thread_id))
+            if abierto is None:
+                return []
+            abierto[0] -= 1
+            if abierto[0] > 0:
+                return []
+            del self._turnos[str(thread_id)]
+            self.turnos += 1
+            return [b for b in abierto[1].values() if b.checkpoint is not None]
+
+    @contextmanager
+    def turno(self, thread_id: str):
+        self.iniciar_turno(thread_id)
+        try:
+            yield
+        finally:
+            self.persistir(self._cerrar_turno(thread_id))
+
+    @asynccontextmanager
+    async def aturno(self, thread_id: str):
+        self.iniciar_turno(thread_id)
+        try:
+            yield
+        finally:
+            await self.apersistir(self._cerrar_turno(thread_id))
+
+    def _buffer(self, config: RunnableConfig, crear: bool = True) -> Optional[_BufferTurno]:
+        """Buffer del namespace si hay un turno abierto para el hilo; None si no."""
+        thread_id, checkpoint_ns = _clave(config)
+        with self._lock:
+            abierto = self._turnos.get(thread_id)
+            if abierto is None:
+                return None
+            if not crear:
+                return abierto[1].get(checkpoint_ns)
+            return abierto[1].setdefault(checkpoint_ns, _BufferTurno())
+
+    # --- Registro en memoria --- #
+    def _registrar_put(self, buffer: _BufferTurno, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        with self._lock:
+            self.puts_recibidos += 1
+            if buffer.checkpoint is None:
+                # El padre del checkpoint consolidado es el último checkpoint persistido antes del turno
+                buffer.config_padre = config
+            buffer.checkpoint = checkpoint
+            buffer.metadata = metadata
+            buffer.versiones.update(new_versions)
+            # Las escrituras pendientes de pasos anteriores quedan superadas por el nuevo checkpoint
+            buffer.escrituras = {}
+            thread_id, checkpoint_ns = _clave(config)
+            buffer.config = {
+                "configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}
+            }
+            return buffer.config
+
+    def _registrar_escrituras(self, buffer: Optional[_BufferTurno], config, writes, task_id, task_path) -> bool:
+        """True si las escrituras quedaron en el buffer (pertenecen al checkpoint del turno en curso)."""
+        if buffer is None or buffer.checkpoint_id is None:
+            return False
+        if config["configurable"].get("checkpoint_id") != buffer.checkpoint_id:
+            return False
+        with self._lock:
+            self.escrituras_recibidas += 1
+            buffer.escrituras.setdefault((task_id, task_path), []).extend(writes)
+        return True
+
+    def _tupla_en_buffer(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        buffer = self._buffer(config, crear=False)
+        if buffer is None or buffer.checkpoint is None:
+            return None
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        if checkpoint_id and checkpoint_id != buffer.checkpoint_id:
+            return None
+        pendientes = [
+            (task_id, canal, valor)
+            for (task_id, _), escrituras in buffer.escrituras.items()
+            for canal, valor in escrituras
+        ]
+        return CheckpointTuple(
+            config=buffer.config,
+            checkpoint=buffer.checkpoint,
+            metadata=buffer.metadata,
+            parent_config=buffer.config_padre if buffer.config_padre["configurable"].get("checkpoint_id") else None,
+            pending_writes=pendientes,
+        )
+
+    # --- Interfaz síncrona --- #
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._tupla_en_buffer(config) or self.interno.get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.interno.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        buffer = self._buffer(config)
+        if buffer is None:
+            return self.interno.put(config, checkpoint, metadata, new_versions)
+        return self._registrar_put(buffer, config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        if not self._registrar_escrituras(self._buffer(config), config, writes, task_id, task_path):
+            self.interno.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._turnos.pop(str(thread_id), None)
+        self.interno.delete_thread(thread_id)
+
+    # --- Interfaz asíncrona --- #
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._tupla_en_buffer(config) or await self.interno.aget_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async for tupla in self.interno.alist(config, filter=filter, before=before, limit=limit):
+            yield tupla
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        buffer = self._buffer(config)
+        if buffer is None:
+            return await self.interno.aput(config, checkpoint, metadata, new_versions)
+        return self._registrar_put(buffer, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        if not self._registrar_escrituras(self._buffer(config), config, writes, task_id, task_path):
+            await self.interno.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._turnos.pop(str(thread_id), None)
+        await self.interno.adelete_thread(thread_id)
+
+    # --- Persistencia del turno --- #
+    def _contar_persistencia(self, buffers: List[_BufferTurno]):
+        with self._lock:
+            self.puts_persistidos += len(buffers)
+            self.escrituras_persistidas += sum(len(b.escrituras) for b in buffers)
+
+    def persistir(self, buffers: List[_BufferTurno]):
+        """Escribe el checkpoint consolidado de cada namespace y sus escrituras pendientes."""
+        if not buffers:
+            return
+        pool = getattr(self.interno, "conn", None)
+        if ConnectionPool is not None and isinstance(pool, ConnectionPool):
+            # Un PostgresSaver sobre una sola conexión dentro de una transacción: todo o nada
+            with pool.connection() as conn, conn.transaction():
+                self._volcar(type(self.interno)(conn, serde=self.interno.serde), buffers)
+        else:
+            self._volcar(self.interno, buffers)
+        self._contar_persistencia(buffers)
+
+    async def apersistir(self, buffers: List[_BufferTurno]):
+        if not buffers:
+            return
+        pool = getattr(self.interno, "conn", None)
+        if AsyncConnectionPool is not None and isinstance(pool, AsyncConnectionPool):
+            async with pool.connection() as conn, conn.transaction():
+                await self._avolcar(type(self.interno)(conn, serde=self.interno.serde), buffers)
+        else:
+            await self._avolcar(self.interno, buffers)
+        self._contar_persistencia(buffers)
+
+    @staticmethod
+    def _volcar(saver, buffers: List[_BufferTurno]):
+        for buffer in buffers:
+            config = saver.put(buffer.config_padre, buffer.checkpoint, buffer.metadata, buffer.versiones)
+            for (task_id, task_path), escrituras in buffer.escrituras.items():
+                saver.put_writes(config, escrituras, task_id, task_path)
+
+    @staticmethod
+    async def _avolcar(saver, buffers: List[_BufferTurno]):
+        for buffer in buffers:
+            config = await saver.aput(buffer.config_padre, buffer.checkpoint, buffer.metadata, buffer.versiones)
+            for (task_id, task_path), escrituras in buffer.escrituras.items():
+                await saver.aput_writes(config, escrituras, task_id, task_path)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turnos": self.turnos,
+                "turnos_abiertos": len(self._turnos),
+                "puts_recibidos": self.puts_recibidos,
+                "puts_persistidos": self.puts_persistidos,
+                "escrituras_recibidas": self.escrituras_recibidas,
+                "escrituras_persistidas": self.escrituras_persistidas,
+            }
+
+
+@contextmanager
+def turno_checkpointer(checkpointer, thread_id: str):
+    """Contexto de un turno: agrupa escrituras si el checkpointer es coalescente; si no, no hace nada."""
+    if not isinstance(checkpointer, CheckpointerCoalescente):
+        yield
+        return
+    with checkpointer.turno(thread_id):
+        yield
+
+
+@asynccontextmanager
+async def aturno_checkpointer(checkpointer, thread_id: str):
+    if not isinstance(checkpointer, CheckpointerCoalescente):
+        yield
+        return
+    async with checkpointer.aturno(thread_id):
+        yield
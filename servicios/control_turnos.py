@@ -0,0 +1,215 @@
+"""
+Control de turnos por conversación: claves de idempotencia, agrupación de solicitudes en vuelo y
+serialización por thread_id.
+
+- Con una clave de idempotencia (cabecera `Idempotency-Key` o parámetro `idempotency_key`) el
+  resultado se guarda unos minutos: un reintento con la misma clave recibe la respuesta guardada
+  sin volver a ejecutar el grafo (ni registrar otra solicitud).
+- Una solicitud idéntica a otra todavía en curso (misma clave o, sin clave, mismo mensaje en la
+  misma conversación: doble clic) espera el resultado de la primera en lugar de ejecutarse.
+- Dos turnos distintos de la misma conversación nunca corren a la vez: el segundo espera su turno
+  (hasta `espera_maxima_s`; si no, ConversacionOcupada) y así no se intercalan escrituras en el checkpoint.
+
+El estado es por proceso: con varias instancias, la idempotencia entre ellas requiere afinidad de sesión.
+"""
+import os
+import asyncio
+import hashlib
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from servicios.cache_lru import CacheLRU
+
+EJECUTADA = "ejecutada"
+REPETIDA = "repetida"
+AGRUPADA = "agrupada"
+
+
+class ConversacionOcupada(Exception):
+    """Otro turno de la misma conversación no terminó dentro de la espera máxima."""
+
+
+class _EnVuelo:
+    def __init__(self, evento):
+        self.evento = evento
+        self.resultado = None
+        self.error: Optional[BaseException] = None
+
+
+class ControlTurnos:
+    def __init__(self, ttl_s: float = None, tamano_maximo: int = None, espera_maxima_s: float = None):
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.environ.get("IDEMPOTENCIA_TTL_S", "600"))
+        self.espera_maxima_s = (
+            espera_maxima_s if espera_maxima_s is not None
+            else float(os.environ.get("TURNO_ESPERA_MAXIMA_S", "120"))
+        )
+        self._resultados = CacheLRU(tamano_maximo or int(os.environ.get("IDEMPOTENCIA_TAMANO", "10000")), self.ttl_s)
+        self._lock = threading.Lock()
+        # Modo WSGI (hilos) y modo ASGI (un event loop) llevan registros separados
+        self._en_vuelo: Dict[Tuple, _EnVuelo] = {}
+        self._hilos: Dict[str, list] = {}
+        self._aen_vuelo: Dict[Tuple, _EnVuelo] = {}
+        self._ahilos: Dict[str, list] = {}
+
+        self.ejecutadas = 0
+        self.repetidas = 0
+        self.agrupadas = 0
+        self.en_cola = 0
+        self.rechazadas = 0
+
+    def _contar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    @staticmethod
+    def _clave_vuelo(thread_id: str, firma: str, clave: Optional[str]) -> Tuple:
+        if clave:
+            return thread_id, "clave", clave
+        return thread_id, "mensaje", hashlib.sha256(firma.encode("utf-8")).hexdigest()
+
+    def _repetida(self, thread_id: str, clave: Optional[str]):
+        if not clave:
+            return None
+        resultado = self._resultados.obtener((thread_id, clave))
+        if resultado is not None:
+            self._contar("repetidas")
+        return resultado
+
+    def _guardar(self, thread_id: str, clave: Optional[str], resultado, almacenar: Callable[[Any], bool]):
+        if clave and almacenar(resultado):
+            self._resultados.guardar((thread_id, clave), resultado)
+
+    # --- Modo síncrono --- #
+    @contextmanager
+    def serializar(self, thread_id: str):
+        """Un turno a la vez por conversación; los demás esperan en cola."""
+        with self._lock:
+            entrada = self._hilos.setdefault(thread_id, [threading.Lock(), 0])
+            entrada[1] += 1
+        try:
+            if not entrada[0].acquire(blocking=False):
+                self._contar("en_cola")
+                if not entrada[0].acquire(timeout=self.espera_maxima_s):
+                    self._contar("rechazadas")
+                    raise ConversacionOcupada("Otro mensaje de esta conversación todavía se está procesando.")
+            try:
+                yield
+            finally:
+                entrada[0].release()
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._hilos[thread_id]
+
+    def ejecutar(self, thread_id: str, firma: str, clave: Optional[str], funcion: Callable[[], Any],
+                 almacenar: Callable[[Any], bool] = lambda resultado: True) -> Tuple[Any, str]:
+        """
+        Ejecuta `funcion` como turno de la conversación. `firma` identifica el mensaje (para agrupar
+        dobles envíos sin clave); `almacenar` decide si el resultado se guarda para reintentos.
+        Devuelve (resultado, origen) con origen EJECUTADA, REPETIDA o AGRUPADA.
+        """
+        resultado = self._repetida(thread_id, clave)
+        if resultado is not None:
+            return resultado, REPETIDA
+
+        clave_vuelo = self._clave_vuelo(thread_id, firma, clave)
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave_vuelo)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[clave_vuelo] = _EnVuelo(threading.Event())
+            else:
+                self.agrupadas += 1
+
+        if not lider:
+            if not vuelo.evento.wait(self.espera_maxima_s):
+                self._contar("rechazadas")
+                raise ConversacionOcupada("El mismo mensaje todavía se está procesando.")
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado, AGRUPADA
+
+        try:
+            with self.serializar(thread_id):
+                self._contar("ejecutadas")
+                vuelo.resultado = funcion()
+            self._guardar(thread_id, clave, vuelo.resultado, almacenar)
+            return vuelo.resultado, EJECUTADA
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave_vuelo]
+            vuelo.evento.set()
+
+    # --- Modo asíncrono --- #
+    @asynccontextmanager
+    async def aserializar(self, thread_id: str):
+        entrada = self._ahilos.setdefault(thread_id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            if not entrada[0].locked():
+                await entrada[0].acquire()
+            else:
+                self._contar("en_cola")
+                try:
+                    await asyncio.wait_for(entrada[0].acquire(), timeout=self.espera_maxima_s)
+                except asyncio.TimeoutError:
+                    self._contar("rechazadas")
+                    raise ConversacionOcupada("Otro mensaje de esta conversación todavía se está procesando.")
+            try:
+                yield
+            finally:
+                entrada[0].release()
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._ahilos[thread_id]
+
+    async def aejecutar(self, thread_id: str, firma: str, clave: Optional[str], funcion: Callable[[], Awaitable[Any]],
+                        almacenar: Callable[[Any], bool] = lambda resultado: True) -> Tuple[Any, str]:
+        resultado = self._repetida(thread_id, clave)
+        if resultado is not None:
+            return resultado, REPETIDA
+
+        clave_vuelo = self._clave_vuelo(thread_id, firma, clave)
+        vuelo = self._aen_vuelo.get(clave_vuelo)
+        if vuelo is not None:
+            self._contar("agrupadas")
+            try:
+                await asyncio.wait_for(vuelo.evento.wait(), timeout=self.espera_maxima_s)
+            except asyncio.TimeoutError:
+                self._contar("rechazadas")
+                raise ConversacionOcupada("El mismo mensaje todavía se está procesando.")
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado, AGRUPADA
+
+        vuelo = self._aen_vuelo[clave_vuelo] = _EnVuelo(asyncio.Event())
+        try:
+            async with self.aserializar(thread_id):
+                self._contar("ejecutadas")
+                vuelo.resultado = await funcion()
+            self._guardar(thread_id, clave, vuelo.resultado, almacenar)
+            return vuelo.resultado, EJECUTADA
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            del self._aen_vuelo[clave_vuelo]
+            vuelo.evento.set()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ejecutadas": self.ejecutadas,
+                "repetidas": self.repetidas,
+                "agrupadas": self.agrupadas,
+                "en_cola": self.en_cola,
+                "rechazadas": self.rechazadas,
+                "conversaciones_en_curso": len(self._hilos) + len(self._ahilos),
+                "resultados_guardados": len(self._resultados),
+            }
@@ -0,0 +1,253 @@
+import os
+import re
+import random
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+DOCUMENTACION = "DOCUMENTACION"
+USUARIO_EXTERNO = "USUARIO_EXTERNO"
+
+NIVEL_REGLAS = "reglas"
+NIVEL_CLASIFICADOR = "clasificador"
+NIVEL_LLM = "llm"
+
+# Código de solicitud tal como lo genera el registro: MED_00012, EXA_00003, CON_01234, OTR_00001
+# (sensible a mayúsculas y con "_": "con 2 medicamentos" no es un código)
+PATRON_CODIGO = re.compile(r"\b(MED|EXA|CON|OTR)_\d{5,}\b")
+
+VERBOS_ACCION = (
+    "registrar", "registra", "registro", "ingresar", "ingresa", "crear", "crea", "solicitar",
+    "consultar", "consulta", "ver el estado", "estado de mi", "estado de la",
+    "actualizar", "actualiza", "aprobar", "aprueba", "rechazar", "rechaza", "observar", "cambiar el estado",
+)
+# Palabras completas: "consultas" no es "consulta" ni "recreativo" es "crea"
+PATRON_ACCION = re.compile(r"\b(?:" + "|".join(re.escape(verbo) for verbo in VERBOS_ACCION) + r")\b")
+
+FRASES_DOCUMENTACION = (
+    "que documentos", "documentos necesito", "documentos debo", "que necesito", "requisitos", "requisito",
+    "politica", "procedimiento", "como solicito", "como hago", "como puedo", "cuanto tiempo", "plazo",
+    "que dice", "que pasos", "pasos para", "en que consiste", "cobertura",
+)
+
+# Nombre con el que el nodo del agente de acción firma sus respuestas (AIMessage.name)
+AGENTE_ACCION = "usuario_externo"
+
+# Argumentos de las herramientas que el agente de acción pide al usuario (palabras completas)
+PATRON_DATO_PENDIENTE = re.compile(
+    r"\b(monto|beneficiario|nombre del (asegurado|beneficiario)|tipo de gasto|numero de (la )?solicitud"
+    r"|nuevo estado|respuesta del equipo)\b"
+)
+
+# Vocabulario del clasificador local: peso positivo → USUARIO_EXTERNO, negativo → DOCUMENTACION
+PESOS_CLASIFICADOR = {
+    "mi": 0.4, "mis": 0.4, "solicitud": 0.6, "soles": 0.8, "s/": 0.8, "monto": 0.6, "registrar": 1.5,
+    "consultar": 1.0, "actualizar": 1.5, "aprobado": 0.8, "rechazado": 0.8, "observado": 0.5,
+    "beneficiario": 0.7, "quiero": 0.5, "hijo": 0.4, "esposa": 0.4, "pendiente": 0.4,
+    "que": -0.5, "como": -0.8, "cuales": -0.7, "documentos": -1.2, "requisitos": -1.5,
+    "politica": -1.5, "procedimiento": -1.5, "plazo": -1.0, "dias": -0.4, "necesito": -0.6,
+    "debo": -0.5, "cubre": -1.0, "cobertura": -1.2, "reembolso": -0.2, "factura": -0.5,
+}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes ni signos de apertura, para comparar contra los patrones."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower().replace("¿", "").replace("¡", "").strip()
+
+
+def _contenido(mensaje) -> str:
+    contenido = getattr(mensaje, "content", mensaje)
+    return contenido if isinstance(contenido, str) else str(contenido)
+
+
+def ultimo_mensaje_ai(mensajes: List[Any]) -> Optional[Any]:
+    """Devuelve el último mensaje del AI anterior a la consulta actual del usuario."""
+    for mensaje in reversed(mensajes[:-1]):
+        if getattr(mensaje, "type", None) == "ai" and _contenido(mensaje).strip():
+            return mensaje
+    return None
+
+
+def pide_dato_pendiente(mensaje_ai: Optional[Any]) -> bool:
+    """
+    True si el agente de acción terminó su turno preguntando por un argumento de sus herramientas
+    (monto, beneficiario, ...). Las respuestas de documentación no cuentan aunque cierren con una
+    pregunta que mencione el estado o el tipo de gasto.
+    """
+    if mensaje_ai is None or getattr(mensaje_ai, "name", None) != AGENTE_ACCION:
+        return False
+    texto = normalizar(_contenido(mensaje_ai)).rstrip()
+    if not texto.endswith("?"):
+        return False
+    # Solo la pregunta final (desde el fin de la oración anterior)
+    pregunta = re.split(r"[.!:\n]", texto[:-1])[-1]
+    return PATRON_DATO_PENDIENTE.search(pregunta) is not None
+
+
+@dataclass
+class Decision:
+    ruta: Optional[str]
+    confianza: float
+    nivel: str
+    motivo: str = ""
+    latencia_s: float = 0.0
+
+
+def decidir_por_reglas(mensajes: List[Any]) -> Decision:
+    """Nivel 1: reglas deterministas. Devuelve ruta None si el mensaje no es claro."""
+    consulta = normalizar(_contenido(mensajes[-1]))
+
+    # El código se busca en el texto original: normalizar pasa a minúsculas
+    if PATRON_CODIGO.search(_contenido(mensajes[-1])):
+        return Decision(USUARIO_EXTERNO, 0.97, NIVEL_REGLAS, "codigo_solicitud")
+
+    # Respuesta corta a un dato que el AI pidió en el turno anterior (monto, beneficiario, ...)
+    if len(consulta.split()) <= 6 and pide_dato_pendiente(ultimo_mensaje_ai(mensajes)):
+        return Decision(USUARIO_EXTERNO, 0.95, NIVEL_REGLAS, "dato_pendiente")
+
+    accion = PATRON_ACCION.search(consulta) is not None
+    documentacion = any(frase in consulta for frase in FRASES_DOCUMENTACION)
+
+    if accion and not documentacion:
+        return Decision(USUARIO_EXTERNO, 0.9, NIVEL_REGLAS, "verbo_accion")
+    if documentacion and not accion:
+        return Decision(DOCUMENTACION, 0.9, NIVEL_REGLAS, "pregunta_teorica")
+
+    return Decision(None, 0.0, NIVEL_REGLAS, "ambiguo")
+
+
+def decidir_por_clasificador(mensajes: List[Any]) -> Decision:
+    """Nivel 2: clasificador local por pesos de vocabulario (sin llamadas de red)."""
+    tokens = re.findall(r"[a-z/]+", normalizar(_contenido(mensajes[-1])))
+    puntaje = sum(PESOS_CLASIFICADOR.get(token, 0.0) for token in tokens)
+    if re.search(r"\d", _contenido(mensajes[-1])):
+        puntaje += 0.5
+
+    # Confianza creciente con la magnitud del puntaje, acotada a [0.5, 0.95]
+    confianza = min(0.95, 0.5 + abs(puntaje) / 6)
+    ruta = USUARIO_EXTERNO if puntaje > 0 else DOCUMENTACION
+    return Decision(ruta, confianza, NIVEL_CLASIFICADOR, f"puntaje={puntaje:.2f}")
+
+
+class EnrutadorEscalonado:
+    """
+    Enrutador por niveles: reglas deterministas, clasificador local opcional y, solo si la
+    confianza es baja, el LLM. Lleva contadores por nivel para medir cuántas llamadas ahorra.
+    """
+
+    def __init__(
+        self,
+        decidir_con_llm: Callable[[str], str],
+        adecidir_con_llm: Optional[Callable[[str], Awaitable[str]]] = None,
+        umbral: float = None,
+        usar_clasificador: bool = None,
+        muestreo_validacion: float = None,
+    ):
+        self._decidir_con_llm = decidir_con_llm
+        self._adecidir_con_llm = adecidir_con_llm
+        self.umbral = umbral if umbral is not None else float(os.environ.get("ENRUTADOR_UMBRAL", "0.85"))
+        self.usar_clasificador = (
+            usar_clasificador if usar_clasificador is not None
+            else os.environ.get("ENRUTADOR_CLASIFICADOR", "false").lower() == "true"
+        )
+        # Fracción de decisiones locales que se contrastan con el LLM para estimar su precisión
+        self.muestreo_validacion = (
+            muestreo_validacion if muestreo_validacion is not None
+            else float(os.environ.get("ENRUTADOR_MUESTREO_VALIDACION", "0"))
+        )
+        self._lock = threading.Lock()
+        self._contadores = {
+            nivel: {"decisiones": 0, "latencia_total_s": 0.0, "validadas": 0, "coincidencias": 0}
+            for nivel in (NIVEL_REGLAS, NIVEL_CLASIFICADOR, NIVEL_LLM)
+        }
+
+    def _decidir_local(self, mensajes: List[Any]) -> Optional[Decision]:
+        """Niveles locales (reglas y clasificador). None si ninguno supera el umbral."""
+        decision = decidir_por_reglas(mensajes)
+        if decision.ruta is not None and decision.confianza >= self.umbral:
+            return decision
+        if self.usar_clasificador:
+            decision = decidir_por_clasificador(mensajes)
+            if decision.confianza >= self.umbral:
+                return decision
+        return None
+
+    def decidir(self, mensajes: List[Any]) -> Decision:
+        inicio = time.perf_counter()
+
+        decision = self._decidir_local(mensajes)
+        if decision is None:
+            decision = Decision(self._llm(mensajes), 1.0, NIVEL_LLM, "fallback")
+
+        self._registrar(decision, time.perf_counter() - inicio)
+
+        if decision.nivel != NIVEL_LLM and self.muestreo_validacion and random.random() < self.muestreo_validacion:
+            self._validar(decision, mensajes)
+
+        return decision
+
+    async def adecidir(self, mensajes: List[Any]) -> Decision:
+        """Variante asíncrona de decidir (la validación por muestreo solo se hace en modo síncrono)."""
+        inicio = time.perf_counter()
+
+        decision = self._decidir_local(mensajes)
+        if decision is None:
+            if self._adecidir_con_llm is None:
+                raise RuntimeError("El enrutador no tiene una función asíncrona para consultar al LLM.")
+            respuesta = await self._adecidir_con_llm(_contenido(mensajes[-1]))
+            decision = Decision(self._interpretar(respuesta), 1.0, NIVEL_LLM, "fallback")
+
+        self._registrar(decision, time.perf_counter() - inicio)
+        return decision
+
+    def _llm(self, mensajes: List[Any]) -> str:
+        return self._interpretar(self._decidir_con_llm(_contenido(mensajes[-1])))
+
+    @staticmethod
+    def _interpretar(respuesta: str) -> str:
+        if DOCUMENTACION in normalizar(respuesta).upper():
+            return DOCUMENTACION
+        # Falla segura al agente de acción si la decisión no es clara
+        return USUARIO_EXTERNO
+
+    def _registrar(self, decision: Decision, latencia: float):
+        decision.latencia_s = latencia
+        with self._lock:
+            contador = self._contadores[decision.nivel]
+            contador["decisiones"] += 1
+            contador["latencia_total_s"] += latencia
+
+    def _validar(self, decision: Decision, mensajes: List[Any]):
+        """Contrasta una decisión local con el LLM (solo para medir precisión, no cambia la ruta)."""
+        try:
+            ruta_llm = self._llm(mensajes)
+        except Exception as e:
+            print(f"ADVERTENCIA: Falló la validación del enrutador con el LLM. Detalle: {e}")
+            return
+        with self._lock:
+            contador = self._contadores[decision.nivel]
+            contador["validadas"] += 1
+            contador["coincidencias"] += int(ruta_llm == decision.ruta)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(c["decisiones"] for c in self._contadores.values())
+            niveles = {}
+            for nivel, c in self._contadores.items():
+                niveles[nivel] = {
+                    "decisiones": c["decisiones"],
+                    "latencia_media_ms": round(1000 * c["latencia_total_s"] / c["decisiones"], 3) if c["decisiones"] else None,
+                    "validadas": c["validadas"],
+                    "precision": round(c["coincidencias"] / c["validadas"], 4) if c["validadas"] else None,
+                }
+            return {
+                "decisiones_totales": total,
+                "llamadas_llm_ahorradas": total - self._contadores[NIVEL_LLM]["decisiones"],
+                "umbral": self.umbral,
+                "clasificador_habilitado": self.usar_clasificador,
+                "niveles": niveles,
+            }
@@ -0,0 +1,194 @@
+"""
+Política de historial de las conversaciones: ventana de los últimos N turnos + resumen acumulado.
+
+- `ventana` recorta lo que se envía al LLM en cada llamada (prompt de los agentes).
+- `plegar` resume los turnos viejos en el campo `resumen` del estado y los quita del checkpoint
+  con RemoveMessage, así el hilo no crece sin límite.
+- Un turno cuyo AI terminó pidiendo un dato (monto, beneficiario, ...) nunca se pliega ni se recorta:
+  la respuesta del usuario solo tiene sentido junto a esa pregunta.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage
+
+from servicios.enrutador import pide_dato_pendiente
+
+PROMPT_RESUMEN = (
+    "Resume la siguiente conversación entre un usuario y el asistente de reembolsos médicos en español, "
+    "en un máximo de 8 viñetas. Conserva los datos concretos: números de solicitud, montos, tipos de gasto, "
+    "beneficiarios, estados y decisiones tomadas. Si hay un resumen anterior, intégralo en el nuevo.\n\n"
+    "Resumen anterior:\n{resumen}\n\nConversación:\n{conversacion}"
+)
+
+# Tramos de turnos por hilo para ver si los tokens enviados se mantienen planos al crecer la conversación
+TRAMOS_TURNOS = ((1, 5), (6, 10), (11, 20), (21, None))
+
+_ETIQUETAS = {"human": "Usuario", "ai": "Asistente", "tool": "Herramienta"}
+
+
+def dividir_en_turnos(mensajes: List[Any]) -> List[List[Any]]:
+    """Agrupa los mensajes en turnos: cada turno empieza con un mensaje del usuario."""
+    turnos: List[List[Any]] = []
+    for mensaje in mensajes:
+        if getattr(mensaje, "type", None) == "human" or not turnos:
+            turnos.append([])
+        turnos[-1].append(mensaje)
+    return turnos
+
+
+def turno_pendiente(turno: List[Any]) -> bool:
+    """True si el turno terminó con el AI pidiendo un dato obligatorio (slot sin resolver)."""
+    for mensaje in reversed(turno):
+        if getattr(mensaje, "type", None) == "ai" and isinstance(mensaje.content, str) and mensaje.content.strip():
+            return pide_dato_pendiente(mensaje)
+    return False
+
+
+def estimar_tokens(mensajes: List[Any]) -> int:
+    """Aproximación de ~4 caracteres por token (más el costo fijo por mensaje), sin tokenizador."""
+    total = 0
+    for mensaje in mensajes:
+        contenido = getattr(mensaje, "content", mensaje)
+        total += 4 + len(contenido if isinstance(contenido, str) else str(contenido)) // 4
+        for llamada in getattr(mensaje, "tool_calls", None) or []:
+            total += len(str(llamada.get("args", ""))) // 4
+    return total
+
+
+def _transcribir(mensajes: List[Any]) -> str:
+    lineas = []
+    for mensaje in mensajes:
+        contenido = mensaje.content if isinstance(mensaje.content, str) else str(mensaje.content)
+        if contenido.strip():
+            lineas.append(f"{_ETIQUETAS.get(mensaje.type, mensaje.type)}: {contenido.strip()}")
+    return "\n".join(lineas)
+
+
+class PoliticaHistorial:
+    """
+    Mantiene los últimos `turnos` turnos literales y pliega los anteriores en un resumen.
+    El plegado se hace por bloques (cuando sobran `resumir_cada` turnos) para no llamar al LLM en cada turno.
+    """
+
+    def __init__(
+        self,
+        resumidor=None,
+        turnos: int = None,
+        resumir_cada: int = None,
+        contar_tokens: Callable[[List[Any]], int] = None,
+    ):
+        self.resumidor = resumidor
+        self.turnos = turnos or int(os.environ.get("HISTORIAL_TURNOS", "6"))
+        self.resumir_cada = resumir_cada or int(os.environ.get("HISTORIAL_RESUMIR_CADA", "4"))
+        self.contar_tokens = contar_tokens or estimar_tokens
+
+        self._lock = threading.Lock()
+        self.plegados = 0
+        self.mensajes_plegados = 0
+        self.fallos_resumen = 0
+        self._tokens: Dict[str, List[int]] = {self._tramo(desde): [0, 0, 0] for desde, _ in TRAMOS_TURNOS}
+
+    # --- Ventana --- #
+    def _corte(self, turnos: List[List[Any]]) -> int:
+        """Índice del primer turno que se conserva literal."""
+        inicio = max(0, len(turnos) - self.turnos)
+        # Los turnos que quedaron esperando un dato se conservan (hasta otros N turnos hacia atrás)
+        limite = max(0, inicio - self.turnos)
+        while inicio > limite and turno_pendiente(turnos[inicio - 1]):
+            inicio -= 1
+        return inicio
+
+    def ventana(self, mensajes: List[Any]) -> List[Any]:
+        turnos = dividir_en_turnos(mensajes)
+        return [m for turno in turnos[self._corte(turnos):] for m in turno]
+
+    # --- Plegado en el resumen --- #
+    def _a_plegar(self, mensajes: List[Any]) -> List[Any]:
+        turnos = dividir_en_turnos(mensajes)
+        if len(turnos) <= self.turnos + self.resumir_cada:
+            return []
+        return [m for turno in turnos[:self._corte(turnos)] for m in turno]
+
+    def _prompt_resumen(self, resumen: Optional[str], viejos: List[Any]) -> List[Any]:
+        return [HumanMessage(content=PROMPT_RESUMEN.format(resumen=resumen or "(sin resumen)", conversacion=_transcribir(viejos)))]
+
+    def _resultado_plegado(self, viejos: List[Any], resumen: str) -> Dict[str, Any]:
+        with self._lock:
+            self.plegados += 1
+            self.mensajes_plegados += len(viejos)
+        return {
+            "messages": [RemoveMessage(id=m.id) for m in viejos if m.id],
+            "resumen": resumen,
+        }
+
+    def _fallo_resumen(self, e: Exception) -> Dict[str, Any]:
+        # Si el resumen falla se conserva el historial completo; se reintenta en el próximo turno
+        print(f"ADVERTENCIA: No se pudo resumir el historial. Detalle: {e}")
+        with self._lock:
+            self.fallos_resumen += 1
+        return {}
+
+    def plegar(self, state) -> Dict[str, Any]:
+        """Actualización del estado que pliega los turnos viejos (vacía si no corresponde)."""
+        viejos = self._a_plegar(state["messages"])
+        if not viejos or self.resumidor is None:
+            return {}
+        try:
+            respuesta = self.resumidor.invoke(self._prompt_resumen(state.get("resumen"), viejos))
+        except Exception as e:
+            return self._fallo_resumen(e)
+        return self._resultado_plegado(viejos, respuesta.content.strip())
+
+    async def aplegar(self, state) -> Dict[str, Any]:
+        viejos = self._a_plegar(state["messages"])
+        if not viejos or self.resumidor is None:
+            return {}
+        try:
+            respuesta = await self.resumidor.ainvoke(self._prompt_resumen(state.get("resumen"), viejos))
+        except Exception as e:
+            return self._fallo_resumen(e)
+        return self._resultado_plegado(viejos, respuesta.content.strip())
+
+    # --- Prompt de los agentes --- #
+    @staticmethod
+    def mensaje_resumen(resumen: Optional[str]) -> List[Any]:
+        if not resumen:
+            return []
+        return [SystemMessage(content=f"Resumen de la conversación anterior con este usuario:\n{resumen}")]
+
+    # --- Métricas --- #
+    @staticmethod
+    def _tramo(turnos: int) -> str:
+        for desde, hasta in TRAMOS_TURNOS:
+            if hasta is None or turnos <= hasta:
+                return f"{desde}+" if hasta is None else f"{desde}-{hasta}"
+        return ""
+
+    def registrar_envio(self, mensajes_prompt: List[Any], turnos_hilo: int):
+        """Anota los tokens enviados al LLM en una llamada, agrupados por la longitud del hilo."""
+        tokens = self.contar_tokens(mensajes_prompt)
+        with self._lock:
+            acumulado = self._tokens[self._tramo(max(1, turnos_hilo))]
+            acumulado[0] += 1
+            acumulado[1] += tokens
+            acumulado[2] = max(acumulado[2], tokens)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turnos_literales": self.turnos,
+                "resumir_cada": self.resumir_cada,
+                "plegados": self.plegados,
+                "mensajes_plegados": self.mensajes_plegados,
+                "fallos_resumen": self.fallos_resumen,
+                "tokens_por_llamada": {
+                    tramo: {
+                        "llamadas": llamadas,
+                        "media": round(total / llamadas, 1) if llamadas else None,
+                        "maximo": maximo,
+                    }
+                    for tramo, (llamadas, total, maximo) in self._tokens.items()
+                },
+            }
@@ -0,0 +1,182 @@
+"""
+Índice vectorial local en memoria mapeada, alternativa a Elasticsearch para la búsqueda documental.
+
+La exportación toma una instantánea del índice de Elasticsearch y la guarda como una matriz
+float16/float32 normalizada (vectores.npy) más un archivo de metadatos (metadatos.json).
+Al arrancar, la matriz se abre con np.load(mmap_mode="r") y la búsqueda es un producto
+matricial + top-k con NumPy, sin red de por medio.
+
+Exportación:
+    python -m servicios.indice_local --salida indice_local --dtype float16
+"""
+import os
+import json
+import argparse
+import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+ARCHIVO_VECTORES = "vectores.npy"
+ARCHIVO_METADATOS = "metadatos.json"
+# Filas por bloque de la búsqueda: con float16 solo se convierte a float32 un bloque a la vez
+FILAS_POR_BLOQUE = 2048
+MENSAJE_SOLO_LECTURA = (
+    "El índice vectorial local es una instantánea de solo lectura. Para cambiar su contenido, ingeste en "
+    "Elasticsearch y vuelva a exportarlo (python ingesta.py --exportar-local o python -m servicios.indice_local)."
+)
+
+
+class IndiceSoloLectura(Exception):
+    """Se intentó escribir en un IndiceVectorialLocal."""
+
+
+def exportar_desde_elasticsearch(cliente, indice: str, destino: str, dtype: str = "float16",
+                                 campo_texto: str = "text", campo_vector: str = "vector") -> int:
+    """Vuelca todos los chunks del índice a `destino`. Devuelve el número de documentos exportados."""
+    from elasticsearch.helpers import scan
+
+    documentos, vectores = [], []
+    for hit in scan(cliente, index=indice, query={"query": {"match_all": {}}},
+                    _source=[campo_texto, campo_vector, "metadata"]):
+        fuente = hit["_source"]
+        if campo_vector not in fuente:
+            continue
+        documentos.append({"id": hit["_id"], "text": fuente.get(campo_texto, ""), "metadata": fuente.get("metadata", {})})
+        vectores.append(fuente[campo_vector])
+
+    if not vectores:
+        raise ValueError(f"El índice '{indice}' no tiene documentos con el campo '{campo_vector}'.")
+
+    # Versión de ingesta publicada por el pipeline (sirve para invalidar la caché semántica)
+    mapping = cliente.indices.get_mapping(index=indice)
+    mapping = getattr(mapping, "body", mapping)
+    meta = next(iter(mapping.values()))["mappings"].get("_meta", {})
+
+    return guardar_exportacion(destino, documentos, vectores, dtype, indice, meta.get("version_ingesta"))
+
+
+def guardar_exportacion(destino: str, documentos: List[dict], vectores: List[List[float]], dtype: str = "float16",
+                        indice: str = None, version_ingesta: str = None) -> int:
+    """Escribe una exportación (vectores normalizados + metadatos) que IndiceVectorialLocal puede abrir."""
+    matriz = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    matriz = matriz / np.where(normas == 0, 1, normas)
+
+    os.makedirs(destino, exist_ok=True)
+    np.save(os.path.join(destino, ARCHIVO_VECTORES), matriz.astype(dtype))
+    with open(os.path.join(destino, ARCHIVO_METADATOS), "w", encoding="utf-8") as archivo:
+        json.dump({
+            "indice": indice,
+            "dtype": dtype,
+            "dimension": int(matriz.shape[1]),
+            "version_ingesta": version_ingesta,
+            "exportado": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "documentos": documentos,
+        }, archivo, ensure_ascii=False)
+
+    return len(documentos)
+
+
+class IndiceVectorialLocal(VectorStore):
+    """
+    Vector store de solo lectura sobre una exportación local.
+    Mantiene el contrato de ElasticsearchStore.similarity_search_with_score: el score es la
+    similitud coseno llevada a [0, 1] como (1 + coseno) / 2, así que el corte `score > 0.7` se conserva.
+    """
+
+    def __init__(self, ruta: str, embedding):
+        self.ruta = ruta
+        self.embedding = embedding
+        self._vectores = np.load(os.path.join(ruta, ARCHIVO_VECTORES), mmap_mode="r")
+        with open(os.path.join(ruta, ARCHIVO_METADATOS), encoding="utf-8") as archivo:
+            self._info = json.load(archivo)
+        self._documentos = self._info["documentos"]
+
+        if len(self._documentos) != self._vectores.shape[0]:
+            raise ValueError(f"La exportación en '{ruta}' está incompleta: metadatos y vectores no coinciden.")
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def version(self) -> str:
+        """Versión de la instantánea (para la caché semántica)."""
+        return str(self._info.get("version_ingesta") or self._info.get("exportado"))
+
+    def documento(self, posicion: int) -> Document:
+        datos = self._documentos[posicion]
+        return Document(page_content=datos["text"], metadata=datos.get("metadata", {}), id=datos.get("id"))
+
+    def textos(self) -> List[str]:
+        return [datos["text"] for datos in self._documentos]
+
+    # --- Búsqueda --- #
+    def buscar_por_vector(self, vector: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """Top-k (posición, score) por similitud coseno sobre la matriz mapeada."""
+        consulta = np.asarray(vector, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma:
+            consulta = consulta / norma
+
+        # Por bloques: `matriz @ consulta` con float16 copiaría la matriz mapeada entera a float32 en
+        # cada búsqueda, y float16 @ float16 no usa BLAS. Con float32 astype no copia.
+        total = self._vectores.shape[0]
+        similitudes = np.empty(total, dtype=np.float32)
+        for inicio in range(0, total, FILAS_POR_BLOQUE):
+            bloque = self._vectores[inicio:inicio + FILAS_POR_BLOQUE]
+            similitudes[inicio:inicio + len(bloque)] = bloque.astype(np.float32, copy=False) @ consulta
+        k = min(k, similitudes.shape[0])
+        if k <= 0:
+            return []
+        if k < similitudes.shape[0]:
+            candidatos = np.argpartition(-similitudes, k - 1)[:k]
+        else:
+            candidatos = np.arange(similitudes.shape[0])
+        orden = candidatos[np.argsort(-similitudes[candidatos])]
+        return [(int(i), float((1.0 + similitudes[i]) / 2.0)) for i in orden]
+
+    def similarity_search_by_vector_with_score(self, vector: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return [(self.documento(i), score) for i, score in self.buscar_por_vector(vector, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(await self.embedding.aembed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    # --- Escritura: el índice local es una instantánea de solo lectura --- #
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise IndiceSoloLectura(MENSAJE_SOLO_LECTURA)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        raise IndiceSoloLectura(MENSAJE_SOLO_LECTURA)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise IndiceSoloLectura(MENSAJE_SOLO_LECTURA)
+
+
+if __name__ == "__main__":
+    from elasticsearch import Elasticsearch
+
+    parser = argparse.ArgumentParser(description="Exporta el índice de Elasticsearch a un índice vectorial local.")
+    parser.add_argument("--salida", default=os.environ.get("INDICE_LOCAL_RUTA", "indice_local"))
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    parser.add_argument("--indice", default=os.environ.get("ELASTIC_INDEX"))
+    args = parser.parse_args()
+
+    cliente = Elasticsearch(
+        os.environ.get("ELASTIC_URL"),
+        basic_auth=(os.environ.get("ELASTIC_USER"), os.environ.get("ELASTIC_PASSWORD")),
+    )
+    total = exportar_desde_elasticsearch(cliente, args.indice, args.salida, args.dtype)
+    print(f"Exportación finalizada: {total} documentos en '{args.salida}' ({args.dtype}).")
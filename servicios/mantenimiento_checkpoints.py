@@ -0,0 +1,260 @@
+"""
+Mantenimiento de las tablas de PostgresSaver (checkpoints, checkpoint_writes, checkpoint_blobs).
+
+- Compactación: conserva solo los últimos K checkpoints de cada hilo (y namespace de subgrafo);
+  borra las escrituras pendientes y los blobs que ya no referencia ningún checkpoint.
+- Expiración: elimina por completo los hilos sin actividad hace más de un TTL, opcionalmente
+  archivándolos antes en un JSONL comprimido con gzip.
+- Trabaja por lotes de hilos, cada uno en su propia transacción corta con lock_timeout, para no
+  bloquear las tablas vivas. Informa filas y bytes recuperados (pg_column_size de lo borrado).
+
+Uso:
+    python -m servicios.mantenimiento_checkpoints --mantener 1 --ttl-dias 30 --archivar archivo_checkpoints
+"""
+import os
+import json
+import gzip
+import time
+import base64
+import argparse
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+
+TABLAS = ("checkpoints", "checkpoint_writes", "checkpoint_blobs")
+
+# Un solo proceso de mantenimiento a la vez entre todas las instancias
+CLAVE_BLOQUEO = "mantenimiento_checkpoints"
+
+QUERY_HILOS_A_COMPACTAR = """
+SELECT thread_id FROM checkpoints
+WHERE thread_id > %(desde)s
+GROUP BY thread_id, checkpoint_ns
+HAVING COUNT(*) > %(mantener)s
+ORDER BY thread_id
+LIMIT %(lote)s
+"""
+
+QUERY_HILOS_EXPIRADOS = """
+SELECT thread_id FROM checkpoints
+WHERE thread_id > %(desde)s
+GROUP BY thread_id
+HAVING MAX((checkpoint->>'ts')::timestamptz) < now() - make_interval(days => %(ttl_dias)s)
+ORDER BY thread_id
+LIMIT %(lote)s
+"""
+
+# checkpoint_id es un UUIDv6: su orden lexicográfico es el orden temporal (el mismo que usa PostgresSaver)
+QUERY_COMPACTAR_CHECKPOINTS = """
+WITH ranking AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id,
+           ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS posicion
+    FROM checkpoints
+    WHERE thread_id = ANY(%(hilos)s)
+), borrados AS (
+    DELETE FROM checkpoints c
+    USING ranking r
+    WHERE r.posicion > %(mantener)s
+      AND c.thread_id = r.thread_id AND c.checkpoint_ns = r.checkpoint_ns AND c.checkpoint_id = r.checkpoint_id
+    RETURNING pg_column_size(c.*) AS bytes
+)
+SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM borrados
+"""
+
+QUERY_HUERFANOS_WRITES = """
+WITH borrados AS (
+    DELETE FROM checkpoint_writes w
+    WHERE w.thread_id = ANY(%(hilos)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM checkpoints c
+          WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns AND c.checkpoint_id = w.checkpoint_id
+      )
+    RETURNING pg_column_size(w.*) AS bytes
+)
+SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM borrados
+"""
+
+QUERY_HUERFANOS_BLOBS = """
+WITH borrados AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = ANY(%(hilos)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM checkpoints c
+          WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+            AND c.checkpoint->'channel_versions'->>b.channel = b.version
+      )
+    RETURNING pg_column_size(b.*) AS bytes
+)
+SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM borrados
+"""
+
+QUERY_BORRAR_HILOS = """
+WITH borrados AS (
+    DELETE FROM {tabla} t WHERE t.thread_id = ANY(%(hilos)s)
+    RETURNING pg_column_size(t.*) AS bytes
+)
+SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM borrados
+"""
+
+
+def _serializable(valor):
+    if isinstance(valor, (bytes, memoryview)):
+        return {"base64": base64.b64encode(bytes(valor)).decode("ascii")}
+    return valor
+
+
+class MantenimientoCheckpoints:
+    """Una ejecución de mantenimiento sobre una conexión psycopg (autocommit)."""
+
+    def __init__(self, conn, mantener: int = 1, ttl_dias: Optional[float] = None, lote: int = 100,
+                 pausa_s: float = 0.1, archivar_en: Optional[str] = None, lock_timeout: str = "2s"):
+        if mantener < 1:
+            raise ValueError("Se debe conservar al menos el último checkpoint de cada hilo.")
+        self.conn = conn
+        self.mantener = mantener
+        self.ttl_dias = ttl_dias
+        self.lote = lote
+        self.pausa_s = pausa_s
+        self.archivar_en = archivar_en
+        self.lock_timeout = lock_timeout
+        self._archivo = None
+        self.reporte: Dict[str, Any] = {
+            "hilos_compactados": 0,
+            "hilos_expirados": 0,
+            "lotes": 0,
+            "archivo": None,
+            **{tabla: {"filas": 0, "bytes": 0} for tabla in TABLAS},
+        }
+
+    def _acumular(self, tabla: str, resultado):
+        filas, bytes_ = resultado
+        self.reporte[tabla]["filas"] += int(filas)
+        self.reporte[tabla]["bytes"] += int(bytes_)
+
+    def _hilos(self, query: str, desde: str) -> List[str]:
+        filas = self.conn.execute(query, {
+            "desde": desde, "mantener": self.mantener, "ttl_dias": self.ttl_dias, "lote": self.lote,
+        }).fetchall()
+        # La consulta de compactación agrupa por namespace: un hilo puede aparecer más de una vez
+        return list(dict.fromkeys(fila[0] for fila in filas))
+
+    def _en_lotes(self, query: str, procesar):
+        desde = ""
+        while True:
+            hilos = self._hilos(query, desde)
+            if not hilos:
+                return
+            with self.conn.transaction():
+                self.conn.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+                procesar(hilos)
+            self.reporte["lotes"] += 1
+            desde = hilos[-1]
+            if self.pausa_s:
+                time.sleep(self.pausa_s)
+
+    # --- Expiración --- #
+    def _archivar(self, hilos: List[str]):
+        if self._archivo is None:
+            os.makedirs(self.archivar_en, exist_ok=True)
+            marca = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            ruta = os.path.join(self.archivar_en, f"checkpoints_{marca}.jsonl.gz")
+            self._archivo = gzip.open(ruta, "wt", encoding="utf-8")
+            self.reporte["archivo"] = ruta
+        for tabla in TABLAS:
+            cursor = self.conn.execute(f"SELECT * FROM {tabla} WHERE thread_id = ANY(%(hilos)s)", {"hilos": hilos})
+            columnas = [c.name for c in cursor.description]
+            for fila in cursor:
+                registro = {"tabla": tabla, **{c: _serializable(v) for c, v in zip(columnas, fila)}}
+                self._archivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        self._archivo.flush()
+
+    def _expirar_lote(self, hilos: List[str]):
+        if self.archivar_en:
+            self._archivar(hilos)
+        for tabla in TABLAS:
+            self._acumular(tabla, self.conn.execute(QUERY_BORRAR_HILOS.format(tabla=tabla), {"hilos": hilos}).fetchone())
+        self.reporte["hilos_expirados"] += len(hilos)
+
+    # --- Compactación --- #
+    def _compactar_lote(self, hilos: List[str]):
+        parametros = {"hilos": hilos, "mantener": self.mantener}
+        self._acumular("checkpoints", self.conn.execute(QUERY_COMPACTAR_CHECKPOINTS, parametros).fetchone())
+        self._acumular("checkpoint_writes", self.conn.execute(QUERY_HUERFANOS_WRITES, parametros).fetchone())
+        self._acumular("checkpoint_blobs", self.conn.execute(QUERY_HUERFANOS_BLOBS, parametros).fetchone())
+        self.reporte["hilos_compactados"] += len(hilos)
+
+    def ejecutar(self) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        try:
+            # Primero se expira (no tiene sentido compactar hilos que se van a borrar)
+            if self.ttl_dias:
+                self._en_lotes(QUERY_HILOS_EXPIRADOS, self._expirar_lote)
+            self._en_lotes(QUERY_HILOS_A_COMPACTAR, self._compactar_lote)
+        finally:
+            if self._archivo is not None:
+                self._archivo.close()
+        self.reporte["bytes_recuperados"] = sum(self.reporte[tabla]["bytes"] for tabla in TABLAS)
+        self.reporte["duracion_s"] = round(time.perf_counter() - inicio, 3)
+        return self.reporte
+
+
+def ejecutar_mantenimiento(conn, **opciones) -> Optional[Dict[str, Any]]:
+    """Ejecuta el mantenimiento si ninguna otra instancia lo está haciendo (advisory lock). None si se omitió."""
+    if not conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (CLAVE_BLOQUEO,)).fetchone()[0]:
+        return None
+    try:
+        return MantenimientoCheckpoints(conn, **opciones).ejecutar()
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (CLAVE_BLOQUEO,))
+
+
+def opciones_desde_entorno() -> Dict[str, Any]:
+    ttl = os.environ.get("CHECKPOINTS_TTL_DIAS")
+    return {
+        "mantener": int(os.environ.get("CHECKPOINTS_MANTENER", "1")),
+        "ttl_dias": float(ttl) if ttl else None,
+        "lote": int(os.environ.get("CHECKPOINTS_LOTE", "100")),
+        "archivar_en": os.environ.get("CHECKPOINTS_ARCHIVAR_EN") or None,
+    }
+
+
+def iniciar_mantenimiento_periodico(pool, cada_s: float, **opciones) -> threading.Thread:
+    """Job de fondo: ejecuta el mantenimiento cada `cada_s` segundos con una conexión del pool compartido."""
+    def ciclo():
+        while True:
+            time.sleep(cada_s)
+            try:
+                with pool.connection() as conn:
+                    reporte = ejecutar_mantenimiento(conn, **opciones)
+                if reporte:
+                    print(f"Mantenimiento de checkpoints: {reporte['bytes_recuperados']} bytes recuperados "
+                          f"({reporte['hilos_expirados']} hilos expirados, {reporte['hilos_compactados']} compactados).")
+            except Exception as e:
+                print(f"ADVERTENCIA: Falló el mantenimiento de checkpoints. Detalle: {e}")
+
+    hilo = threading.Thread(target=ciclo, name="mantenimiento_checkpoints", daemon=True)
+    hilo.start()
+    return hilo
+
+
+if __name__ == "__main__":
+    import psycopg
+
+    por_defecto = opciones_desde_entorno()
+    parser = argparse.ArgumentParser(description="Compacta, expira y archiva los checkpoints de PostgresSaver.")
+    parser.add_argument("--mantener", type=int, default=por_defecto["mantener"], help="Checkpoints a conservar por hilo.")
+    parser.add_argument("--ttl-dias", type=float, default=por_defecto["ttl_dias"], help="Expirar hilos inactivos hace más de N días.")
+    parser.add_argument("--lote", type=int, default=por_defecto["lote"], help="Hilos por transacción.")
+    parser.add_argument("--pausa-s", type=float, default=0.1, help="Pausa entre lotes.")
+    parser.add_argument("--archivar", default=por_defecto["archivar_en"], help="Carpeta donde archivar los hilos expirados (.jsonl.gz).")
+    args = parser.parse_args()
+
+    with psycopg.connect(os.environ["POSTGRES_URI"], autocommit=True) as conexion:
+        resultado = ejecutar_mantenimiento(
+            conexion, mantener=args.mantener, ttl_dias=args.ttl_dias, lote=args.lote,
+            pausa_s=args.pausa_s, archivar_en=args.archivar,
+        )
+    if resultado is None:
+        print("Otra instancia está ejecutando el mantenimiento. No se hizo nada.")
+    else:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
@@ -0,0 +1,226 @@
+"""
+Métricas de la instancia en formato de texto de Prometheus (expuestas en /metrics).
+
+Registro propio y mínimo (contadores, indicadores e histogramas con etiquetas), sin dependencias externas.
+Con METRICAS=false los registros no hacen nada: `observar`/`incrementar` retornan de inmediato
+y `cronometro` devuelve un contexto vacío, así que instrumentar el código no cuesta nada.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Límites de los histogramas de latencia, en segundos
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LIMITES_ITERACIONES = (1, 2, 3, 4, 5, 6, 8, 10, 15, 25)
+LIMITES_TOKENS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+_NULO = nullcontext()
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(pares: Iterable[Tuple[str, str]]) -> str:
+    pares = list(pares)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, registro: "RegistroMetricas", nombre: str, ayuda: str, etiquetas: Tuple[str, ...]):
+        self._registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def _clave(self, etiquetas: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(etiquetas.get(nombre, "")) for nombre in self.etiquetas)
+
+    def exponer(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            series = {clave: list(valor) for clave, valor in self._series.items()}
+        for clave, valor in sorted(series.items()):
+            lineas.extend(self._lineas(list(zip(self.etiquetas, clave)), valor))
+        return lineas
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def incrementar(self, valor: float = 1, **etiquetas):
+        if not self._registro.habilitado:
+            return
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.setdefault(clave, [0])
+            serie[0] += valor
+
+    def _lineas(self, pares, valor) -> List[str]:
+        return [f"{self.nombre}{_formatear_etiquetas(pares)} {_numero(valor[0])}"]
+
+
+class Indicador(_Metrica):
+    tipo = "gauge"
+
+    def fijar(self, valor: float, **etiquetas):
+        if not self._registro.habilitado:
+            return
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._series[clave] = [valor]
+
+    def _lineas(self, pares, valor) -> List[str]:
+        return [f"{self.nombre}{_formatear_etiquetas(pares)} {_numero(valor[0])}"]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, registro, nombre, ayuda, etiquetas, limites: Tuple[float, ...] = LIMITES_LATENCIA):
+        super().__init__(registro, nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor: float, **etiquetas):
+        if not self._registro.habilitado:
+            return
+        clave = self._clave(etiquetas)
+        with self._lock:
+            # [conteo por límite..., +Inf, suma]
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [0] * (len(self.limites) + 2)
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            else:
+                serie[len(self.limites)] += 1
+            serie[-1] += valor
+
+    def cronometro(self, **etiquetas):
+        """Contexto que observa su duración; vacío si las métricas están desactivadas."""
+        if not self._registro.habilitado:
+            return _NULO
+        return self._cronometrar(etiquetas)
+
+    @contextmanager
+    def _cronometrar(self, etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def _lineas(self, pares, valor) -> List[str]:
+        lineas, acumulado = [], 0
+        for limite, conteo in zip(self.limites + (float("inf"),), valor[:-1]):
+            acumulado += conteo
+            le = "+Inf" if limite == float("inf") else _numero(limite)
+            lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(pares + [('le', le)])} {acumulado}")
+        lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(pares)} {_numero(valor[-1])}")
+        lineas.append(f"{self.nombre}_count{_formatear_etiquetas(pares)} {acumulado}")
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self, habilitado: bool = True):
+        self.habilitado = habilitado
+        self._metricas: List[_Metrica] = []
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+        metrica = Contador(self, nombre, ayuda, etiquetas)
+        self._metricas.append(metrica)
+        return metrica
+
+    def indicador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Indicador:
+        metrica = Indicador(self, nombre, ayuda, etiquetas)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+                   limites: Tuple[float, ...] = LIMITES_LATENCIA) -> Histograma:
+        metrica = Histograma(self, nombre, ayuda, etiquetas, limites)
+        self._metricas.append(metrica)
+        return metrica
+
+    def exponer(self) -> str:
+        """Todas las métricas en el formato de exposición de texto de Prometheus (0.0.4)."""
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRO = RegistroMetricas(habilitado=os.environ.get("METRICAS", "true").lower() == "true")
+
+AGENTE_DURACION = REGISTRO.histograma(
+    "agente_duracion_segundos", "Latencia de extremo a extremo de un turno del agente.", ("endpoint", "estado")
+)
+SUPERVISOR_DURACION = REGISTRO.histograma(
+    "supervisor_duracion_segundos", "Latencia de la decisión de ruta del supervisor.", ("ruta", "nivel")
+)
+REACT_ITERACIONES = REGISTRO.histograma(
+    "agente_react_iteraciones", "Llamadas al LLM de un agente ReAct por turno.", ("agente",), LIMITES_ITERACIONES
+)
+HERRAMIENTA_DURACION = REGISTRO.histograma(
+    "herramienta_duracion_segundos", "Tiempo de cada herramienta por fase (bd/busqueda o formato).", ("herramienta", "fase")
+)
+EMBEDDINGS_DURACION = REGISTRO.histograma(
+    "embeddings_duracion_segundos", "Tiempo para obtener el embedding de una consulta según de dónde salió.", ("origen",)
+)
+HERRAMIENTA_TOKENS = REGISTRO.histograma(
+    "herramienta_tokens", "Tokens estimados del resultado de una herramienta antes y después de compactarlo.",
+    ("herramienta", "etapa"), LIMITES_TOKENS
+)
+LLM_TOKENS = REGISTRO.contador("llm_tokens_total", "Tokens consumidos por el LLM.", ("modelo", "tipo"))
+LLM_LLAMADAS = REGISTRO.contador("llm_llamadas_total", "Llamadas al LLM.", ("modelo",))
+LLM_COLA = REGISTRO.indicador("llm_cola_llamadas", "Llamadas al LLM esperando turno en el planificador.", ("prioridad",))
+LLM_EN_CURSO = REGISTRO.indicador("llm_llamadas_en_curso", "Llamadas al LLM en curso.")
+LLM_ESPERA = REGISTRO.histograma(
+    "llm_espera_segundos", "Tiempo en la cola del planificador antes de llamar al LLM.", ("prioridad",)
+)
+LLM_RECHAZOS = REGISTRO.contador(
+    "llm_rechazos_total", "Llamadas al LLM rechazadas por el planificador (respuesta 503 reintentable).", ("motivo",)
+)
+LLM_REINTENTOS = REGISTRO.contador("llm_reintentos_total", "Reintentos tras un límite de tasa del proveedor.")
+
+
+class CallbackTokens(BaseCallbackHandler):
+    """Cuenta los tokens de entrada/salida de cada llamada al LLM a partir de `usage_metadata`."""
+
+    def on_llm_end(self, response, **kwargs):
+        salida = response.llm_output or {}
+        for generaciones in response.generations:
+            for generacion in generaciones:
+                mensaje = getattr(generacion, "message", None)
+                uso = getattr(mensaje, "usage_metadata", None) or {}
+                modelo = (getattr(mensaje, "response_metadata", None) or {}).get("model_name") \
+                    or salida.get("model_name") or "desconocido"
+                LLM_LLAMADAS.incrementar(modelo=modelo)
+                if uso:
+                    LLM_TOKENS.incrementar(uso.get("input_tokens", 0), modelo=modelo, tipo="entrada")
+                    LLM_TOKENS.incrementar(uso.get("output_tokens", 0), modelo=modelo, tipo="salida")
+
+
+def instrumentar_modelo(modelo):
+    """Agrega el contador de tokens a los callbacks del modelo (no hace nada con las métricas desactivadas)."""
+    if REGISTRO.habilitado and hasattr(modelo, "callbacks"):
+        modelo.callbacks = list(modelo.callbacks or []) + [CallbackTokens()]
+    return modelo
@@ -0,0 +1,52 @@
+"""
+Reglas de acceso por rol, compartidas por los agentes (create_agent_for_role) y la API REST directa.
+
+- Administrador: registra, consulta y lista cualquier solicitud, ve los totales globales y actualiza
+  estados (una o varias).
+- General: registra, consulta y lista solo sus propias solicitudes y ve solo sus totales.
+- Cualquier otro rol: ninguna operación.
+"""
+from typing import List, Optional
+
+ADMINISTRADOR = "Administrador"
+GENERAL = "General"
+
+HERRAMIENTAS_POR_ROL = {
+    ADMINISTRADOR: [
+        "registrar_solicitud", "consultar_estado", "listar_solicitudes", "resumen_solicitudes",
+        "actualizar_solicitud", "actualizar_solicitudes_masivo",
+    ],
+    GENERAL: ["registrar_solicitud", "consultar_estado", "listar_solicitudes", "resumen_solicitudes"],
+}
+
+
+class AccesoDenegado(Exception):
+    """El rol no tiene permiso para la operación solicitada."""
+
+
+def herramientas_permitidas(rol: str) -> List[str]:
+    return HERRAMIENTAS_POR_ROL.get(rol, [])
+
+
+def puede(rol: str, herramienta: str) -> bool:
+    return herramienta in herramientas_permitidas(rol)
+
+
+def exigir(rol: str, herramienta: str):
+    if not puede(rol, herramienta):
+        raise AccesoDenegado(f"El rol '{rol}' no tiene permiso para '{herramienta}'.")
+
+
+def usuario_de_consulta(rol: str, username: str, usuario_solicitado: Optional[str] = None,
+                        herramienta: str = "consultar_estado") -> Optional[str]:
+    """
+    Usuario por el que se filtran las consultas: el Administrador ve todo (o el usuario que pida),
+    el rol General solo sus propias solicitudes.
+    """
+    exigir(rol, herramienta)
+    if rol == ADMINISTRADOR:
+        return usuario_solicitado or None
+    if not username:
+        # Sin usuario no hay filtro posible: nunca se cae en la vista de Administrador
+        raise AccesoDenegado("Falta el usuario para consultar sus solicitudes.")
+    return username
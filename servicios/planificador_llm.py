@@ -0,0 +1,489 @@
+"""
+Planificador de las llamadas al LLM: el mismo modelo lo comparten el supervisor, los agentes de rol,
+el agente de documentación y el resumen del historial, y sin control una ráfaga de turnos termina en
+límites de tasa del proveedor (429) que llegaban a /agent como errores 500.
+
+- `PlanificadorLLM`: a lo sumo `max_concurrencia` llamadas a la vez y un presupuesto de tokens por
+  minuto (balde que se recarga de forma continua). Las llamadas esperan en una cola por prioridad
+  (PRIORIDAD_SUPERVISOR antes que PRIORIDAD_AGENTE antes que PRIORIDAD_RESUMEN; en orden de llegada
+  dentro de cada prioridad). Con la cola llena, o si la espera no cabe en el plazo de la solicitud,
+  rechaza de inmediato con `LLMSaturado` (la API responde 503 con Retry-After).
+- `ChatPlanificado`: envuelve el modelo de chat. Cada llamada pide turno con la prioridad y el plazo
+  del contexto (`prioridad_llm`, `plazo_solicitud`), usa como timeout el tiempo que le queda a la
+  solicitud y, ante un 429, pausa el planificador y reintenta dentro del plazo (`max_reintentos`).
+
+El estado es por proceso: con varias instancias, LLM_TOKENS_POR_MINUTO es el presupuesto de cada una.
+"""
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from servicios.historial import estimar_tokens
+from servicios.metricas import LLM_COLA, LLM_EN_CURSO, LLM_ESPERA, LLM_RECHAZOS, LLM_REINTENTOS
+
+PRIORIDAD_SUPERVISOR = 0
+PRIORIDAD_AGENTE = 1
+PRIORIDAD_RESUMEN = 2
+NOMBRES_PRIORIDAD = {PRIORIDAD_SUPERVISOR: "supervisor", PRIORIDAD_AGENTE: "agente", PRIORIDAD_RESUMEN: "resumen"}
+
+# Motivos de rechazo (etiqueta de llm_rechazos_total)
+COLA_LLENA = "cola_llena"
+PLAZO = "plazo"
+LIMITE_PROVEEDOR = "limite_proveedor"
+
+_PRIORIDAD: contextvars.ContextVar = contextvars.ContextVar("prioridad_llm", default=PRIORIDAD_AGENTE)
+# Instante (time.monotonic) en que vence la solicitud en curso; None sin plazo
+_PLAZO: contextvars.ContextVar = contextvars.ContextVar("plazo_solicitud", default=None)
+
+
+@contextmanager
+def prioridad_llm(prioridad: int):
+    """Las llamadas al LLM dentro del bloque usan esta prioridad (0 es la más alta)."""
+    token = _PRIORIDAD.set(prioridad)
+    try:
+        yield
+    finally:
+        _PRIORIDAD.reset(token)
+
+
+@contextmanager
+def plazo_solicitud(segundos: Optional[float]):
+    """Plazo de la solicitud para las llamadas al LLM del bloque (un plazo anidado no extiende al exterior)."""
+    if not segundos:
+        yield
+        return
+    limite = time.monotonic() + segundos
+    exterior = _PLAZO.get()
+    token = _PLAZO.set(limite if exterior is None else min(limite, exterior))
+    try:
+        yield
+    finally:
+        _PLAZO.reset(token)
+
+
+def tiempo_restante() -> Optional[float]:
+    """Segundos que le quedan a la solicitud en curso (None sin plazo)."""
+    plazo = _PLAZO.get()
+    return None if plazo is None else plazo - time.monotonic()
+
+
+class LLMSaturado(Exception):
+    """El planificador no pudo dar turno a la llamada a tiempo; la solicitud se puede reintentar."""
+
+    def __init__(self, mensaje: str, motivo: str, reintentar_en_s: float = 5.0):
+        super().__init__(mensaje)
+        self.motivo = motivo
+        self.reintentar_en_s = max(1, math.ceil(reintentar_en_s))
+
+
+def es_limite_de_tasa(error: BaseException) -> bool:
+    """429 del proveedor (openai.RateLimitError o cualquier error con status_code 429)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+class _Turno:
+    __slots__ = ("prioridad", "tokens", "encolado", "asignado", "cancelado", "evento", "loop", "futuro")
+
+    def __init__(self, prioridad: int, tokens: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.prioridad = prioridad
+        self.tokens = tokens
+        self.encolado = time.monotonic()
+        self.asignado = False
+        self.cancelado = False
+        # Modo WSGI: el hilo espera un Event; modo ASGI: la corrutina espera un futuro de su event loop
+        self.evento = threading.Event() if loop is None else None
+        self.loop = loop
+        self.futuro = loop.create_future() if loop is not None else None
+
+    def despertar(self):
+        self.asignado = True
+        if self.evento is not None:
+            self.evento.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolver)
+
+    def _resolver(self):
+        if not self.futuro.done():
+            self.futuro.set_result(True)
+
+
+class PlanificadorLLM:
+    def __init__(self, max_concurrencia: int = None, tokens_por_minuto: int = None, max_cola: int = None):
+        self.max_concurrencia = max_concurrencia or int(os.environ.get("LLM_MAX_CONCURRENCIA", "8"))
+        self.tokens_por_minuto = (
+            tokens_por_minuto if tokens_por_minuto is not None
+            else int(os.environ.get("LLM_TOKENS_POR_MINUTO", "0"))
+        )
+        self.max_cola = max_cola if max_cola is not None else int(os.environ.get("LLM_MAX_COLA", "100"))
+
+        self._lock = threading.Lock()
+        self._cola: List = []
+        self._secuencia = itertools.count()
+        self._en_cola: Dict[int, int] = {}
+        self._en_curso = 0
+        self._tokens = float(self.tokens_por_minuto)
+        self._recargado = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._temporizador: Optional[threading.Timer] = None
+        self._temporizador_vence = 0.0
+
+        self.asignadas = 0
+        self.esperas = 0
+        self.espera_total_s = 0.0
+        self.rechazadas: Dict[str, int] = {}
+        self.pausas = 0
+
+    # --- Asignación (siempre con self._lock tomado) --- #
+    def _recargar(self, ahora: float):
+        if self.tokens_por_minuto:
+            self._tokens = min(
+                self.tokens_por_minuto, self._tokens + (ahora - self._recargado) * self.tokens_por_minuto / 60
+            )
+        self._recargado = ahora
+
+    def _espera_para(self, turno: _Turno, ahora: float) -> float:
+        """0 si el turno puede empezar ya; si no, segundos hasta que podría (inf: falta un lugar libre)."""
+        if self._en_curso >= self.max_concurrencia:
+            return math.inf
+        if ahora < self._pausa_hasta:
+            return self._pausa_hasta - ahora
+        if self.tokens_por_minuto:
+            # Una llamada más grande que el presupuesto entero espera a tener el balde lleno
+            necesarios = min(turno.tokens, self.tokens_por_minuto)
+            if self._tokens < necesarios:
+                return (necesarios - self._tokens) * 60 / self.tokens_por_minuto
+        return 0.0
+
+    def _asignar(self):
+        ahora = time.monotonic()
+        self._recargar(ahora)
+        while self._cola:
+            turno = self._cola[0][2]
+            if turno.cancelado:
+                heapq.heappop(self._cola)
+                continue
+            # Orden estricto: si la primera no puede empezar, las de menor prioridad tampoco
+            espera = self._espera_para(turno, ahora)
+            if espera > 0:
+                if espera != math.inf:
+                    self._programar(ahora + espera)
+                break
+            heapq.heappop(self._cola)
+            self._salir_de_cola(turno)
+            self._en_curso += 1
+            self._tokens -= turno.tokens if self.tokens_por_minuto else 0
+            self.asignadas += 1
+            turno.despertar()
+        LLM_EN_CURSO.fijar(self._en_curso)
+
+    def _salir_de_cola(self, turno: _Turno):
+        self._en_cola[turno.prioridad] -= 1
+        LLM_COLA.fijar(self._en_cola[turno.prioridad], prioridad=NOMBRES_PRIORIDAD.get(turno.prioridad, turno.prioridad))
+
+    def _programar(self, vence: float):
+        """Vuelve a revisar la cola cuando haya tokens (o termine la pausa), aunque nadie libere un lugar."""
+        if self._temporizador is not None and self._temporizador_vence <= vence:
+            return
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+        self._temporizador = threading.Timer(max(0.0, vence - time.monotonic()), self._al_vencer)
+        self._temporizador.daemon = True
+        self._temporizador_vence = vence
+        self._temporizador.start()
+
+    def _al_vencer(self):
+        with self._lock:
+            self._temporizador = None
+            self._asignar()
+
+    def _rechazar(self, motivo: str, mensaje: str, reintentar_en_s: float) -> LLMSaturado:
+        self.rechazadas[motivo] = self.rechazadas.get(motivo, 0) + 1
+        LLM_RECHAZOS.incrementar(motivo=motivo)
+        return LLMSaturado(mensaje, motivo, reintentar_en_s)
+
+    # --- Pedir y liberar turno --- #
+    def _encolar(self, prioridad: int, tokens: int, plazo: Optional[float], loop=None) -> _Turno:
+        with self._lock:
+            if sum(self._en_cola.values()) >= self.max_cola:
+                raise self._rechazar(COLA_LLENA, "Demasiadas llamadas al LLM en espera.", 2)
+            ahora = time.monotonic()
+            if plazo is not None:
+                restante = plazo - ahora
+                # Falla rápido si ni siquiera los tokens de esta llamada se recargan antes del plazo
+                deficit = min(tokens, self.tokens_por_minuto) - self._tokens
+                espera_tokens = deficit * 60 / self.tokens_por_minuto if self.tokens_por_minuto and deficit > 0 else 0
+                espera_minima = max(espera_tokens, self._pausa_hasta - ahora)
+                if restante <= 0 or espera_minima > restante:
+                    raise self._rechazar(PLAZO, "La llamada al LLM no alcanzaría a empezar dentro del plazo.",
+                                         max(espera_minima, 1))
+            turno = _Turno(prioridad, tokens, loop)
+            heapq.heappush(self._cola, (prioridad, next(self._secuencia), turno))
+            self._en_cola[prioridad] = self._en_cola.get(prioridad, 0) + 1
+            LLM_COLA.fijar(self._en_cola[prioridad], prioridad=NOMBRES_PRIORIDAD.get(prioridad, prioridad))
+            self._asignar()
+        return turno
+
+    def _cancelar(self, turno: _Turno) -> bool:
+        """Saca de la cola un turno que se cansó de esperar; False si ya se le había asignado."""
+        with self._lock:
+            if turno.asignado:
+                return False
+            turno.cancelado = True
+            self._salir_de_cola(turno)
+            return True
+
+    def _registrar_espera(self, turno: _Turno):
+        espera = time.monotonic() - turno.encolado
+        LLM_ESPERA.observar(espera, prioridad=NOMBRES_PRIORIDAD.get(turno.prioridad, turno.prioridad))
+        with self._lock:
+            self.esperas += 1
+            self.espera_total_s += espera
+
+    def rechazo(self, motivo: str, mensaje: str, reintentar_en_s: float) -> LLMSaturado:
+        """Cuenta el rechazo y devuelve la excepción para lanzarla."""
+        with self._lock:
+            return self._rechazar(motivo, mensaje, reintentar_en_s)
+
+    def _vencido(self) -> LLMSaturado:
+        return self.rechazo(PLAZO, "Se agotó el plazo de la solicitud esperando turno para el LLM.",
+                            max(self._pausa_hasta - time.monotonic(), 2))
+
+    def adquirir(self, prioridad: int, tokens: int, plazo: Optional[float] = None) -> _Turno:
+        """Espera turno (modo síncrono); `plazo` es un instante de time.monotonic()."""
+        turno = self._encolar(prioridad, tokens, plazo)
+        espera = None if plazo is None else max(0.0, plazo - time.monotonic())
+        if not turno.evento.wait(espera) and self._cancelar(turno):
+            raise self._vencido()
+        self._registrar_espera(turno)
+        return turno
+
+    async def aadquirir(self, prioridad: int, tokens: int, plazo: Optional[float] = None) -> _Turno:
+        turno = self._encolar(prioridad, tokens, plazo, asyncio.get_running_loop())
+        espera = None if plazo is None else max(0.0, plazo - time.monotonic())
+        try:
+            await asyncio.wait_for(turno.futuro, espera)
+        except asyncio.TimeoutError:
+            if self._cancelar(turno):
+                raise self._vencido()
+        except asyncio.CancelledError:
+            # Si el turno se asignó mientras se cancelaba la tarea, se devuelve el lugar
+            if not self._cancelar(turno):
+                self.liberar(turno)
+            raise
+        self._registrar_espera(turno)
+        return turno
+
+    def liberar(self, turno: _Turno, tokens_reales: Optional[int] = None):
+        """Devuelve el lugar; con `tokens_reales` (usage_metadata) corrige lo descontado del presupuesto."""
+        with self._lock:
+            self._en_curso -= 1
+            if self.tokens_por_minuto and tokens_reales is not None:
+                self._tokens -= tokens_reales - turno.tokens
+            self._asignar()
+
+    def pausar(self, segundos: float):
+        """Nadie empieza una llamada durante `segundos` (tras un 429 del proveedor)."""
+        with self._lock:
+            self.pausas += 1
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+            self._programar(self._pausa_hasta)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            self._recargar(time.monotonic())
+            return {
+                "max_concurrencia": self.max_concurrencia,
+                "tokens_por_minuto": self.tokens_por_minuto or None,
+                "max_cola": self.max_cola,
+                "en_curso": self._en_curso,
+                "en_cola": {NOMBRES_PRIORIDAD.get(p, p): n for p, n in sorted(self._en_cola.items()) if n},
+                "tokens_disponibles": round(self._tokens) if self.tokens_por_minuto else None,
+                "asignadas": self.asignadas,
+                "espera_media_ms": round(1000 * self.espera_total_s / self.esperas, 2) if self.esperas else None,
+                "rechazadas": dict(self.rechazadas),
+                "pausas_por_limite": self.pausas,
+            }
+
+
+# El modelo envuelto se llama sin los callbacks de la ejecución: los eventos (y los tokens de
+# /agent/stream) ya los emite ChatPlanificado; los callbacks propios del envuelto (métricas) se conservan
+_SIN_CALLBACKS = {"callbacks": []}
+
+
+def _como_chunk(mensaje) -> ChatGenerationChunk:
+    """Un modelo sin streaming propio entrega un AIMessage entero: se convierte en un único chunk."""
+    if isinstance(mensaje, AIMessageChunk):
+        return ChatGenerationChunk(message=mensaje)
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content=mensaje.content,
+        additional_kwargs=mensaje.additional_kwargs,
+        response_metadata=mensaje.response_metadata,
+        usage_metadata=getattr(mensaje, "usage_metadata", None),
+        id=mensaje.id,
+        tool_call_chunks=[
+            {"name": llamada["name"], "args": json.dumps(llamada["args"]), "id": llamada.get("id"), "index": i}
+            for i, llamada in enumerate(getattr(mensaje, "tool_calls", None) or [])
+        ],
+    ))
+
+
+def _tokens_usados(mensaje) -> Optional[int]:
+    uso = getattr(mensaje, "usage_metadata", None)
+    return uso.get("total_tokens") if uso else None
+
+
+class ChatPlanificado(BaseChatModel):
+    """Modelo de chat que pide turno al planificador antes de cada llamada al modelo envuelto."""
+
+    modelo: Any
+    planificador: Any
+    # Tokens de salida que se reservan por llamada además de la entrada estimada
+    tokens_salida: int = 400
+    max_reintentos: int = 2
+    # Pausa tras un 429 (se duplica en cada reintento de la misma llamada)
+    pausa_limite_s: float = 1.0
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "planificado"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"modelo": self.modelo.bind_tools(tools, **kwargs)})
+
+    def _opciones(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        restante = tiempo_restante()
+        if restante is None:
+            return kwargs
+        if restante <= 0:
+            raise self._plazo_agotado()
+        envuelto = getattr(self.modelo, "bound", self.modelo)
+        if hasattr(envuelto, "request_timeout"):
+            # Timeout del cliente HTTP (ChatOpenAI) acotado por lo que le queda a la solicitud
+            return dict(kwargs, timeout=restante)
+        return kwargs
+
+    def _plazo_agotado(self) -> LLMSaturado:
+        return self.planificador.rechazo(PLAZO, "Se agotó el plazo de la solicitud esperando al LLM.", 2)
+
+    def _pedido(self, messages) -> tuple:
+        return _PRIORIDAD.get(), estimar_tokens(messages) + self.tokens_salida, _PLAZO.get()
+
+    def _tras_error(self, error: BaseException, intento: int, plazo: Optional[float]):
+        """Decide si reintentar tras un error del modelo; si no, lanza la excepción que corresponde."""
+        if not es_limite_de_tasa(error):
+            if plazo is not None and time.monotonic() >= plazo and "timeout" in type(error).__name__.lower():
+                raise self._plazo_agotado() from error
+            raise error
+        pausa = self.pausa_limite_s * 2 ** intento
+        self.planificador.pausar(pausa)
+        if intento >= self.max_reintentos or (plazo is not None and time.monotonic() + pausa >= plazo):
+            raise self.planificador.rechazo(
+                LIMITE_PROVEEDOR, "El proveedor del LLM está limitando las llamadas.", pausa
+            ) from error
+        LLM_REINTENTOS.incrementar()
+
+    # --- Modo síncrono --- #
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prioridad, tokens, plazo = self._pedido(messages)
+        for intento in itertools.count():
+            turno = self.planificador.adquirir(prioridad, tokens, plazo)
+            usados = None
+            try:
+                mensaje = self.modelo.invoke(messages, config=_SIN_CALLBACKS, stop=stop, **self._opciones(kwargs))
+                usados = _tokens_usados(mensaje)
+                return ChatResult(generations=[ChatGeneration(message=mensaje)])
+            except LLMSaturado:
+                raise
+            except Exception as e:
+                self._tras_error(e, intento, plazo)
+            finally:
+                self.planificador.liberar(turno, usados)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        prioridad, tokens, plazo = self._pedido(messages)
+        for intento in itertools.count():
+            turno = self.planificador.adquirir(prioridad, tokens, plazo)
+            usados, emitido = None, False
+            try:
+                for chunk in self.modelo.stream(messages, config=_SIN_CALLBACKS, stop=stop, **self._opciones(kwargs)):
+                    usados = _tokens_usados(chunk) or usados
+                    emitido = True
+                    yield _como_chunk(chunk)
+                return
+            except LLMSaturado:
+                raise
+            except Exception as e:
+                # Un 429 a mitad de la respuesta no se puede reintentar: el cliente ya recibió tokens
+                if emitido:
+                    raise
+                self._tras_error(e, intento, plazo)
+            finally:
+                self.planificador.liberar(turno, usados)
+
+    # --- Modo asíncrono --- #
+    async def _limitado(self, corrutina):
+        restante = tiempo_restante()
+        if restante is None:
+            return await corrutina
+        try:
+            return await asyncio.wait_for(corrutina, max(restante, 0.0))
+        except asyncio.TimeoutError:
+            raise self._plazo_agotado()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prioridad, tokens, plazo = self._pedido(messages)
+        for intento in itertools.count():
+            turno = await self.planificador.aadquirir(prioridad, tokens, plazo)
+            usados = None
+            try:
+                mensaje = await self._limitado(
+                    self.modelo.ainvoke(messages, config=_SIN_CALLBACKS, stop=stop, **self._opciones(kwargs))
+                )
+                usados = _tokens_usados(mensaje)
+                return ChatResult(generations=[ChatGeneration(message=mensaje)])
+            except LLMSaturado:
+                raise
+            except Exception as e:
+                self._tras_error(e, intento, plazo)
+            finally:
+                self.planificador.liberar(turno, usados)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        prioridad, tokens, plazo = self._pedido(messages)
+        for intento in itertools.count():
+            turno = await self.planificador.aadquirir(prioridad, tokens, plazo)
+            usados, emitido = None, False
+            try:
+                flujo = self.modelo.astream(messages, config=_SIN_CALLBACKS, stop=stop, **self._opciones(kwargs))
+                while True:
+                    try:
+                        chunk = await self._limitado(flujo.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    usados = _tokens_usados(chunk) or usados
+                    emitido = True
+                    yield _como_chunk(chunk)
+                return
+            except LLMSaturado:
+                raise
+            except Exception as e:
+                if emitido:
+                    raise
+                self._tras_error(e, intento, plazo)
+            finally:
+                self.planificador.liberar(turno, usados)
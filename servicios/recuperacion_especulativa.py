@@ -0,0 +1,100 @@
+"""
+Recuperación especulativa: la búsqueda documental (embedding + vector store) arranca a la vez que la
+decisión del supervisor. Si la ruta es DOCUMENTACION el contexto ya está listo y el agente de
+documentación responde en una sola llamada al LLM, sin la ida y vuelta para pedir la herramienta.
+Si la ruta es USUARIO_EXTERNO el resultado se descarta.
+"""
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from servicios.enrutador import DOCUMENTACION
+
+
+class RecuperacionEspeculativa:
+    def __init__(
+        self,
+        buscar: Callable[[str], str],
+        abuscar: Callable[[str], Awaitable[str]],
+        max_hilos: int = None,
+    ):
+        self._buscar = buscar
+        self._abuscar = abuscar
+        self._ejecutor = ThreadPoolExecutor(
+            max_workers=max_hilos or int(os.environ.get("RECUPERACION_ESPECULATIVA_HILOS", "8")),
+            thread_name_prefix="recuperacion_especulativa",
+        )
+        self._lock = threading.Lock()
+        self.lanzadas = 0
+        self.usadas = 0
+        self.descartadas = 0
+        self.errores = 0
+        # Cuánto hubo que esperar a la búsqueda después de decidir la ruta (0 si terminó antes)
+        self.espera_total_s = 0.0
+
+    def _contar(self, campo: str, espera_s: float = 0.0):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+            self.espera_total_s += espera_s
+
+    def _fallo(self, e: Exception):
+        print(f"ADVERTENCIA: Falló la recuperación especulativa; se usará el agente de documentación. Detalle: {e}")
+        self._contar("errores")
+
+    def decidir(self, pregunta: str, decidir: Callable[[], Any]) -> Tuple[Any, Optional[str]]:
+        """Ejecuta `decidir` mientras busca. Devuelve (decisión, contexto o None si no corresponde)."""
+        self._contar("lanzadas")
+        futuro = self._ejecutor.submit(self._buscar, pregunta)
+        try:
+            decision = decidir()
+        except Exception:
+            futuro.cancel()
+            raise
+        if decision.ruta != DOCUMENTACION:
+            futuro.cancel()
+            self._contar("descartadas")
+            return decision, None
+
+        inicio = time.perf_counter()
+        try:
+            contexto = futuro.result()
+        except Exception as e:
+            self._fallo(e)
+            return decision, None
+        self._contar("usadas", time.perf_counter() - inicio)
+        return decision, contexto
+
+    async def adecidir(self, pregunta: str, adecidir: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[str]]:
+        self._contar("lanzadas")
+        tarea = asyncio.ensure_future(self._abuscar(pregunta))
+        try:
+            decision = await adecidir()
+        except Exception:
+            tarea.cancel()
+            raise
+        if decision.ruta != DOCUMENTACION:
+            tarea.cancel()
+            self._contar("descartadas")
+            return decision, None
+
+        inicio = time.perf_counter()
+        try:
+            contexto = await tarea
+        except Exception as e:
+            self._fallo(e)
+            return decision, None
+        self._contar("usadas", time.perf_counter() - inicio)
+        return decision, contexto
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "lanzadas": self.lanzadas,
+                "usadas": self.usadas,
+                "descartadas": self.descartadas,
+                "errores": self.errores,
+                "espera_media_ms": round(1000 * self.espera_total_s / self.usadas, 3) if self.usadas else None,
+            }
@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from servicios.permisos import HERRAMIENTAS_POR_ROL
+
+ROL_DESCONOCIDO = "desconocido"
+
+
+class RegistroGrafos:
+    """
+    Compila un grafo por rol y lo reutiliza durante toda la vida del proceso.
+    La identidad del usuario ya no forma parte del grafo: viaja en el estado de cada invocación.
+    """
+
+    def __init__(self, constructor: Callable[[str], Any], roles=tuple(HERRAMIENTAS_POR_ROL)):
+        self._constructor = constructor
+        self._roles = tuple(roles)
+        self._grafos: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._tiempos_construccion: Dict[str, float] = {}
+
+    def clave_rol(self, rol: str) -> str:
+        """Cualquier rol no reconocido comparte el mismo grafo sin herramientas."""
+        return rol if rol in self._roles else ROL_DESCONOCIDO
+
+    def obtener(self, rol: str):
+        """Devuelve el grafo compilado del rol, construyéndolo solo la primera vez."""
+        clave = self.clave_rol(rol)
+
+        grafo = self._grafos.get(clave)
+        if grafo is not None:
+            with self._lock:
+                self._aciertos += 1
+            return grafo
+
+        with self._lock:
+            # Doble verificación: otro hilo pudo compilarlo mientras esperábamos el lock
+            grafo = self._grafos.get(clave)
+            if grafo is not None:
+                self._aciertos += 1
+                return grafo
+
+            inicio = time.perf_counter()
+            grafo = self._constructor(clave)
+            self._tiempos_construccion[clave] = time.perf_counter() - inicio
+            self._grafos[clave] = grafo
+            self._fallos += 1
+            return grafo
+
+    def precompilar(self):
+        """Compila los grafos de todos los roles conocidos (incluido el desconocido)."""
+        for rol in self._roles + (ROL_DESCONOCIDO,):
+            self.obtener(rol)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "grafos_compilados": sorted(self._grafos.keys()),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "tiempo_construccion_s": {k: round(v, 4) for k, v in self._tiempos_construccion.items()},
+                "tiempo_construccion_total_s": round(sum(self._tiempos_construccion.values()), 4),
+            }
@@ -0,0 +1,172 @@
+"""
+Salida compacta de las herramientas: cada token del resultado de una herramienta se paga en la
+siguiente llamada al LLM y queda en el historial del hilo.
+
+- `registro` / `tabla`: filas como `clave=valor` o como una cabecera de campos más una línea por fila,
+  sin encabezados decorativos ni campos vacíos.
+- `deduplicar_fragmentos`: quita de cada fragmento recuperado el texto que ya aparece en uno anterior
+  (el solapamiento de 200 caracteres entre chunks contiguos) y descarta los casi duplicados.
+- `PresupuestoTokens`: recorta cada resultado a un máximo de tokens por herramienta (por líneas
+  completas) y registra los tokens antes y después en /metrics y /stats.
+"""
+import os
+import threading
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from servicios.metricas import HERRAMIENTA_TOKENS
+
+# Presupuesto por defecto (tokens estimados) de cada herramienta; PRESUPUESTO_TOKENS_<HERRAMIENTA> lo cambia
+PRESUPUESTOS_POR_DEFECTO = {
+    "busqueda_documental": 700,
+    "listar_solicitudes": 400,
+    "actualizar_solicitudes_masivo": 400,
+    "resumen_solicitudes": 300,
+}
+PRESUPUESTO_GENERAL = int(os.environ.get("PRESUPUESTO_TOKENS_HERRAMIENTA", "300"))
+
+# Solapamiento mínimo (palabras seguidas) para considerar que dos fragmentos comparten texto
+SOLAPAMIENTO_MINIMO = 12
+# Si tras quitar lo repetido queda menos de esta fracción del fragmento, se descarta entero
+FRACCION_MINIMA = 0.2
+
+
+def estimar_tokens_texto(texto: str) -> int:
+    """Misma aproximación que servicios.historial.estimar_tokens (~4 caracteres por token)."""
+    return len(texto) // 4
+
+
+def _valor(valor: Any) -> str:
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    if isinstance(valor, float) or type(valor).__name__ == "Decimal":
+        return f"{float(valor):g}"
+    return " ".join(str(valor).split())
+
+
+def _formato_celda(valor: Any) -> str:
+    return "" if valor is None else _valor(valor)
+
+
+def registro(objeto: Any, campos: Sequence[str]) -> str:
+    """Una fila como `campo=valor; campo=valor` (omite los campos vacíos)."""
+    pares = ((campo, getattr(objeto, campo, None)) for campo in campos)
+    return "; ".join(f"{campo}={_valor(valor)}" for campo, valor in pares if valor not in (None, ""))
+
+
+def tabla(objetos: Iterable[Any], campos: Sequence[str]) -> str:
+    """Varias filas: una cabecera con los campos y una línea `v1|v2|...` por fila."""
+    lineas = ["|".join(campos)]
+    lineas.extend("|".join(_formato_celda(getattr(o, campo, None)) for campo in campos) for o in objetos)
+    return "\n".join(lineas)
+
+
+def tokens_sin_compactar(objetos: Iterable[Any], campos: Sequence[str], encabezado: str = "") -> int:
+    """
+    Referencia para las métricas: el mismo encabezado y las mismas filas con un `campo: valor` por
+    línea y todos los campos.
+    """
+    return estimar_tokens_texto(encabezado) + sum(
+        estimar_tokens_texto("\n".join(f"{campo}: {getattr(o, campo, None)}" for campo in campos)) + 1
+        for o in objetos
+    )
+
+
+def _quitar_repetido(palabras: List[str], anteriores: List[List[str]]) -> List[str]:
+    # Comparación por palabras: el solapamiento de los chunks coincide palabra a palabra y es mucho
+    # más barato que comparar carácter por carácter
+    for anterior in anteriores:
+        while len(palabras) >= SOLAPAMIENTO_MINIMO:
+            coincidencia = SequenceMatcher(None, anterior, palabras, autojunk=False).find_longest_match(
+                0, len(anterior), 0, len(palabras)
+            )
+            if coincidencia.size < SOLAPAMIENTO_MINIMO:
+                break
+            inicio, fin = coincidencia.b, coincidencia.b + coincidencia.size
+            # Un corte en medio del fragmento se marca con "…"; en los extremos basta con quitarlo
+            marca = ["…"] if 0 < inicio and fin < len(palabras) else []
+            palabras = palabras[:inicio] + marca + palabras[fin:]
+    return palabras
+
+
+def deduplicar_fragmentos(fragmentos: Sequence[Tuple[str, Any]]) -> Tuple[List[Tuple[str, Any]], int]:
+    """
+    Recibe (texto, metadato) en orden de relevancia y devuelve los fragmentos sin el texto repetido
+    de los anteriores, junto con la cantidad de fragmentos descartados por casi duplicados.
+    """
+    conservados: List[Tuple[List[str], Any]] = []
+    descartados = 0
+    for texto, metadato in fragmentos:
+        palabras = texto.split()
+        restantes = _quitar_repetido(palabras, [p for p, _ in conservados])
+        if len(restantes) < FRACCION_MINIMA * len(palabras):
+            descartados += 1
+            continue
+        conservados.append((restantes, metadato))
+    return [(" ".join(p), metadato) for p, metadato in conservados], descartados
+
+
+class PresupuestoTokens:
+    """Recorta los resultados de las herramientas a su presupuesto y lleva la cuenta de tokens."""
+
+    def __init__(self, presupuestos: Dict[str, int] = None):
+        self._presupuestos = dict(PRESUPUESTOS_POR_DEFECTO, **(presupuestos or {}))
+        self._lock = threading.Lock()
+        self._cuentas: Dict[str, Dict[str, int]] = {}
+
+    def presupuesto(self, herramienta: str) -> int:
+        variable = f"PRESUPUESTO_TOKENS_{herramienta.upper()}"
+        if variable in os.environ:
+            return int(os.environ[variable])
+        return self._presupuestos.get(herramienta, PRESUPUESTO_GENERAL)
+
+    def ajustar(self, herramienta: str, texto: str, tokens_antes: int = None) -> str:
+        """
+        Devuelve `texto` dentro del presupuesto de la herramienta. `tokens_antes` es el tamaño del
+        resultado sin compactar (por defecto, el del propio texto) y solo se usa para las métricas.
+        """
+        presupuesto = self.presupuesto(herramienta)
+        antes = tokens_antes if tokens_antes is not None else estimar_tokens_texto(texto)
+        recortado = False
+        if estimar_tokens_texto(texto) > presupuesto:
+            texto, recortado = self._recortar(texto, presupuesto), True
+
+        despues = estimar_tokens_texto(texto)
+        HERRAMIENTA_TOKENS.observar(antes, herramienta=herramienta, etapa="antes")
+        HERRAMIENTA_TOKENS.observar(despues, herramienta=herramienta, etapa="despues")
+        with self._lock:
+            cuenta = self._cuentas.setdefault(herramienta, {"resultados": 0, "tokens_antes": 0, "tokens_despues": 0, "recortados": 0})
+            cuenta["resultados"] += 1
+            cuenta["tokens_antes"] += antes
+            cuenta["tokens_despues"] += despues
+            cuenta["recortados"] += recortado
+        return texto
+
+    @staticmethod
+    def _recortar(texto: str, presupuesto: int) -> str:
+        limite = presupuesto * 4
+        lineas = texto.split("\n")
+        conservadas, largo = [], 0
+        for linea in lineas:
+            if largo + len(linea) + 1 > limite:
+                break
+            conservadas.append(linea)
+            largo += len(linea) + 1
+        if not conservadas:
+            # Una sola línea más larga que el presupuesto: se corta por palabras
+            return texto[:limite].rsplit(" ", 1)[0] + " … [resultado recortado]"
+        omitidas = len(lineas) - len(conservadas)
+        return "\n".join(conservadas) + f"\n… [{omitidas} líneas omitidas por longitud]"
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                herramienta: dict(
+                    cuenta,
+                    ahorro=round(1 - cuenta["tokens_despues"] / cuenta["tokens_antes"], 4) if cuenta["tokens_antes"] else None,
+                )
+                for herramienta, cuenta in self._cuentas.items()
+            }
+
+
+SALIDAS = PresupuestoTokens()
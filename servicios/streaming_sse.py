@@ -0,0 +1,81 @@
+import json
+from typing import List
+
+from langchain_core.messages import AIMessageChunk, RemoveMessage, ToolMessage
+
+# Modos de stream de LangGraph que consume el traductor
+MODOS_STREAM = ["updates", "messages"]
+
+# Nodos cuyos tokens no son texto para el usuario: la etiqueta de ruta del supervisor y el resumen del historial
+NODOS_INTERNOS = {"supervisor", "historial"}
+
+
+def evento_sse(evento: str, datos: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+class TraductorEventos:
+    """
+    Convierte los chunks de `graph.stream(..., stream_mode=["updates", "messages"])` en eventos SSE.
+    Eventos: inicio, ruta, herramienta_inicio, herramienta_fin, token, final, error.
+    Sirve igual para el stream síncrono (Flask) y el asíncrono (ASGI).
+    """
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.enrutamiento = None
+        self.ultimo_mensaje = None
+
+    def inicio(self) -> str:
+        return evento_sse("inicio", {"thread_id": self.thread_id})
+
+    def traducir(self, modo: str, dato) -> List[str]:
+        eventos = []
+
+        if modo == "updates":
+            for nodo, actualizacion in (dato or {}).items():
+                actualizacion = actualizacion or {}
+                # Decisión del supervisor o acierto de la caché semántica
+                if actualizacion.get("enrutamiento"):
+                    self.enrutamiento = actualizacion["enrutamiento"]
+                    eventos.append(evento_sse("ruta", {"next": actualizacion.get("next"), "enrutamiento": self.enrutamiento}))
+                # Las RemoveMessage del plegado de historial no son respuestas
+                mensajes = [m for m in actualizacion.get("messages") or [] if not isinstance(m, RemoveMessage)]
+                if mensajes:
+                    self.ultimo_mensaje = mensajes[-1]
+            return eventos
+
+        mensaje, metadata = dato
+        if metadata.get("langgraph_node") in NODOS_INTERNOS:
+            return eventos
+        if isinstance(mensaje, AIMessageChunk):
+            for llamada in mensaje.tool_call_chunks or []:
+                if llamada.get("name"):
+                    eventos.append(evento_sse("herramienta_inicio", {"herramienta": llamada["name"], "id": llamada.get("id")}))
+            if mensaje.content:
+                eventos.append(evento_sse("token", {"contenido": mensaje.content}))
+        elif isinstance(mensaje, ToolMessage):
+            eventos.append(evento_sse("herramienta_fin", {"herramienta": mensaje.name, "id": mensaje.tool_call_id}))
+        return eventos
+
+    def final(self) -> str:
+        """Evento final con la misma forma que la respuesta JSON de /agent."""
+        return evento_sse("final", {
+            "response": self.ultimo_mensaje.content if self.ultimo_mensaje is not None else "",
+            "thread_id": self.thread_id,
+            "enrutamiento": self.enrutamiento,
+            "status": "success"
+        })
+
+    @staticmethod
+    def error(e: Exception, cuerpo: dict = None) -> str:
+        """Evento de error; `cuerpo` reemplaza al genérico (p. ej. el 503 reintentable del planificador)."""
+        return evento_sse("error", cuerpo or {
+            "response": "Ocurrió un error interno al ejecutar el agente.",
+            "status": "error",
+            "error_detail": str(e)
+        })
+
+
+# Cabeceras para que proxies (Cloud Run, nginx) no acumulen el stream
+CABECERAS_SSE = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
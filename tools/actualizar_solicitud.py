@@ -1,60 +1,124 @@
+import re
 import datetime
-from langchain.tools import tool
+import asyncio
+from typing import List, Optional
+from langchain_core.tools import StructuredTool
+
+from tools.repositorio import LimiteActualizacionExcedido
+from servicios.metricas import HERRAMIENTA_DURACION
+from servicios.salida_herramientas import SALIDAS, registro, tabla, tokens_sin_compactar
+
+ESTADOS_VALIDOS = ["Pendiente", "Aprobado", "Rechazado", "Observado"]
+PATRON_PREFIJO = re.compile(r"^[A-Z]{3}$")
+
+# Campos del resultado que se devuelven al agente
+COLUMNAS_ACTUALIZADAS = ["n_solicitud", "estado", "respuestaequipo", "fecharespuesta"]
+COLUMNAS_MASIVO = ["n_solicitud", "nomusuario", "tipogasto", "monto"]
+
+def normalizar_estado(estado: str) -> Optional[str]:
+    """Estado con el formato de la BD, o None si no es uno de ESTADOS_VALIDOS."""
+    estado = (estado or "").strip().capitalize()
+    return estado if estado in ESTADOS_VALIDOS else None
+
+def _mensaje_estado_invalido() -> str:
+    return f"Estado no válido. Debe ser uno de los siguientes: {', '.join(ESTADOS_VALIDOS)}"
 
 # --- Lógica Interna --- #
-def actualizar_solicitud_logica(db_conn, n_solicitud: str, nuevo_estado: str, nueva_respuesta: str) -> str:
+def actualizar_solicitud(repositorio, n_solicitud: str, nuevo_estado: str, nueva_respuesta: str):
+    """
+    Actualiza una solicitud (la usan la herramienta y la API REST). Devuelve la fila actualizada,
+    o None si no existe; lanza ValueError si el estado no es válido.
+    """
+    estado = normalizar_estado(nuevo_estado)
+    if estado is None:
+        raise ValueError(_mensaje_estado_invalido())
+
+    # UPDATE ... RETURNING: existencia y valores nuevos en una sola sentencia
+    with HERRAMIENTA_DURACION.cronometro(herramienta="actualizar_solicitud", fase="bd"):
+        return repositorio.actualizar_estado(n_solicitud.strip(), estado, nueva_respuesta, datetime.date.today())
+
+def actualizar_solicitud_logica(repositorio, n_solicitud: str, nuevo_estado: str, nueva_respuesta: str) -> str:
     """
     Actualiza el Estado, FechaRespuesta y la RespuestaEquipo de una solicitud de reembolso médica 
     registrada en la base de datos SQL.
     """
-    
-    # 1. Normalizar la entrada de estado y verificar validez
-    nuevo_estado = nuevo_estado.strip().capitalize()
-    estados_validos = ["Pendiente", "Aprobado", "Rechazado", "Observado"]
-    if nuevo_estado not in estados_validos:
-        return f"Estado no válido. Debe ser uno de los siguientes: {', '.join(estados_validos)}"
-
-    fecha_respuesta = datetime.date.today().strftime("%Y-%m-%d")
-
-    # 2. Generar consulta de actualización (UPDATE)
-    query = f"""
-    UPDATE reembolsos 
-    SET 
-        estado = '{nuevo_estado}',
-        respuestaequipo = '{nueva_respuesta}',
-        fecharespuesta = '{fecha_respuesta}'
-    WHERE "n_solicitud" = '{n_solicitud}';
-    """
-    
-    # 3. Ejecutar consulta
     try:
-        db_conn.run(query)
-
-        query_check = f"""
-        SELECT 1 FROM Reembolsos WHERE "n_solicitud" = '{n_solicitud}';
-        """
-        
-        check_result = db_conn.run(query_check)
-        
-        if "No rows" in check_result or not check_result.strip().split('\n')[-1].strip():
+        solicitud = actualizar_solicitud(repositorio, n_solicitud, nuevo_estado, nueva_respuesta)
+        if solicitud is None:
              return f"No se encontró ninguna solicitud con el número: {n_solicitud}."
 
-        return (
-            f"Solicitud **{n_solicitud}** actualizada con éxito:\n"
-            f"- Nuevo Estado: **{nuevo_estado}**\n"
-            f"- Nueva Respuesta: **{nueva_respuesta}**"
-        )
+        with HERRAMIENTA_DURACION.cronometro(herramienta="actualizar_solicitud", fase="formato"):
+            encabezado = "Solicitud actualizada con éxito: "
+            return SALIDAS.ajustar(
+                "actualizar_solicitud", encabezado + registro(solicitud, COLUMNAS_ACTUALIZADAS),
+                tokens_sin_compactar([solicitud], COLUMNAS_ACTUALIZADAS, encabezado),
+            )
     
+    except ValueError as e:
+        return str(e)
     except Exception as e:
         return f"Error al actualizar solicitud en la base de datos SQL. Detalle: {e}"
 
 
-# --- Función Wrapper para inyección de DB_CONN --- #
-def create_tool_actualizar_solicitud(db_conn_instance):
+def normalizar_codigos(codigos: List[str] = None) -> Optional[List[str]]:
+    """Códigos sin espacios alrededor ni vacíos; None si no queda ninguno (sin filtro por código)."""
+    return [c.strip() for c in (codigos or []) if c and c.strip()] or None
+
+def actualizar_solicitudes_masivo(repositorio, nuevo_estado: str, nueva_respuesta: str, codigos: List[str] = None,
+                                  estado_actual: str = None, prefijo: str = None):
+    """
+    Actualización masiva en una sola transacción (la usan la herramienta y el endpoint de administración).
+    Devuelve las solicitudes actualizadas; lanza ValueError si los parámetros no son válidos.
+    """
+    estado = normalizar_estado(nuevo_estado)
+    if estado is None:
+        raise ValueError(_mensaje_estado_invalido())
+    if estado_actual:
+        estado_actual_normalizado = normalizar_estado(estado_actual)
+        if estado_actual_normalizado is None:
+            raise ValueError(f"Estado actual no válido. Debe ser uno de los siguientes: {', '.join(ESTADOS_VALIDOS)}")
+        estado_actual = estado_actual_normalizado
+    if prefijo:
+        prefijo = prefijo.strip().upper().rstrip("_")
+        if not PATRON_PREFIJO.match(prefijo):
+            raise ValueError("Prefijo no válido. Use el prefijo de tres letras del código (ej. MED, EXA, CON).")
+    codigos = normalizar_codigos(codigos)
+
+    return repositorio.actualizar_estado_masivo(
+        estado, nueva_respuesta, datetime.date.today(),
+        codigos=codigos, estado_actual=estado_actual or None, prefijo=prefijo or None,
+    )
+
+def actualizar_solicitudes_masivo_logica(repositorio, nuevo_estado: str, nueva_respuesta: str, codigos: List[str] = None,
+                                         estado_actual: str = None, prefijo: str = None) -> str:
+    # Misma lista para la actualización y para el reporte de las no actualizadas
+    codigos = normalizar_codigos(codigos)
+    try:
+        with HERRAMIENTA_DURACION.cronometro(herramienta="actualizar_solicitudes_masivo", fase="bd"):
+            solicitudes = actualizar_solicitudes_masivo(repositorio, nuevo_estado, nueva_respuesta, codigos, estado_actual, prefijo)
+    except (ValueError, LimiteActualizacionExcedido) as e:
+        return f"No se actualizó ninguna solicitud. {e}"
+    except Exception as e:
+        return f"Error al actualizar solicitudes en la base de datos SQL. No se aplicó ningún cambio. Detalle: {e}"
+
+    if not solicitudes:
+        return "Ninguna solicitud cumple los filtros indicados. No se realizaron cambios."
+    with HERRAMIENTA_DURACION.cronometro(herramienta="actualizar_solicitudes_masivo", fase="formato"):
+        no_encontradas = sorted(set(codigos or []) - {s.n_solicitud for s in solicitudes})
+        # Lo que no se actualizó va antes del detalle: si el detalle se recorta, no se pierde
+        respuesta = f"Se actualizaron {len(solicitudes)} solicitudes al estado {solicitudes[0].estado}."
+        if no_encontradas:
+            respuesta += f"\nNo se actualizaron (no existen o no cumplen los filtros): {', '.join(no_encontradas)}"
+        tokens_antes = tokens_sin_compactar(solicitudes, COLUMNAS_MASIVO, respuesta)
+        respuesta += "\n" + tabla(solicitudes, COLUMNAS_MASIVO)
+        return SALIDAS.ajustar("actualizar_solicitudes_masivo", respuesta, tokens_antes)
+
+
+# --- Función Wrapper para inyección del repositorio --- #
+def create_tool_actualizar_solicitud(repositorio):
     """
-    Crea la herramienta de LangChain, inyectando la instancia activa de la conexión a la BD.
+    Crea la herramienta de LangChain, inyectando el repositorio de acceso a la BD.
     """
-    @tool("actualizar_solicitud")
     def actualizar_solicitud_tool(n_solicitud: str, nuevo_estado: str, nueva_respuesta: str) -> str:
         """
         Actualiza el Estado, FechaRespuesta y la RespuestaEquipo de una solicitud de reembolso médica registrada.
@@ -66,10 +130,48 @@ def create_tool_actualizar_solicitud(db_conn_instance):
         """
         
         return actualizar_solicitud_logica(
-            db_conn_instance,
+            repositorio,
             n_solicitud,
             nuevo_estado,
             nueva_respuesta
         )
         
-    return actualizar_solicitud_tool
\ No newline at end of file
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def aactualizar_solicitud_tool(n_solicitud: str, nuevo_estado: str, nueva_respuesta: str) -> str:
+        return await asyncio.to_thread(actualizar_solicitud_logica, repositorio, n_solicitud, nuevo_estado, nueva_respuesta)
+
+    return StructuredTool.from_function(func=actualizar_solicitud_tool, coroutine=aactualizar_solicitud_tool, name="actualizar_solicitud")
+
+def create_tool_actualizar_solicitudes_masivo(repositorio):
+    """
+    Crea la herramienta de actualización masiva (solo para el rol Administrador).
+    """
+    def actualizar_solicitudes_masivo_tool(nuevo_estado: str, nueva_respuesta: str, codigos: List[str] = None,
+                                           estado_actual: str = None, prefijo: str = None) -> str:
+        """
+        Actualiza el Estado y la RespuestaEquipo de VARIAS solicitudes de reembolso a la vez, en una sola operación.
+        Úsala cuando el usuario pida aprobar, rechazar u observar un grupo de solicitudes en lugar de una sola.
+
+        Argumentos:
+        1. nuevo_estado (str): Pendiente, Aprobado, Rechazado u Observado.
+        2. nueva_respuesta (str): Comentario/justificación del equipo, igual para todas.
+        3. codigos (list[str], opcional): Números de solicitud a actualizar (Ej: ["MED_00001", "CON_01234"]).
+        4. estado_actual (str, opcional): Solo actualizar las que estén en este estado (Ej: Pendiente).
+        5. prefijo (str, opcional): Solo actualizar las de este tipo de gasto (MED, EXA, CON).
+
+        Los filtros se combinan; debe indicarse al menos uno. Si alguna falla no se aplica ningún cambio.
+        """
+        return actualizar_solicitudes_masivo_logica(repositorio, nuevo_estado, nueva_respuesta, codigos, estado_actual, prefijo)
+
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def aactualizar_solicitudes_masivo_tool(nuevo_estado: str, nueva_respuesta: str, codigos: List[str] = None,
+                                                  estado_actual: str = None, prefijo: str = None) -> str:
+        return await asyncio.to_thread(
+            actualizar_solicitudes_masivo_logica, repositorio, nuevo_estado, nueva_respuesta, codigos, estado_actual, prefijo
+        )
+
+    return StructuredTool.from_function(
+        func=actualizar_solicitudes_masivo_tool,
+        coroutine=aactualizar_solicitudes_masivo_tool,
+        name="actualizar_solicitudes_masivo",
+    )
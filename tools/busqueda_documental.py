@@ -1,32 +1,81 @@
-from langchain.tools import tool
+import os
+from langchain_core.tools import StructuredTool
 
-def create_tool_busqueda_documental(vector_store):
+from servicios.metricas import HERRAMIENTA_DURACION
+from servicios.salida_herramientas import SALIDAS, deduplicar_fragmentos, estimar_tokens_texto
+
+MENSAJE_SIN_RESULTADOS = "No se encontró información relevante sobre ese tema en la documentación. Responde al usuario que no tienes ese detalle."
+
+# Número de fragmentos que se devuelven al agente (vector e híbrida)
+TOP_K = int(os.environ.get("BUSQUEDA_TOP_K", "3"))
+
+# --- Lógica Interna --- #
+def _fuente(doc) -> str:
+    # Se utiliza doc.metadata.get('source', 'N/A') para incluir la fuente del PDF (solo el nombre del archivo)
+    return os.path.basename(str(doc.metadata.get('source', 'N/A')))
+
+def _formatear(docs) -> str:
+    """
+    Contexto compacto para el LLM: una línea `[fuente] texto` por fragmento, en orden de relevancia,
+    sin el texto que se repite entre fragmentos (solapamiento entre chunks) y dentro del presupuesto de tokens.
+    """
+    if not docs:
+        return MENSAJE_SIN_RESULTADOS
+    crudo = "\n".join(f"[{_fuente(doc)}] {doc.page_content}" for doc in docs)
+    fragmentos, _ = deduplicar_fragmentos([(doc.page_content, _fuente(doc)) for doc in docs])
+    contexto = "\n".join(f"[{fuente}] {texto}" for texto, fuente in fragmentos)
+    return SALIDAS.ajustar("busqueda_documental", contexto, estimar_tokens_texto(crudo))
+
+def formatear_contexto(docs) -> str:
+    """Filtra los documentos por score y los formatea como contexto para el LLM."""
+    return _formatear([doc for doc, score in docs if score > 0.7])
+
+def formatear_resultados_hibridos(resultados) -> str:
+    """Los resultados híbridos ya vienen filtrados y ordenados por RRF."""
+    return _formatear([r.documento for r in resultados])
+
+def busqueda_documental_logica(vector_store, pregunta: str, recuperador=None) -> str:
+    # Usar el Vector Store
+    if vector_store is None:
+        return "ERROR: La base de datos de documentación no está disponible."
+
+    # Búsqueda híbrida (BM25 + vector con RRF) si está configurada
+    # (la fase "busqueda" es la llamada al vector store; incluye el embedding de la pregunta)
+    with HERRAMIENTA_DURACION.cronometro(herramienta="busqueda_documental", fase="busqueda"):
+        if recuperador is not None:
+            resultados = recuperador.buscar(pregunta)
+        else:
+            # Búsqueda de similitud
+            docs = vector_store.similarity_search_with_score(pregunta, k=TOP_K)
+    with HERRAMIENTA_DURACION.cronometro(herramienta="busqueda_documental", fase="formato"):
+        return formatear_resultados_hibridos(resultados) if recuperador is not None else formatear_contexto(docs)
+
+async def abusqueda_documental_logica(vector_store, pregunta: str, recuperador=None) -> str:
+    if vector_store is None:
+        return "ERROR: La base de datos de documentación no está disponible."
+
+    with HERRAMIENTA_DURACION.cronometro(herramienta="busqueda_documental", fase="busqueda"):
+        if recuperador is not None:
+            resultados = await recuperador.abuscar(pregunta)
+        else:
+            docs = await vector_store.asimilarity_search_with_score(pregunta, k=TOP_K)
+    with HERRAMIENTA_DURACION.cronometro(herramienta="busqueda_documental", fase="formato"):
+        return formatear_resultados_hibridos(resultados) if recuperador is not None else formatear_contexto(docs)
+
+
+def create_tool_busqueda_documental(vector_store, recuperador=None):
     """
     Crea y devuelve la herramienta 'busqueda_documental' vinculada al vector store.
+    Si se pasa un recuperador híbrido, la búsqueda combina BM25 y vector con RRF.
     """
-    
-    @tool
+
     def busqueda_documental(pregunta: str) -> str:
-        """Busca en la base de datos vectorial de reembolsos para obtener contexto sobre procedimientos, 
+        """Busca en la base de datos vectorial de reembolsos para obtener contexto sobre procedimientos,
         políticas, requisitos, pasos o información general. Útil para responder preguntas teóricas."""
-        
-        # Usar el Vector Store
-        if vector_store is None:
-            return "ERROR: La base de datos de documentación no está disponible."
-            
-        # Búsqueda de similitud
-        docs = vector_store.similarity_search_with_score(pregunta, k=3)
-        
-        contexto = []
-        
-        for doc, score in docs:
-            if score > 0.7: 
-                # Se utiliza doc.metadata.get('source', 'N/A') para incluir la fuente del PDF
-                contexto.append(f"Contexto: {doc.page_content} (Fuente: {doc.metadata.get('source', 'N/A')})")
-                
-        if contexto:
-            return "\n---\n".join(contexto)
-        else:
-            return "No se encontró información relevante sobre ese tema en la documentación. Responde al usuario que no tienes ese detalle."
+        return busqueda_documental_logica(vector_store, pregunta, recuperador)
+
+    # Variante asíncrona (modo ASGI)
+    async def abusqueda_documental(pregunta: str) -> str:
+        return await abusqueda_documental_logica(vector_store, pregunta, recuperador)
 
-    return busqueda_documental
\ No newline at end of file
+    return StructuredTool.from_function(func=busqueda_documental, coroutine=abusqueda_documental, name="busqueda_documental")
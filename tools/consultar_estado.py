@@ -1,7 +1,34 @@
-from langchain.tools import tool
+import asyncio
+from langchain_core.tools import StructuredTool
+
+from servicios.metricas import HERRAMIENTA_DURACION
+from servicios.salida_herramientas import SALIDAS, registro, tokens_sin_compactar
+
+# Columnas que se muestran al usuario (campo=valor)
+COLUMNAS_RESULTADO = [
+    "n_solicitud",
+    "nomusuario",
+    "nombeneficiario",
+    "tipogasto",
+    "monto",
+    "fecharegistro",
+    "estado",
+    "respuestaequipo",
+]
+
+def formatear_solicitud(solicitud) -> str:
+    """Registro compacto `campo=valor; ...` (sin campos vacíos)."""
+    return registro(solicitud, COLUMNAS_RESULTADO)
 
 # --- Lógica Interna --- #
-def consultar_estado_logica(db_conn, n_solicitud: str, usuario: str = None) -> str:
+def consultar_solicitud(repositorio, n_solicitud: str, usuario: str = None):
+    """Solicitud por número (la usan la herramienta y la API REST); con `usuario`, solo si le pertenece."""
+    usuario = usuario.strip() if usuario else None
+    # Consulta parametrizada; el filtro de seguridad por usuario se aplica en la misma sentencia
+    with HERRAMIENTA_DURACION.cronometro(herramienta="consultar_estado", fase="bd"):
+        return repositorio.obtener(n_solicitud.strip(), usuario)
+
+def consultar_estado_logica(repositorio, n_solicitud: str, usuario: str = None) -> str:
     """
     Consulta el estado de una solicitud de reembolso por número en la base de datos SQL.
     Aplica filtro por usuario_id (ID de login) si se proporciona.
@@ -10,58 +37,32 @@ def consultar_estado_logica(db_conn, n_solicitud: str, usuario: str = None) -> s
     n_solicitud = n_solicitud.strip()
     usuario = usuario.strip() if usuario else None
 
-    # 1. Construir la consulta SQL base
-    query = f"""
-    SELECT
-        "n_solicitud",
-        "nomusuario",
-        "nombeneficiario",
-        "tipogasto",
-        "monto",
-        "fecharegistro",
-        "estado",
-        "respuestaequipo"
-    FROM reembolsos
-    WHERE "n_solicitud" = '{n_solicitud}'
-    """
-    
-    # 2. Agregar el filtro de seguridad por usuario logueado
-    if usuario:
-        query += f"""
-        AND "usuario" = '{usuario}'
-        """
-        
-    query += ";" # Cerrar la consulta
-
-    # 3. Ejecutar la consulta
+    # 1. Ejecutar la consulta
     try:
-        resultados = db_conn.run(query)
+        solicitud = consultar_solicitud(repositorio, n_solicitud, usuario)
 
-        # 4. Verificar si se obtuvieron resultados
-        if "No rows" in resultados or not resultados.strip().split('\n')[-1].strip():
+        # 2. Verificar si se obtuvieron resultados
+        if solicitud is None:
             if usuario:
                 return f"No se encontró ninguna solicitud con el número **{n_solicitud}** asociada al usuario **{usuario}**."
             else:
                 return f"No se encontró ninguna solicitud con el número: **{n_solicitud}**."
 
-        # 5. Formatear la respuesta
-        return (
-            f"Resultados de la consulta para la Solicitud **{n_solicitud}**:\n"
-            f"A continuación se muestra el resultado en formato de tabla (Columna: Valor):\n"
-            f"--- RESULTADO DE LA BD ---\n"
-            f"{resultados}"
-        )
+        # 3. Formatear la respuesta
+        with HERRAMIENTA_DURACION.cronometro(herramienta="consultar_estado", fase="formato"):
+            encabezado = "Solicitud encontrada: "
+            return SALIDAS.ajustar("consultar_estado", encabezado + formatear_solicitud(solicitud),
+                                   tokens_sin_compactar([solicitud], COLUMNAS_RESULTADO, encabezado))
         
     except Exception as e:
         return f"Error al consultar la base de datos SQL. Detalle: {e}"
 
 
-# --- Función Wrapper para inyección de DB_CONN --- #
-def create_tool_consultar_estado(db_conn_instance):
+# --- Función Wrapper para inyección del repositorio --- #
+def create_tool_consultar_estado(repositorio):
     """
-    Crea la herramienta de LangChain, inyectando la instancia activa de la conexión a la BD.
+    Crea la herramienta de LangChain, inyectando el repositorio de acceso a la BD.
     """
-    @tool("consultar_estado")
     def consultar_estado_tool(n_solicitud: str, usuario: str = None) -> str:
         """
         Consulta el estado y detalles de una solicitud de reembolso médico por su número. 
@@ -76,9 +77,13 @@ def create_tool_consultar_estado(db_conn_instance):
         """
         
         return consultar_estado_logica(
-            db_conn_instance,
+            repositorio,
             n_solicitud,
             usuario
         )
         
-    return consultar_estado_tool
\ No newline at end of file
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def aconsultar_estado_tool(n_solicitud: str, usuario: str = None) -> str:
+        return await asyncio.to_thread(consultar_estado_logica, repositorio, n_solicitud, usuario)
+
+    return StructuredTool.from_function(func=consultar_estado_tool, coroutine=aconsultar_estado_tool, name="consultar_estado")
\ No newline at end of file
@@ -0,0 +1,138 @@
+import asyncio
+from collections import defaultdict
+from typing import Annotated
+from langchain_core.tools import StructuredTool
+from langgraph.prebuilt import InjectedState
+
+from servicios import permisos
+from tools.actualizar_solicitud import normalizar_estado, ESTADOS_VALIDOS
+from servicios.metricas import HERRAMIENTA_DURACION
+from servicios.salida_herramientas import SALIDAS, tabla, tokens_sin_compactar
+
+TAMANO_PAGINA = 10
+COLUMNAS_LISTADO = ["n_solicitud", "fecharegistro", "tipogasto", "monto", "estado"]
+COLUMNAS_RESUMEN = ["estado", "tipogasto", "cantidad", "monto_total"]
+
+# --- Lógica Interna --- #
+def listar_solicitudes(repositorio, usuario: str, limite: int = TAMANO_PAGINA, estado: str = None, cursor: str = None):
+    """
+    Página de solicitudes de un usuario, de la más reciente a la más antigua (la usan la herramienta y la API REST).
+    Devuelve (solicitudes, cursor de la página siguiente o None); lanza ValueError si el estado o el cursor no son válidos.
+    """
+    if estado:
+        estado_normalizado = normalizar_estado(estado)
+        if estado_normalizado is None:
+            raise ValueError(f"Estado no válido. Debe ser uno de los siguientes: {', '.join(ESTADOS_VALIDOS)}")
+        estado = estado_normalizado
+    with HERRAMIENTA_DURACION.cronometro(herramienta="listar_solicitudes", fase="bd"):
+        return repositorio.listar_por_usuario(usuario.strip(), limite, estado=estado or None, cursor=cursor or None)
+
+def resumen_solicitudes(repositorio, usuario: str = None):
+    """Cantidad y monto por estado y tipo de gasto de un usuario, o de todos si `usuario` es None."""
+    with HERRAMIENTA_DURACION.cronometro(herramienta="resumen_solicitudes", fase="bd"):
+        return repositorio.resumen(usuario.strip() if usuario else None)
+
+def totales_por_estado(filas):
+    """Suma las filas del resumen por estado: {estado: (cantidad, monto)}."""
+    totales = defaultdict(lambda: [0, 0.0])
+    for fila in filas:
+        totales[fila.estado][0] += fila.cantidad
+        totales[fila.estado][1] += float(fila.monto_total)
+    return {estado: tuple(valores) for estado, valores in totales.items()}
+
+def listar_solicitudes_logica(repositorio, rol: str, username: str, usuario_solicitado: str = None,
+                              estado: str = None, cursor: str = None) -> str:
+    try:
+        # Mismas reglas que la API REST: solo el Administrador lista las solicitudes de otro usuario
+        usuario = permisos.usuario_de_consulta(rol, username, usuario_solicitado, "listar_solicitudes") or username
+        solicitudes, siguiente = listar_solicitudes(repositorio, usuario, TAMANO_PAGINA, estado, cursor)
+    except (ValueError, permisos.AccesoDenegado) as e:
+        return str(e)
+    except Exception as e:
+        return f"Error al listar solicitudes en la base de datos SQL. Detalle: {e}"
+
+    if not solicitudes:
+        filtro = f" en estado {normalizar_estado(estado)}" if estado else ""
+        return f"El usuario {usuario} no tiene solicitudes{filtro}."
+
+    with HERRAMIENTA_DURACION.cronometro(herramienta="listar_solicitudes", fase="formato"):
+        respuesta = f"Solicitudes de {usuario}, más recientes primero:"
+        if siguiente:
+            respuesta += f" (hay más: para la página siguiente usa cursor='{siguiente}')"
+        return SALIDAS.ajustar("listar_solicitudes", respuesta + "\n" + tabla(solicitudes, COLUMNAS_LISTADO),
+                               tokens_sin_compactar(solicitudes, COLUMNAS_LISTADO, respuesta))
+
+def resumen_solicitudes_logica(repositorio, rol: str, username: str, usuario_solicitado: str = None) -> str:
+    try:
+        # Los totales globales (usuario None) solo los ve el Administrador
+        usuario = permisos.usuario_de_consulta(rol, username, usuario_solicitado, "resumen_solicitudes")
+        filas = resumen_solicitudes(repositorio, usuario)
+    except permisos.AccesoDenegado as e:
+        return str(e)
+    except Exception as e:
+        return f"Error al consultar el resumen de solicitudes en la base de datos SQL. Detalle: {e}"
+
+    ambito = f"del usuario {usuario}" if usuario else "de todos los usuarios"
+    if not filas:
+        return f"No hay solicitudes registradas {ambito}."
+
+    with HERRAMIENTA_DURACION.cronometro(herramienta="resumen_solicitudes", fase="formato"):
+        lineas = [f"Resumen de solicitudes {ambito} por estado (estado=cantidad, monto total):"]
+        lineas.extend(
+            f"{estado}={cantidad}, {monto:.2f}" for estado, (cantidad, monto) in sorted(totales_por_estado(filas).items())
+        )
+        lineas.append("Detalle por tipo de gasto:")
+        tokens_antes = tokens_sin_compactar(filas, COLUMNAS_RESUMEN, "\n".join(lineas))
+        lineas.append(tabla(filas, COLUMNAS_RESUMEN))
+        return SALIDAS.ajustar("resumen_solicitudes", "\n".join(lineas), tokens_antes)
+
+
+# --- Función Wrapper para inyección del repositorio --- #
+# El usuario logueado y su rol llegan desde el estado del grafo (preparar_invocacion), nunca del modelo
+UsuarioLogueado = Annotated[str, InjectedState("usuario")]
+RolUsuario = Annotated[str, InjectedState("rol")]
+
+def create_tool_listar_solicitudes(repositorio):
+    """
+    Crea la herramienta de LangChain, inyectando el repositorio de acceso a la BD.
+    """
+    def listar_solicitudes_tool(usuario: UsuarioLogueado, rol: RolUsuario, usuario_consultado: str = None,
+                                estado: str = None, cursor: str = None) -> str:
+        """
+        Lista las solicitudes de reembolso del usuario logueado, de la más reciente a la más antigua, de 10 en 10.
+        Úsala cuando el usuario pregunte por "mis solicitudes" o por sus solicitudes en un estado (Ej: pendientes).
+
+        Argumentos:
+        1. usuario_consultado (str, opcional): Solo Administrador: ID de login de otro usuario cuyas solicitudes quiere ver.
+        2. estado (str, opcional): Pendiente, Aprobado, Rechazado u Observado.
+        3. cursor (str, opcional): Solo para pedir la página siguiente; usa el valor que indicó la respuesta anterior.
+        """
+        return listar_solicitudes_logica(repositorio, rol, usuario, usuario_consultado, estado, cursor)
+
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def alistar_solicitudes_tool(usuario: UsuarioLogueado, rol: RolUsuario, usuario_consultado: str = None,
+                                       estado: str = None, cursor: str = None) -> str:
+        return await asyncio.to_thread(listar_solicitudes_logica, repositorio, rol, usuario, usuario_consultado, estado, cursor)
+
+    return StructuredTool.from_function(func=listar_solicitudes_tool, coroutine=alistar_solicitudes_tool, name="listar_solicitudes")
+
+def create_tool_resumen_solicitudes(repositorio):
+    """
+    Crea la herramienta de resumen (cantidades y montos por estado y tipo de gasto).
+    """
+    def resumen_solicitudes_tool(usuario: UsuarioLogueado, rol: RolUsuario, usuario_consultado: str = None) -> str:
+        """
+        Devuelve cuántas solicitudes hay y por qué monto total, por estado y por tipo de gasto.
+        Úsala para preguntas de totales (Ej: "¿cuántas solicitudes tengo aprobadas?", "¿cuánto suman las pendientes?").
+
+        Argumentos:
+        1. usuario_consultado (str, opcional): Solo Administrador: ID de login del usuario cuyos totales quiere ver.
+           Si es nulo, el Administrador recibe los totales de todos los usuarios; el rol General, siempre los suyos.
+        """
+        return resumen_solicitudes_logica(repositorio, rol, usuario, usuario_consultado)
+
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def aresumen_solicitudes_tool(usuario: UsuarioLogueado, rol: RolUsuario, usuario_consultado: str = None) -> str:
+        return await asyncio.to_thread(resumen_solicitudes_logica, repositorio, rol, usuario, usuario_consultado)
+
+    return StructuredTool.from_function(func=resumen_solicitudes_tool, coroutine=aresumen_solicitudes_tool, name="resumen_solicitudes")
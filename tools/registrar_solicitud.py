@@ -1,70 +1,56 @@
 import datetime
-from langchain.tools import tool
-from sqlalchemy import text
+import asyncio
+from langchain_core.tools import StructuredTool
+
+from servicios.metricas import HERRAMIENTA_DURACION
 
 # --- Lógica Interna --- #
-def registrar_solicitud_logica(db_conn, usuario: str, nombre_asegurado: str, tipo_gasto: str, monto: float, nombre_beneficiario: str = None) -> str:
-    
+def registrar_solicitud(repositorio, usuario: str, nombre_asegurado: str, tipo_gasto: str, monto: float, nombre_beneficiario: str = None):
+    """
+    Registra la solicitud y devuelve la fila creada (la usan la herramienta y la API REST).
+    Lanza ValueError si los datos no son válidos.
+    """
+    if not tipo_gasto or not tipo_gasto.strip():
+        raise ValueError("Indique el tipo de gasto (Medicinas, Exámenes, Consultas).")
+    try:
+        monto = float(monto)
+    except (TypeError, ValueError):
+        raise ValueError("El monto debe ser un número.")
+    if monto <= 0:
+        raise ValueError("El monto debe ser mayor que cero.")
+
     # 1. Preparación de datos
     tipo_gasto = tipo_gasto.strip().capitalize()
     prefijos = {"Medicinas": "MED", "Exámenes": "EXA", "Consultas": "CON"}
     prefijo = prefijos.get(tipo_gasto, "OTR")
     
     # Reemplazar variables
-    usuario = usuario
     usuario_completo = nombre_asegurado
     beneficiario_final = nombre_beneficiario if nombre_beneficiario else usuario_completo
-    fecha_registro = datetime.date.today().strftime("%Y-%m-%d")
-    
-    # 2. Generar código de solicitud (en SQL)
-    query_ult_num = f"""
-    SELECT COALESCE(MAX(CAST(SUBSTRING("n_solicitud", 5) AS INTEGER)), 0)
-    FROM reembolsos
-    WHERE "tipogasto" = '{tipo_gasto}';
-    """
+    fecha_registro = datetime.date.today()
     
+    # 2. Asignar código e insertar la solicitud (una sola ida y vuelta a la BD)
+    with HERRAMIENTA_DURACION.cronometro(herramienta="registrar_solicitud", fase="bd"):
+        return repositorio.registrar(
+            usuario, usuario_completo, beneficiario_final, tipo_gasto, prefijo, monto, fecha_registro
+        )
+
+def registrar_solicitud_logica(repositorio, usuario: str, nombre_asegurado: str, tipo_gasto: str, monto: float, nombre_beneficiario: str = None) -> str:
     try:
-        with db_conn._engine.connect() as connection:
-            result = connection.execute(text(query_ult_num)).scalar_one_or_none()
-            ult_num = int(result) if result is not None else 0
-    except Exception as e:
-        ult_num = 0
-    
-    nuevo_codigo = f"{prefijo}_{ult_num + 1:05d}"
-    
-    # 3. Insertar solicitud a tabla en base de datos SQL
-    query = f"""
-    INSERT INTO reembolsos 
-    ("n_solicitud", "usuario", "nomusuario", "nombeneficiario", "tipogasto", "monto", "estado", "fecharegistro", "fecharespuesta", "respuestaequipo")
-    VALUES (
-        '{nuevo_codigo}', 
-        '{usuario}', 
-        '{usuario_completo}', 
-        '{beneficiario_final}', 
-        '{tipo_gasto}', 
-        {monto}, 
-        'Pendiente', 
-        '{fecha_registro}', 
-        NULL, 
-        'En revisión por el área de Reembolsos'
-    );
-    """
-    
-    # 4. Ejecutar consulta
-    try:
-        db_conn.run(query)
-        return f"Solicitud registrada en el sistema con el código: {nuevo_codigo}."
-    
+        solicitud = registrar_solicitud(repositorio, usuario, nombre_asegurado, tipo_gasto, monto, nombre_beneficiario)
+        return f"Solicitud registrada en el sistema con el código: {solicitud.n_solicitud}."
+
+    except ValueError as e:
+        return f"No se registró la solicitud. {e}"
     except Exception as e:
         return f"Error al registrar solicitud en el sistema. Verifique que el usuario '{usuario}' exista y que la tabla 'reembolsos' esté creada. Detalle: {e}"
 
 
-# --- Función Wrapper para inyección de DB_CONN --- #
-def create_tool_registrar_solicitud(db_conn_instance):
+# --- Función Wrapper para inyección del repositorio --- #
+def create_tool_registrar_solicitud(repositorio):
     """
-    Crea la herramienta de LangChain, inyectando la instancia activa de la conexión a la BD.
+    Crea la herramienta de LangChain, inyectando el repositorio de acceso a la BD.
     """
-    @tool("registrar_solicitud")
     def registrar_solicitud_tool(usuario: str, nombre_asegurado: str, tipo_gasto: str, monto: float, nombre_beneficiario: str = None) -> str:
         """
         Registra una nueva solicitud de reembolso médico en la base de datos SQL.'
@@ -87,11 +73,15 @@ def create_tool_registrar_solicitud(db_conn_instance):
         """
         
         return registrar_solicitud_logica(
-            db_conn_instance,
+            repositorio,
             usuario,
             nombre_asegurado,
             tipo_gasto,
             monto,
             nombre_beneficiario
         )
-    return registrar_solicitud_tool
\ No newline at end of file
+    # Variante asíncrona (modo ASGI): la consulta SQL es bloqueante, se ejecuta en un hilo aparte
+    async def aregistrar_solicitud_tool(usuario: str, nombre_asegurado: str, tipo_gasto: str, monto: float, nombre_beneficiario: str = None) -> str:
+        return await asyncio.to_thread(registrar_solicitud_logica, repositorio, usuario, nombre_asegurado, tipo_gasto, monto, nombre_beneficiario)
+
+    return StructuredTool.from_function(func=registrar_solicitud_tool, coroutine=aregistrar_solicitud_tool, name="registrar_solicitud")
\ No newline at end of file
@@ -0,0 +1,429 @@
+"""
+Capa de acceso a datos de las solicitudes de reembolso.
+
+Todas las herramientas SQL usan este repositorio en lugar de SQLDatabase: consultas parametrizadas
+(sin SQL armado con f-strings), sentencias preparadas en el servidor y filas tipadas (`Solicitud`).
+El pool de psycopg es el mismo que usa PostgresSaver, así cada instancia abre un único conjunto de
+conexiones para el checkpointer y las herramientas.
+"""
+import os
+import time
+import base64
+import datetime
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg
+from psycopg.rows import class_row
+from psycopg_pool import ConnectionPool
+
+from servicios.cache_lru import CacheLRU
+
+# Canal de la migración 002_notificar_cambios_reembolsos.sql
+CANAL_CAMBIOS = "reembolsos_cambios"
+
+
+@dataclass
+class Solicitud:
+    n_solicitud: str
+    usuario: str
+    nomusuario: str
+    nombeneficiario: str
+    tipogasto: str
+    monto: float
+    estado: str
+    fecharegistro: Optional[datetime.date]
+    fecharespuesta: Optional[datetime.date]
+    respuestaequipo: Optional[str]
+
+    def a_dict(self) -> Dict[str, Any]:
+        """Representación serializable a JSON (fechas ISO, monto como número)."""
+        datos = dict(self.__dict__)
+        for campo in ("fecharegistro", "fecharespuesta"):
+            if datos[campo] is not None:
+                datos[campo] = datos[campo].isoformat()
+        if isinstance(datos["monto"], Decimal):
+            datos["monto"] = float(datos["monto"])
+        return datos
+
+
+def crear_pool(conninfo: str, min_size: int = None, max_size: int = None, timeout_s: float = None) -> ConnectionPool:
+    """
+    Pool compartido entre PostgresSaver y el repositorio. Los tamaños se configuran con
+    DB_POOL_MIN / DB_POOL_MAX / DB_POOL_TIMEOUT_S / DB_POOL_MAX_IDLE_S.
+    DB_PREPARE_THRESHOLD=none desactiva las sentencias preparadas (p. ej. detrás de PgBouncer en modo transacción).
+    """
+    if not conninfo:
+        raise ValueError("No se configuró la cadena de conexión a PostgreSQL (POSTGRES_URI).")
+    umbral = os.environ.get("DB_PREPARE_THRESHOLD", "0").lower()
+    return ConnectionPool(
+        conninfo=conninfo,
+        min_size=min_size or int(os.environ.get("DB_POOL_MIN", "1")),
+        max_size=max_size or int(os.environ.get("DB_POOL_MAX", "20")),
+        timeout=timeout_s or float(os.environ.get("DB_POOL_TIMEOUT_S", "30")),
+        max_idle=float(os.environ.get("DB_POOL_MAX_IDLE_S", "600")),
+        kwargs={"autocommit": True, "prepare_threshold": None if umbral == "none" else int(umbral)},
+        open=True,
+    )
+
+
+# Asignación del código y registro en una sola sentencia: el contador del prefijo se incrementa
+# con UPDATE ... RETURNING (bloqueo de fila), así dos registros simultáneos nunca reciben el mismo número.
+# Requiere la migración migraciones/001_contadores_solicitud.sql.
+COLUMNAS_SOLICITUD = """
+    "n_solicitud", "usuario", "nomusuario", "nombeneficiario", "tipogasto",
+    "monto", "estado", "fecharegistro", "fecharespuesta", "respuestaequipo"
+"""
+
+QUERY_REGISTRAR = """
+WITH contador AS (
+    INSERT INTO contadores_solicitud (prefijo, ultimo)
+    VALUES (%(prefijo)s, 1)
+    ON CONFLICT (prefijo) DO UPDATE SET ultimo = contadores_solicitud.ultimo + 1
+    RETURNING ultimo
+)
+INSERT INTO reembolsos
+("n_solicitud", "usuario", "nomusuario", "nombeneficiario", "tipogasto", "monto", "estado", "fecharegistro", "fecharespuesta", "respuestaequipo")
+SELECT
+    %(prefijo)s || '_' || LPAD(CAST(contador.ultimo AS TEXT), GREATEST(5, LENGTH(CAST(contador.ultimo AS TEXT))), '0'),
+    %(usuario)s,
+    %(nomusuario)s,
+    %(nombeneficiario)s,
+    %(tipogasto)s,
+    %(monto)s,
+    'Pendiente',
+    %(fecharegistro)s,
+    NULL,
+    'En revisión por el área de Reembolsos'
+FROM contador
+RETURNING {columnas}
+""".format(columnas=COLUMNAS_SOLICITUD)
+
+# El filtro por usuario es opcional (modo Administrador): una sola sentencia cubre ambos casos
+QUERY_OBTENER = f"""
+SELECT {COLUMNAS_SOLICITUD}
+FROM reembolsos
+WHERE "n_solicitud" = %(n_solicitud)s
+  AND (%(usuario)s::text IS NULL OR "usuario" = %(usuario)s::text)
+"""
+
+# Listado por usuario con paginación por cursor (keyset) sobre los índices de la migración
+# 003_listado_y_resumen_reembolsos.sql: cada variante es una sentencia aparte para que el plan
+# genérico de la sentencia preparada use el rango del índice (un filtro opcional con IS NULL no lo haría).
+def _query_listar(con_estado: bool, con_cursor: bool) -> str:
+    condiciones = ['"usuario" = %(usuario)s']
+    if con_estado:
+        condiciones.append("estado = %(estado)s")
+    if con_cursor:
+        condiciones.append('(fecharegistro, "n_solicitud") < (%(fecha_cursor)s, %(n_solicitud_cursor)s)')
+    return f"""
+SELECT {COLUMNAS_SOLICITUD}
+FROM reembolsos
+WHERE {" AND ".join(condiciones)}
+ORDER BY fecharegistro DESC, "n_solicitud" DESC
+LIMIT %(limite)s
+"""
+
+QUERIES_LISTAR = {
+    (con_estado, con_cursor): _query_listar(con_estado, con_cursor)
+    for con_estado in (False, True) for con_cursor in (False, True)
+}
+
+# Agregados mantenidos por triggers (migración 003): lectura de unas pocas filas, sin recorrer reembolsos
+QUERY_RESUMEN_USUARIO = """
+SELECT estado, tipogasto, cantidad, monto_total
+FROM resumen_reembolsos_usuario
+WHERE usuario = %(usuario)s AND cantidad > 0
+ORDER BY estado, tipogasto
+"""
+
+QUERY_RESUMEN_GLOBAL = """
+SELECT estado, tipogasto, cantidad, monto_total
+FROM resumen_reembolsos
+WHERE cantidad > 0
+ORDER BY estado, tipogasto
+"""
+
+# UPDATE ... RETURNING: una sola ida y vuelta informa si la fila existía y sus valores nuevos
+QUERY_ACTUALIZAR = f"""
+UPDATE reembolsos
+SET estado = %(estado)s,
+    respuestaequipo = %(respuesta)s,
+    fecharespuesta = %(fecharespuesta)s
+WHERE "n_solicitud" = %(n_solicitud)s
+RETURNING {COLUMNAS_SOLICITUD}
+"""
+
+# Actualización masiva: los filtros nulos no se aplican (se exige al menos uno en el repositorio)
+QUERY_ACTUALIZAR_MASIVO = f"""
+UPDATE reembolsos
+SET estado = %(estado)s,
+    respuestaequipo = %(respuesta)s,
+    fecharespuesta = %(fecharespuesta)s
+WHERE (%(codigos)s::text[] IS NULL OR "n_solicitud" = ANY(%(codigos)s::text[]))
+  AND (%(estado_actual)s::text IS NULL OR estado = %(estado_actual)s::text)
+  AND (%(prefijo)s::text IS NULL OR "n_solicitud" LIKE %(prefijo)s::text || '\\_%%')
+RETURNING {COLUMNAS_SOLICITUD}
+"""
+
+
+def codificar_cursor(solicitud: Solicitud) -> str:
+    """Cursor opaco para pedir la página siguiente a partir de la última solicitud devuelta."""
+    texto = f"{solicitud.fecharegistro.isoformat()}|{solicitud.n_solicitud}"
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime.date, str]:
+    """Lanza ValueError si el cursor no fue generado por codificar_cursor."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        fecha, n_solicitud = texto.split("|", 1)
+        return datetime.date.fromisoformat(fecha), n_solicitud
+    except Exception:
+        raise ValueError("Cursor de paginación no válido.")
+
+
+@dataclass
+class ResumenSolicitudes:
+    estado: str
+    tipogasto: str
+    cantidad: int
+    monto_total: float
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {**self.__dict__, "monto_total": float(self.monto_total)}
+
+
+class LimiteActualizacionExcedido(Exception):
+    """La actualización masiva afectaría más filas de las permitidas; no se aplicó ningún cambio."""
+
+
+def crear_cache_solicitudes() -> Optional[CacheLRU]:
+    """Caché de filas por n_solicitud (CACHE_SOLICITUDES=false la desactiva)."""
+    if os.environ.get("CACHE_SOLICITUDES", "true").lower() != "true":
+        return None
+    return CacheLRU(
+        tamano_maximo=int(os.environ.get("CACHE_SOLICITUDES_TAMANO", "1000")),
+        ttl_s=float(os.environ.get("CACHE_SOLICITUDES_TTL_S", "30")),
+    )
+
+
+class RepositorioReembolsos:
+    """
+    Consultas de la tabla reembolsos sobre un ConnectionPool compartido. Es seguro entre hilos.
+
+    Con `cache`, `obtener` es de lectura directa: la fila se guarda por n_solicitud y el control de
+    dueño se aplica sobre la fila cacheada. Las escrituras del propio repositorio invalidan o
+    refrescan la entrada; los cambios hechos por otros sistemas llegan por LISTEN/NOTIFY
+    (`iniciar_escucha`) o, como máximo, tras el TTL.
+    """
+
+    def __init__(self, pool: ConnectionPool, cache: Optional[CacheLRU] = None):
+        self.pool = pool
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.adquisiciones = 0
+        self.espera_total_s = 0.0
+        self.espera_maxima_s = 0.0
+        # Se incrementa en cada invalidación: una lectura que empezó antes no puede guardar una fila vieja
+        self._generacion = 0
+        self.notificaciones = 0
+        self._escucha = None
+
+    @contextmanager
+    def _conexion(self):
+        """Toma una conexión del pool midiendo cuánto se esperó por ella."""
+        inicio = time.perf_counter()
+        with self.pool.connection() as conn:
+            espera = time.perf_counter() - inicio
+            with self._lock:
+                self.adquisiciones += 1
+                self.espera_total_s += espera
+                self.espera_maxima_s = max(self.espera_maxima_s, espera)
+            yield conn
+
+    # --- Caché de filas --- #
+    def invalidar(self, n_solicitud: str):
+        if self.cache is None:
+            return
+        with self._lock:
+            self._generacion += 1
+            self.cache.invalidar(n_solicitud)
+
+    def _guardar_en_cache(self, solicitud: Solicitud, generacion: int):
+        with self._lock:
+            if generacion == self._generacion:
+                self.cache.guardar(solicitud.n_solicitud, solicitud)
+
+    # --- Consultas --- #
+    def registrar(self, usuario: str, nomusuario: str, nombeneficiario: str, tipogasto: str,
+                  prefijo: str, monto: float, fecharegistro: datetime.date) -> Solicitud:
+        """Asigna el código y registra la solicitud. Devuelve la fila creada (y la deja en caché)."""
+        with self._conexion() as conn:
+            with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                cur.execute(QUERY_REGISTRAR, {
+                    "prefijo": prefijo,
+                    "usuario": usuario,
+                    "nomusuario": nomusuario,
+                    "nombeneficiario": nombeneficiario,
+                    "tipogasto": tipogasto,
+                    "monto": monto,
+                    "fecharegistro": fecharegistro,
+                }, prepare=True)
+                solicitud = cur.fetchone()
+        if self.cache is not None:
+            self.cache.guardar(solicitud.n_solicitud, solicitud)
+        return solicitud
+
+    def obtener(self, n_solicitud: str, usuario: str = None) -> Optional[Solicitud]:
+        """Solicitud por número; si se indica `usuario`, solo si le pertenece."""
+        if self.cache is None:
+            with self._conexion() as conn:
+                with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                    cur.execute(QUERY_OBTENER, {"n_solicitud": n_solicitud, "usuario": usuario}, prepare=True)
+                    return cur.fetchone()
+
+        solicitud = self.cache.obtener(n_solicitud)
+        if solicitud is None:
+            # Se lee sin filtro de usuario para que la misma entrada sirva a cualquier consulta
+            with self._lock:
+                generacion = self._generacion
+            with self._conexion() as conn:
+                with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                    cur.execute(QUERY_OBTENER, {"n_solicitud": n_solicitud, "usuario": None}, prepare=True)
+                    solicitud = cur.fetchone()
+            if solicitud is None:
+                return None
+            self._guardar_en_cache(solicitud, generacion)
+
+        if usuario is not None and solicitud.usuario != usuario:
+            return None
+        return solicitud
+
+    def listar_por_usuario(self, usuario: str, limite: int = 20, estado: str = None,
+                           cursor: str = None) -> Tuple[List[Solicitud], Optional[str]]:
+        """
+        Página de solicitudes del usuario, de la más reciente a la más antigua (sin pasar por la caché).
+        Devuelve (solicitudes, cursor de la página siguiente o None si no hay más).
+        """
+        parametros = {"usuario": usuario, "estado": estado, "limite": limite + 1}
+        if cursor:
+            parametros["fecha_cursor"], parametros["n_solicitud_cursor"] = decodificar_cursor(cursor)
+        with self._conexion() as conn:
+            with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                cur.execute(QUERIES_LISTAR[(bool(estado), bool(cursor))], parametros, prepare=True)
+                solicitudes = cur.fetchall()
+        # Se pide una fila de más para saber si hay otra página
+        if len(solicitudes) > limite:
+            solicitudes = solicitudes[:limite]
+            return solicitudes, codificar_cursor(solicitudes[-1])
+        return solicitudes, None
+
+    def resumen(self, usuario: str = None) -> List[ResumenSolicitudes]:
+        """Cantidad y monto por estado y tipo de gasto, de un usuario o de todos (agregados de la migración 003)."""
+        with self._conexion() as conn:
+            with conn.cursor(row_factory=class_row(ResumenSolicitudes)) as cur:
+                if usuario is None:
+                    cur.execute(QUERY_RESUMEN_GLOBAL, prepare=True)
+                else:
+                    cur.execute(QUERY_RESUMEN_USUARIO, {"usuario": usuario}, prepare=True)
+                return cur.fetchall()
+
+    def actualizar_estado(self, n_solicitud: str, estado: str, respuesta: str,
+                          fecharespuesta: datetime.date) -> Optional[Solicitud]:
+        """Actualiza estado y respuesta del equipo. Devuelve la fila actualizada, o None si no existe."""
+        try:
+            with self._conexion() as conn:
+                with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                    cur.execute(QUERY_ACTUALIZAR, {
+                        "n_solicitud": n_solicitud,
+                        "estado": estado,
+                        "respuesta": respuesta,
+                        "fecharespuesta": fecharespuesta,
+                    }, prepare=True)
+                    return cur.fetchone()
+        finally:
+            # También si falló: no se sabe si el cambio llegó a confirmarse
+            self.invalidar(n_solicitud)
+
+    def actualizar_estado_masivo(self, estado: str, respuesta: str, fecharespuesta: datetime.date,
+                                 codigos: List[str] = None, estado_actual: str = None, prefijo: str = None,
+                                 maximo: int = None) -> List[Solicitud]:
+        """
+        Actualiza en una sola transacción todas las solicitudes que cumplen los filtros (se combinan con AND).
+        Si afectaría más de `maximo` filas se revierte y se lanza LimiteActualizacionExcedido.
+        """
+        if not (codigos or estado_actual or prefijo):
+            raise ValueError("Indique al menos un filtro: códigos, estado actual o prefijo.")
+        maximo = maximo or int(os.environ.get("ACTUALIZACION_MASIVA_MAXIMO", "500"))
+
+        actualizadas = []
+        try:
+            with self._conexion() as conn:
+                with conn.transaction():
+                    with conn.cursor(row_factory=class_row(Solicitud)) as cur:
+                        cur.execute(QUERY_ACTUALIZAR_MASIVO, {
+                            "estado": estado,
+                            "respuesta": respuesta,
+                            "fecharespuesta": fecharespuesta,
+                            "codigos": list(codigos) if codigos else None,
+                            "estado_actual": estado_actual,
+                            "prefijo": prefijo,
+                        }, prepare=True)
+                        actualizadas = cur.fetchall()
+                    if len(actualizadas) > maximo:
+                        raise LimiteActualizacionExcedido(
+                            f"La actualización afectaría {len(actualizadas)} solicitudes (máximo {maximo}).")
+            return actualizadas
+        finally:
+            if self.cache is not None:
+                for codigo in (codigos or []):
+                    self.invalidar(codigo)
+                for solicitud in actualizadas:
+                    self.invalidar(solicitud.n_solicitud)
+
+    # --- Invalidación entre instancias --- #
+    def iniciar_escucha(self, conninfo: str, reintento_s: float = 5.0):
+        """
+        Escucha el canal CANAL_CAMBIOS en un hilo de fondo con una conexión dedicada (fuera del pool)
+        e invalida las solicitudes notificadas. Si la conexión se pierde, se vacía la caché y se reconecta.
+        """
+        if self.cache is None or self._escucha is not None:
+            return
+
+        def escuchar():
+            while True:
+                try:
+                    with psycopg.connect(conninfo, autocommit=True) as conn:
+                        conn.execute(f"LISTEN {CANAL_CAMBIOS}")
+                        for notificacion in conn.notifies():
+                            with self._lock:
+                                self.notificaciones += 1
+                            self.invalidar(notificacion.payload)
+                except Exception as e:
+                    print(f"ADVERTENCIA: Se perdió la escucha de cambios de reembolsos. Detalle: {e}")
+                # Mientras no se escucha pudieron perderse avisos
+                with self._lock:
+                    self._generacion += 1
+                    self.cache.limpiar()
+                time.sleep(reintento_s)
+
+        self._escucha = threading.Thread(target=escuchar, name="escucha_reembolsos", daemon=True)
+        self._escucha.start()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Espera por conexión del repositorio, caché de solicitudes y estadísticas del pool (incluye al checkpointer)."""
+        with self._lock:
+            repositorio = {
+                "adquisiciones": self.adquisiciones,
+                "espera_media_ms": round(1000 * self.espera_total_s / self.adquisiciones, 3) if self.adquisiciones else None,
+                "espera_maxima_ms": round(1000 * self.espera_maxima_s, 3),
+            }
+        cache = None
+        if self.cache is not None:
+            cache = dict(self.cache.estadisticas(), notificaciones=self.notificaciones,
+                         escucha_activa=self._escucha is not None and self._escucha.is_alive())
+        return {"repositorio": repositorio, "cache_solicitudes": cache, "pool": self.pool.get_stats()}